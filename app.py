@@ -4,7 +4,7 @@ import sys
 from collections import defaultdict
 import os
 import pytesseract
-from pdf2image import convert_from_path
+from scripts.pdf_pages import iter_pdf_pages
 from scripts.find_location import find_keyword_locations, get_coords
 import pandas as pd
 
@@ -13,18 +13,18 @@ nlp = spacy.load("en_core_web_trf")
 
 
 
-def ocr(folderpath: str, pdfname: str):
-    print(f"OCR on folder: {folderpath}")
+def ocr(filepath: str, pdfname: str):
+    print(f"OCR on pdf: {filepath}")
     if not os.path.exists("text/" + pdfname):
         os.makedirs("text/" + pdfname)
     else:
         return
-    for filename in os.listdir(folderpath):
-        if filename.endswith(".jpg"):
-            print(f"Performing OCR on: {filename}")
-            page_text = pytesseract.image_to_string(os.path.join(folderpath, filename))
-            with open(f"text/{pdfname}/{os.path.splitext(os.path.basename(filename))[0]}.txt", "w") as f:
-                f.write(page_text)
+    # Each page goes to OCR as soon as it is rendered; only one is held in memory
+    for i, image in enumerate(iter_pdf_pages(filepath)):
+        print(f"Performing OCR on page: {i}")
+        page_text = pytesseract.image_to_string(image)
+        with open(f"text/{pdfname}/page{i}.txt", "w") as f:
+            f.write(page_text)
 
 
 def preprocess_text(text):
@@ -55,28 +55,12 @@ def group_paragraphs(preprocessed_paragraphs):
     return grouped_paragraphs
 
 
-def convert(filepath: str, img_destination_folder: str):
-    print(filepath)
-    filename = os.path.splitext(os.path.basename(filepath))[0]
-    print(f"Converting pdf: {filename}")
-    images = convert_from_path(filepath)
-
-    print(f"PDF converted: {filename} done")
-    for i in range(len(images)):
-        images[i].save(img_destination_folder + "/page" + str(i) + ".jpg", "JPEG")
-    print(f"Images saved to: {img_destination_folder}")
-    # clear memory after converting
-    del images
-
-
 def main(folder_path: str):
     # List of all pdf in this folder
     files = [f for f in os.listdir(folder_path) if f.endswith(".pdf")]
     # Iterate over each file
     if not os.path.exists("text"):
         os.makedirs("text")
-    if not os.path.exists("images"):
-        os.makedirs("images")
     if not os.path.exists("data"):
         os.makedirs("data")
     
@@ -84,12 +68,7 @@ def main(folder_path: str):
         filepath = os.path.join(folder_path, file)
         # create folder text/filename if not exists
         filename = os.path.splitext(file)[0]
-        img_destination_folder = "images/" + filename
-        if not os.path.exists("images/" + filename):
-            os.makedirs("images/" + filename)
-        # Convert pdf to images
-        convert(filepath, img_destination_folder)
-        ocr(img_destination_folder, pdfname=filename)
+        ocr(filepath, pdfname=filename)
         data = []
         for txtfile in os.listdir(f"text/{filename}"):
             ocrtext = ""
@@ -0,0 +1,233 @@
+"""
+End to end throughput benchmark for the analyse-article pipeline.
+
+Seeds synthetic articles into a scratch database, then drives
+ArticleProcessor.process_articles -> GeocodingService.batch_geocode ->
+MongoSession.update_articles_with_process_data against the local Gemini
+stand-in and reports articles/sec and batch latency percentiles:
+
+    python -m bench.benchmark --articles 500 --batch-size 10 --latency 1.5
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import urllib.request
+import uuid
+from datetime import datetime
+from time import perf_counter
+from typing import List, Dict, Any
+
+from src.logger import Logger
+from src.mongo import MongoSession
+from src.article_processor import ArticleRequest
+from src.geocode import GeocodingService
+from src.geocode_cache import GeocodeCache, LRUCache
+from src.processors import build_processor, BACKENDS, GEMINI_BACKEND
+from src.batch_sizing import AdaptiveBatchSizer
+from .mock_gemini import (
+    MockGeminiServer,
+    KNOWN_PLACES,
+    config_from_args,
+    parse_args as mock_args,
+)
+
+# The benchmark empties and drops its database, so only scratch names are accepted
+SCRATCH_PREFIXES = ("bench", "test")
+
+KEYWORDS = ["dengue", "malaria", "cholera", "measles", "influenza", "fever"]
+
+FILLER = [
+    "The municipal council met on Tuesday to discuss the new budget.",
+    "Traffic on the main highway was diverted because of road repairs.",
+    "Local traders said sales had picked up ahead of the festival season.",
+    "The weather department forecast light showers over the weekend.",
+    "Officials said the new bridge would open to the public next month.",
+    "Schools in the district will remain open as per the usual schedule.",
+    "Residents complained about irregular water supply in several wards.",
+]
+
+
+class BenchContext:
+    """Minimal stand-in for the Appwrite function context."""
+
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def error(self, message):
+        print(message, file=sys.stderr)
+
+
+def make_article(rng: random.Random, paragraphs: int) -> str:
+    """Build a newspaper-like article with one outbreak paragraph buried in filler."""
+    keyword = rng.choice(KEYWORDS)
+    place = rng.choice(KNOWN_PLACES)
+    outbreak = (
+        f"Health officials in {place} confirmed {rng.randint(2, 400)} new cases "
+        f"of {keyword} this week and urged residents to take precautions."
+    )
+    body = [" ".join(rng.sample(FILLER, 4)) for _ in range(paragraphs)]
+    body.insert(rng.randint(0, len(body)), outbreak)
+    return f"{place} sees rise in {keyword} cases\n\n" + "\n\n".join(body)
+
+
+def seed_articles(
+    mongo_client: MongoSession, count: int, paragraphs: int, seed: int
+) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    articles = [
+        {
+            "title": f"Benchmark article {i}",
+            "sourceId": "benchmark",
+            "categoryId": "benchmark",
+            "url": f"https://bench.local/article/{i}",
+            "content": make_article(rng, paragraphs),
+            "status": "data_extracted",
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        for i in range(count)
+    ]
+    mongo_client.articles_collection.insert_many(articles)
+    return articles
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def fetch_stats(url: str) -> Dict[str, Any]:
+    with urllib.request.urlopen(f"{url}/stats") as response:
+        return json.loads(response.read())
+
+
+def run(args) -> Dict[str, Any]:
+    server = MockGeminiServer(config=config_from_args(args)).start()
+    context = BenchContext(args.verbose)
+    logger = Logger(context)
+    mongo_client = MongoSession(context, args.mongo_uri, database_name=args.database)
+
+    try:
+        mongo_client.articles_collection.delete_many({})
+        articles = seed_articles(
+            mongo_client, args.articles, args.paragraphs, args.seed or 0
+        )
+
+        # ArticleProcessor picks the stand-in endpoint up from the environment
+        os.environ["GEMINI_API_ENDPOINT"] = server.url
+        processor = build_processor(args.backend, context, logger, "benchmark")
+        processor.set_keywords(KEYWORDS)
+        # A fresh in-process tier so runs do not warm each other up
+        geocode_cache = GeocodeCache(
+            mongo_client.geocode_cache_collection, memory=LRUCache()
+        )
+        geocode_service = GeocodingService(
+            "benchmark", base_url=server.url, cache=geocode_cache
+        )
+
+        batch_sizer = (
+            AdaptiveBatchSizer("benchmark", initial_size=args.batch_size)
+            if args.adaptive
+            else None
+        )
+        stage_times = {"analyse": [], "geocode": [], "write": []}
+        batch_latencies = []
+        failed = 0
+        start = perf_counter()
+        i = 0
+        while i < len(articles):
+            size = batch_sizer.size if batch_sizer else args.batch_size
+            batch = articles[i : i + size]
+            i += size
+            requests = [
+                ArticleRequest(article_id=str(a["_id"]), content=a["content"])
+                for a in batch
+            ]
+
+            t0 = perf_counter()
+            results = processor.process_articles(requests)
+            t1 = perf_counter()
+            geo_processed = geocode_service.batch_geocode(results["results"])
+            t2 = perf_counter()
+            mongo_client.update_articles_with_process_data(geo_processed)
+            t3 = perf_counter()
+
+            if batch_sizer and processor.last_batch_stats:
+                batch_sizer.record(processor.last_batch_stats)
+            failed += len(results["failed_articles"])
+            stage_times["analyse"].append(t1 - t0)
+            stage_times["geocode"].append(t2 - t1)
+            stage_times["write"].append(t3 - t2)
+            batch_latencies.append(t3 - t0)
+        elapsed = perf_counter() - start
+
+        stats = fetch_stats(server.url)
+        return {
+            "articles": len(articles),
+            "batches": len(batch_latencies),
+            "failed_articles": failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "articles_per_second": round(len(articles) / elapsed, 2),
+            "batch_latency_p50": round(percentile(batch_latencies, 50), 3),
+            "batch_latency_p95": round(percentile(batch_latencies, 95), 3),
+            "stage_mean_seconds": {
+                stage: round(statistics.fmean(times), 3) if times else 0.0
+                for stage, times in stage_times.items()
+            },
+            "tokens_per_article": round(
+                stats["total_tokens"] / max(len(articles), 1), 1
+            ),
+            "learned_batch_size": batch_sizer.optimum if batch_sizer else None,
+            "mock": stats,
+        }
+    finally:
+        if not args.keep_data:
+            mongo_client.client.drop_database(args.database)
+        mongo_client.client.close()
+        server.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mongo-uri", default="mongodb://127.0.0.1:27017/")
+    parser.add_argument(
+        "--database",
+        help="Scratch database, must start with bench or test; "
+        "defaults to a new bench-<id> database per run",
+    )
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--backend", choices=BACKENDS, default=GEMINI_BACKEND)
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    # Everything else configures the stand-in server
+    args, rest = parser.parse_known_args(argv)
+    if args.database is None:
+        args.database = f"bench-{uuid.uuid4().hex[:8]}"
+    elif not args.database.lower().startswith(SCRATCH_PREFIXES):
+        parser.error(
+            f"refusing to wipe database {args.database!r}: "
+            f"its name must start with one of {', '.join(SCRATCH_PREFIXES)}"
+        )
+    mock = mock_args(rest)
+    for key, value in vars(mock).items():
+        setattr(args, key, value)
+    return args
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(parse_args()), indent=2))
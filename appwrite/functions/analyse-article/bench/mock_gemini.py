@@ -0,0 +1,333 @@
+"""
+Local stand-in for the Gemini generateContent endpoint and the Mapbox geocoding API.
+
+Lets the analyse-article pipeline be load tested without spending real quota:
+
+    python -m bench.mock_gemini --port 8089 --latency 1.5 --error-rate 0.05
+
+Point ArticleProcessor at it with GEMINI_API_ENDPOINT=http://127.0.0.1:8089 and
+GeocodingService with base_url="http://127.0.0.1:8089".
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse, unquote
+
+ARTICLE_MARKER = re.compile(r"-+Article Count: (\d+)-+")
+KEYWORD_LINE = re.compile(r"symptom: (.*?)\.\s*\n")
+NUMBER = re.compile(r"\b(\d{1,6})\b")
+
+# Places the synthetic benchmark articles are written about
+KNOWN_PLACES = [
+    "Delhi",
+    "Mumbai",
+    "Kolkata",
+    "Chennai",
+    "Bengaluru",
+    "Pune",
+    "California",
+    "Texas",
+    "London",
+    "Nairobi",
+    "Lagos",
+    "Jakarta",
+]
+
+
+def count_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of the stand-in server."""
+
+    latency: float = 1.0  # mean seconds per generateContent call
+    latency_jitter: float = 0.25  # +/- fraction of latency
+    latency_per_1k_tokens: float = 0.0  # extra seconds per 1000 prompt tokens
+    error_rate: float = 0.0  # fraction of calls answered with HTTP 500
+    quota_error_rate: float = 0.0  # fraction of calls answered with HTTP 429
+    malformed_rate: float = 0.0  # fraction of calls returning truncated JSON
+    omission_rate: float = 0.0  # fraction of articles left out of a response
+    geocode_latency: float = 0.1  # seconds per geocoding call
+    seed: Optional[int] = None
+
+
+@dataclass
+class MockStats:
+    """Counters exposed on GET /stats."""
+
+    requests: int = 0
+    errors: int = 0
+    quota_errors: int = 0
+    malformed: int = 0
+    omitted_articles: int = 0
+    articles: int = 0
+    prompt_tokens: int = 0
+    candidate_tokens: int = 0
+    geocode_requests: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            data = {
+                f.name: getattr(self, f.name) for f in fields(self) if f.name != "lock"
+            }
+        data["total_tokens"] = data["prompt_tokens"] + data["candidate_tokens"]
+        return data
+
+
+def split_articles(prompt: str) -> Dict[int, str]:
+    """Split a batch prompt back into {article_count: article text}."""
+    body = prompt.split("Instructions:", 1)[0]
+    parts = ARTICLE_MARKER.split(body)
+    # parts = [preamble, count, text, count, text, ...]
+    return {int(parts[i]): parts[i + 1] for i in range(1, len(parts) - 1, 2)}
+
+
+def analyse_text(text: str, keywords: List[str]) -> List[Dict[str, Any]]:
+    """Cheap deterministic imitation of what the model would extract."""
+    lowered = text.lower()
+    location = next((p for p in KNOWN_PLACES if p in text), "unknown")
+    numbers = NUMBER.findall(text)
+    return [
+        {
+            "keyword": keyword,
+            "location": location,
+            "case_count": int(numbers[0]) if numbers else 1,
+        }
+        for keyword in keywords
+        if keyword.lower() in lowered
+    ]
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    server_version = "MockGemini/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Any):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/stats":
+            return self._send_json(200, self.server.stats.to_dict())
+        if path.startswith("/geocoding/v5/mapbox.places/"):
+            return self._geocode(path)
+        self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == "/stats/reset":
+            self.server.stats = MockStats()
+            return self._send_json(200, {})
+        if not path.endswith(":generateContent"):
+            return self._send_json(
+                404, {"error": {"code": 404, "message": "Not found"}}
+            )
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        prompt = "".join(
+            part.get("text", "")
+            for content in request.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        self._generate_content(prompt)
+
+    def _generate_content(self, prompt: str):
+        config: MockConfig = self.server.config
+        stats: MockStats = self.server.stats
+        rng: random.Random = self.server.rng
+        prompt_tokens = count_tokens(prompt)
+
+        delay = config.latency + config.latency_per_1k_tokens * prompt_tokens / 1000
+        delay *= 1 + rng.uniform(-config.latency_jitter, config.latency_jitter)
+        time.sleep(max(delay, 0))
+
+        roll = rng.random()
+        with stats.lock:
+            stats.requests += 1
+            stats.prompt_tokens += prompt_tokens
+
+        if roll < config.quota_error_rate:
+            with stats.lock:
+                stats.quota_errors += 1
+            return self._send_json(
+                429,
+                {
+                    "error": {
+                        "code": 429,
+                        "message": "Resource has been exhausted (e.g. check quota).",
+                        "status": "RESOURCE_EXHAUSTED",
+                    }
+                },
+            )
+        if roll < config.quota_error_rate + config.error_rate:
+            with stats.lock:
+                stats.errors += 1
+            return self._send_json(
+                500,
+                {
+                    "error": {
+                        "code": 500,
+                        "message": "An internal error has occurred.",
+                        "status": "INTERNAL",
+                    }
+                },
+            )
+
+        keyword_match = KEYWORD_LINE.search(prompt)
+        keywords = (
+            [k.strip() for k in keyword_match.group(1).split(",") if k.strip()]
+            if keyword_match
+            else []
+        )
+        articles = split_articles(prompt)
+        results = []
+        for count, text in articles.items():
+            if rng.random() < config.omission_rate:
+                with stats.lock:
+                    stats.omitted_articles += 1
+                continue
+            results.append(
+                {
+                    "article_count": count,
+                    "is_valid_article": len(text.split()) > 20,
+                    "data": analyse_text(text, keywords),
+                }
+            )
+
+        text = json.dumps(results)
+        if rng.random() < config.malformed_rate:
+            text = text[: max(len(text) // 2, 1)]
+            with stats.lock:
+                stats.malformed += 1
+
+        candidate_tokens = count_tokens(text)
+        with stats.lock:
+            stats.articles += len(articles)
+            stats.candidate_tokens += candidate_tokens
+
+        self._send_json(
+            200,
+            {
+                "candidates": [
+                    {
+                        "content": {"parts": [{"text": text}], "role": "model"},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }
+                ],
+                "usageMetadata": {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": candidate_tokens,
+                    "totalTokenCount": prompt_tokens + candidate_tokens,
+                },
+            },
+        )
+
+    def _geocode(self, path: str):
+        time.sleep(self.server.config.geocode_latency)
+        with self.server.stats.lock:
+            self.server.stats.geocode_requests += 1
+
+        location = unquote(path.rsplit("/", 1)[-1][: -len(".json")])
+        digest = hashlib.md5(location.lower().encode()).digest()
+        # Deterministic pseudo coordinates so repeated runs agree
+        longitude = digest[0] / 255 * 360 - 180
+        latitude = digest[1] / 255 * 170 - 85
+        self._send_json(
+            200,
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {"place_name": location, "center": [longitude, latitude]}
+                ],
+            },
+        )
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the mock configuration and counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), config: MockConfig = None):
+        super().__init__(address, MockGeminiHandler)
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self.rng = random.Random(self.config.seed)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGeminiServer":
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.25)
+    parser.add_argument("--latency-per-1k-tokens", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--quota-error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--omission-rate", type=float, default=0.0)
+    parser.add_argument("--geocode-latency", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        latency_per_1k_tokens=args.latency_per_1k_tokens,
+        error_rate=args.error_rate,
+        quota_error_rate=args.quota_error_rate,
+        malformed_rate=args.malformed_rate,
+        omission_rate=args.omission_rate,
+        geocode_latency=args.geocode_latency,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = MockGeminiServer((args.host, args.port), config_from_args(args))
+    print(f"Mock Gemini listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -1,10 +1,29 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import json
-from typing import List, Dict, Any
+import os
+from time import perf_counter, sleep
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional
 from .logger import Logger
+from .context_window import ContextCompressor, Excerpt
 from pydantic import BaseModel
 
 
+DEFAULT_MODEL_NAME = "gemini-2.0-flash-lite"
+
+# Gemini errors worth retrying; anything else fails the batch at once.
+# Backoff is kept short: the function itself times out after 15 seconds
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 2))
+RETRY_BASE_DELAY = float(os.environ.get("GEMINI_RETRY_BASE_DELAY", 1.0))
+
+
 class DiseaseAnalysis(BaseModel):
     """Data model for disease outbreak information extracted from articles."""
 
@@ -26,6 +45,10 @@ class ArticleRequest(BaseModel):
     article_id: str
     content: str
     count: int = -1
+    title: str = ""
+    # Compressed text sent to the model instead of content, with its source offsets
+    context: Optional[str] = None
+    excerpts: list[Excerpt] = []
 
 
 class ArticleResponse(BaseModel):
@@ -34,6 +57,17 @@ class ArticleResponse(BaseModel):
     article_id: str
     is_valid_article: bool
     data: list[DiseaseAnalysis]
+    excerpts: list[Excerpt] = []
+
+
+class BatchStats(BaseModel):
+    """Observed behaviour of a single model call, used for batch size tuning."""
+
+    size: int
+    latency: float
+    validation_failed: bool = False
+    error: bool = False
+    omitted: int = 0
 
 
 class BatchResponseSchema(BaseModel):
@@ -72,7 +106,43 @@ class ProcessingResult:
         return {"results": self.results, "failed_articles": self.failed_articles}
 
 
-class ArticleProcessor:
+class BaseArticleProcessor(ABC):
+    """Common interface for analyzer backends that turn articles into ArticleResponses."""
+
+    def __init__(self, context: Any, logger: Logger):
+        self.context = context
+        self.logger = logger
+        self.keywords: List[str] = []
+        # Stats of the most recent model call, None for backends without one
+        self.last_batch_stats: Optional[BatchStats] = None
+
+    def set_keywords(self, keywords: List[str]) -> None:
+        """
+        Set the disease keywords to look for in articles.
+
+        Args:
+            keywords: List of disease names to search for
+        """
+        if not keywords or not all(isinstance(k, str) for k in keywords):
+            raise ValueError("Keywords must be a non-empty list of strings")
+
+        self.keywords = keywords
+        self.logger.info(f"Set {len(keywords)} keywords for disease monitoring")
+
+    @abstractmethod
+    def process_articles(self, articles: List[ArticleRequest]) -> Dict[str, Any]:
+        """
+        Analyze a batch of articles.
+
+        Args:
+            articles: List of articles to process
+
+        Returns:
+            Dictionary with "results" (List[ArticleResponse]) and "failed_articles"
+        """
+
+
+class ArticleProcessor(BaseArticleProcessor):
     """Processes news articles to extract disease outbreak information using Gemini API."""
 
     def __init__(
@@ -80,7 +150,9 @@ class ArticleProcessor:
         context: Any,
         logger: Logger,
         api_key: str,
-        model_name: str = "gemini-2.0-flash-lite",
+        model_name: str = DEFAULT_MODEL_NAME,
+        api_endpoint: Optional[str] = None,
+        context_compressor: Optional[ContextCompressor] = None,
     ):
         """
         Initialize the ArticleProcessor with API credentials and configuration.
@@ -90,12 +162,18 @@ class ArticleProcessor:
             logger: Logger instance for recording execution information
             api_key: Gemini API key
             model_name: Name of the Gemini model to use
+            api_endpoint: Alternative Gemini endpoint (e.g. a local stand-in server),
+                defaults to $GEMINI_API_ENDPOINT
+            context_compressor: When set, only keyword-relevant excerpts of each
+                article are sent to the model
         """
-        self.context = context
-        self.logger = logger
+        super().__init__(context, logger)
         self.api_key = api_key
         self.model_name = model_name
-        self.keywords: List[str] = []
+        self.api_endpoint = api_endpoint or os.environ.get("GEMINI_API_ENDPOINT")
+        self.context_compressor = context_compressor
+        # Set once Gemini reports that the quota is exhausted
+        self.quota_exhausted = False
 
         # Configure Gemini
         self._setup_gemini()
@@ -103,7 +181,15 @@ class ArticleProcessor:
     def _setup_gemini(self):
         """Configure Gemini API with simplified response schema."""
         try:
-            genai.configure(api_key=self.api_key)
+            if self.api_endpoint:
+                # The REST transport accepts plain http endpoints
+                genai.configure(
+                    api_key=self.api_key,
+                    transport="rest",
+                    client_options={"api_endpoint": self.api_endpoint},
+                )
+            else:
+                genai.configure(api_key=self.api_key)
 
             # Using basic schema definition compatible with Gemini
             response_schema = {
@@ -142,19 +228,6 @@ class ArticleProcessor:
             self.logger.error(f"Failed to configure Gemini: {e}")
             raise RuntimeError(f"Failed to initialize Gemini client: {e}")
 
-    def set_keywords(self, keywords: List[str]) -> None:
-        """
-        Set the disease keywords to look for in articles.
-
-        Args:
-            keywords: List of disease names to search for
-        """
-        if not keywords or not all(isinstance(k, str) for k in keywords):
-            raise ValueError("Keywords must be a non-empty list of strings")
-
-        self.keywords = keywords
-        self.logger.info(f"Set {len(keywords)} keywords for disease monitoring")
-
     def _create_batch_prompt(self, articles: List[ArticleRequest]) -> str:
         """
         Create a prompt for processing multiple articles.
@@ -169,7 +242,7 @@ class ArticleProcessor:
 
         articles_text = "\n\n".join(
             [
-                f"\n\n----------Article Count: {article.count}----------\n{article.content.strip()}\n\n\n"
+                f"\n\n----------Article Count: {article.count}----------\n{(article.context or article.content).strip()}\n\n\n"
                 for article in articles
             ]
         )
@@ -203,6 +276,26 @@ Format requirements:
 - If the article is invalid, still include it with an empty data array
 """
 
+    def _compress_articles(self, articles: List[ArticleRequest]) -> None:
+        """
+        Replace each article's prompt text with its keyword-relevant excerpts.
+
+        Args:
+            articles: Articles to compress in place
+        """
+        original_chars = compressed_chars = 0
+        for article in articles:
+            compressed = self.context_compressor.compress(
+                article.content, self.keywords, article.title
+            )
+            article.context = compressed.text
+            article.excerpts = compressed.excerpts
+            original_chars += compressed.original_length
+            compressed_chars += len(compressed.text)
+        self.logger.info(
+            f"Compressed {len(articles)} articles from {original_chars} to {compressed_chars} characters"
+        )
+
     def _validate_gemini_response(
         self, response_text: str, articles: list[ArticleRequest]
     ) -> List[ArticleResponse]:
@@ -277,10 +370,12 @@ Format requirements:
                         article_id=article.article_id,
                         is_valid_article=is_valid_article,
                         data=processed_data,
+                        excerpts=article.excerpts,
                     )
                 )
 
             # Add empty results for any articles not included in the response
+            self._last_omitted = len(article_lookup) - len(processed_articles)
             for idx, article in article_lookup.items():
                 if idx not in processed_articles:
                     self.logger.warning(
@@ -303,6 +398,25 @@ Format requirements:
             self.logger.error(f"Unexpected error validating response: {e}")
             return []
 
+    def _generate(self, prompt: str):
+        """Call Gemini, retrying transient errors with bounded exponential backoff."""
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return self.model.generate_content(
+                    prompt,
+                    generation_config=genai.GenerationConfig(
+                        response_mime_type="application/json",
+                    ),
+                )
+            except RETRYABLE_ERRORS as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = RETRY_BASE_DELAY * 2**attempt
+                self.logger.info(
+                    f"Gemini error ({type(e).__name__}), retrying in {delay:.1f}s"
+                )
+                sleep(delay)
+
     def process_articles(self, articles: List[ArticleRequest]) -> Dict[str, Any]:
         """
         Process all articles in a single batch.
@@ -321,22 +435,22 @@ Format requirements:
             raise ValueError("Keywords not set. Call set_keywords() first.")
 
         result = ProcessingResult()
+        stats = BatchStats(size=len(articles), latency=0.0)
+        self._last_omitted = 0
+        started = perf_counter()
 
         try:
             # Create prompt and send to Gemini
             for count, article in enumerate(articles):
                 self.logger.info(f"Processing article {str(article)}, count: {count}")
                 article.count = count
+            if self.context_compressor:
+                self._compress_articles(articles)
             prompt = self._create_batch_prompt(articles)
             self.logger.info(f"Sending batch of {len(articles)} articles to Gemini")
 
             # Use the simplified schema format
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.GenerationConfig(
-                    response_mime_type="application/json",
-                ),
-            )
+            response = self._generate(prompt)
 
             # Process successful response
             if response and hasattr(response, "text"):
@@ -345,6 +459,7 @@ Format requirements:
                     response.text, articles
                 )
 
+                stats.omitted = self._last_omitted
                 if article_results:
                     result.add_success(article_results)
                     self.logger.info(
@@ -352,18 +467,37 @@ Format requirements:
                     )
                 else:
                     # Response validation failed
+                    stats.validation_failed = True
                     result.add_failure(articles)
                     self.logger.error("Failed to validate Gemini response")
             else:
                 # Empty or invalid response
+                stats.validation_failed = True
                 result.add_failure(articles)
                 self.logger.error("Received empty or invalid response from Gemini")
 
+        except google_exceptions.ResourceExhausted as e:
+            self.quota_exhausted = True
+            stats.error = True
+            result.add_failure(articles)
+            self.logger.error(f"Gemini quota exhausted: {str(e)}")
+
+        except RETRYABLE_ERRORS as e:
+            stats.error = True
+            result.add_failure(articles)
+            self.logger.error(
+                f"Gemini unavailable after {MAX_RETRIES} retries: {str(e)}"
+            )
+
         except Exception as e:
             # Handle any exceptions during processing
+            stats.error = True
             result.add_failure(articles)
             self.logger.error(f"Error processing articles: {str(e)}")
 
+        stats.latency = perf_counter() - started
+        self.last_batch_stats = stats
+
         # Return results
         return result.to_dict()
 
@@ -0,0 +1,113 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+from .article_processor import BatchStats
+
+
+class AdaptiveBatchSizer:
+    """
+    Tunes how many articles are sent to the model per call.
+
+    The size grows by one article after every healthy call and shrinks
+    multiplicatively when a call is slow, returns JSON that fails validation or
+    leaves too many articles out of the response. Throughput (articles analysed
+    per second) is tracked per size, and the best size seen so far is the
+    learned optimum that is persisted per model and used as the next
+    execution's starting point.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        initial_size: int = 10,
+        min_size: int = 2,
+        max_size: int = 40,
+        target_latency: float = 8.0,
+        max_omission_rate: float = 0.1,
+        smoothing: float = 0.3,
+    ):
+        """
+        Args:
+            model_name: Model the learned sizes belong to
+            initial_size: Starting batch size when nothing was learned yet
+            min_size: Smallest batch size allowed
+            max_size: Largest batch size allowed
+            target_latency: Calls slower than this (seconds) shrink the batch
+            max_omission_rate: Fraction of articles missing from a response
+                above which the batch shrinks
+            smoothing: Weight of the newest observation in the throughput average
+        """
+        self.model_name = model_name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_omission_rate = max_omission_rate
+        self.smoothing = smoothing
+        self._size = self._clamp(initial_size)
+        # Smoothed articles/sec per batch size
+        self.throughput: Dict[int, float] = {}
+
+    def _clamp(self, size: float) -> int:
+        return int(min(max(round(size), self.min_size), self.max_size))
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def optimum(self) -> int:
+        """Batch size with the best observed throughput."""
+        if not self.throughput:
+            return self._size
+        return max(self.throughput, key=self.throughput.get)
+
+    def record(self, stats: BatchStats) -> int:
+        """
+        Update the batch size from one model call.
+
+        Args:
+            stats: Observed behaviour of the call
+
+        Returns:
+            The batch size to use for the next call
+        """
+        if stats.size <= 0:
+            return self._size
+
+        omission_rate = stats.omitted / stats.size
+        failed = stats.error or stats.validation_failed
+        analysed = 0 if failed else stats.size - stats.omitted
+        rate = analysed / stats.latency if stats.latency > 0 else 0.0
+        previous = self.throughput.get(stats.size)
+        self.throughput[stats.size] = (
+            rate
+            if previous is None
+            else self.smoothing * rate + (1 - self.smoothing) * previous
+        )
+
+        if stats.validation_failed or omission_rate > self.max_omission_rate:
+            self._size = self._clamp(stats.size * 0.5)
+        elif stats.error or stats.latency > self.target_latency:
+            self._size = self._clamp(stats.size * 0.75)
+        else:
+            self._size = self._clamp(stats.size + 1)
+        return self._size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "batchSize": self.optimum,
+            "throughputBySize": {str(k): v for k, v in self.throughput.items()},
+            "updatedAt": datetime.utcnow(),
+        }
+
+    @classmethod
+    def from_dict(
+        cls, model_name: str, data: Optional[Dict[str, Any]], **kwargs
+    ) -> "AdaptiveBatchSizer":
+        """Restore a sizer from what to_dict stored for this model."""
+        sizer = cls(model_name, **kwargs)
+        if data:
+            sizer.throughput = {
+                int(k): float(v) for k, v in data.get("throughputBySize", {}).items()
+            }
+            sizer._size = sizer._clamp(data.get("batchSize", sizer._size))
+        return sizer
@@ -0,0 +1,227 @@
+import re
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+
+# Sentence ends at ., ! or ? (plus closing quotes/brackets) followed by whitespace,
+# or at a line break. Decimals such as "3.5" are not split.
+SENTENCE_END = re.compile(r"[.!?][\"'”’)\]]*\s+|\n+")
+
+# Abbreviations that end in a period without ending the sentence
+ABBREVIATIONS = {"dr", "mr", "mrs", "ms", "prof", "st", "no", "gov", "govt", "dept"}
+
+NUMBER = re.compile(
+    r"\d|\b(?:one|two|three|four|five|six|seven|eight|nine|ten|dozens?|"
+    r"hundreds?|thousands?)\b",
+    re.IGNORECASE,
+)
+
+# "in Delhi", "across Kerala", "from New York"
+LOCATION = re.compile(r"\b(?:in|at|from|near|across|of)\s+[A-Z][\w'-]+")
+
+# "NEW DELHI, March 3 (Reuters) -" / "Mumbai:" at the start of the body
+DATELINE = re.compile(
+    r"^\s*[A-Z][A-Za-z .'-]{1,40}"
+    r"(?:,\s*[A-Z][a-z]{2,9}\.?\s+\d{1,2}(?:,\s*\d{4})?)?"
+    r"\s*(?:\([^)]{1,40}\))?\s*[:\-–—]\s"
+)
+
+# A sentence over the remaining budget is cut to fit unless less than this is left
+MIN_EXCERPT_CHARS = 200
+
+
+class Excerpt(BaseModel):
+    """A span of the original article that was sent to the model."""
+
+    start: int
+    end: int
+    kind: str  # "headline", "dateline" or "context"
+    text: str
+
+
+class CompressedArticle(BaseModel):
+    """Article text reduced to the parts relevant to the keywords."""
+
+    text: str
+    excerpts: List[Excerpt]
+    original_length: int
+
+
+class ContextCompressor:
+    """Keeps only the sentences around keyword, number and location mentions."""
+
+    def __init__(self, window: int = 1, reach: int = 2, max_chars: int = 2500):
+        """
+        Initialize the compressor.
+
+        Args:
+            window: Sentences kept unconditionally on each side of a keyword sentence
+            reach: Sentences further out that are kept if they mention a number or
+                a location
+            max_chars: Upper bound on the characters of context kept per article
+        """
+        self.window = window
+        self.reach = max(reach, window)
+        self.max_chars = max_chars
+
+    @staticmethod
+    def split_sentences(content: str) -> List[Tuple[int, int]]:
+        """Return (start, end) offsets of each sentence in content."""
+        spans = []
+        start = 0
+        for match in SENTENCE_END.finditer(content):
+            end = match.start() + len(match.group().rstrip())
+            words = content[start : match.start()].split()
+            if (
+                match.group()[0] == "."
+                and words
+                and words[-1].lower() in ABBREVIATIONS
+            ):
+                continue
+            if content[start:end].strip():
+                spans.append((start, end))
+            start = match.end()
+        if content[start:].strip():
+            spans.append((start, len(content.rstrip())))
+        # Trim leading whitespace so offsets point at the first character
+        return [
+            (s + len(content[s:e]) - len(content[s:e].lstrip()), e) for s, e in spans
+        ]
+
+    @staticmethod
+    def _keyword_pattern(keywords: List[str]) -> Optional[re.Pattern]:
+        terms = sorted(
+            {k.strip() for k in keywords if k.strip()}, key=len, reverse=True
+        )
+        if not terms:
+            return None
+        # Whole words only ("flu" must not match "fluid"), plurals included
+        return re.compile(
+            r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")(?:e?s)?\b",
+            re.IGNORECASE,
+        )
+
+    def _headline(self, content: str, title: str) -> List[Excerpt]:
+        if title:
+            return []
+        # Without a stored title the first line of the body is the headline
+        first_line = content.lstrip().split("\n", 1)[0].strip()
+        if not first_line:
+            return []
+        start = content.index(first_line)
+        return [
+            Excerpt(
+                start=start,
+                end=start + len(first_line),
+                kind="headline",
+                text=first_line,
+            )
+        ]
+
+    def _dateline(self, content: str, sentences: List[Tuple[int, int]], keep):
+        for i, (start, end) in enumerate(sentences[:3]):
+            match = DATELINE.match(content[start:end])
+            if not match:
+                continue
+            if i in keep:
+                # The whole sentence is sent already
+                return []
+            text = match.group().strip()
+            return [
+                Excerpt(start=start, end=start + len(text), kind="dateline", text=text)
+            ]
+        return []
+
+    @staticmethod
+    def _clip(
+        content: str, start: int, end: int, budget: int, pattern: Optional[re.Pattern]
+    ) -> Tuple[int, int]:
+        """Cut a sentence to budget characters, centred on its keyword if any."""
+        match = pattern.search(content, start, end) if pattern else None
+        if not match:
+            return start, start + budget
+        centre = (match.start() + match.end()) // 2
+        clipped = max(start, min(centre - budget // 2, end - budget))
+        return clipped, clipped + budget
+
+    def compress(
+        self, content: str, keywords: List[str], title: str = ""
+    ) -> CompressedArticle:
+        """
+        Reduce an article to the sentences that matter for the keywords.
+
+        Args:
+            content: Full article text
+            keywords: Disease keywords being searched for
+            title: Stored article headline, if any
+
+        Returns:
+            The compressed prompt text and the offsets of every excerpt kept
+        """
+        sentences = self.split_sentences(content)
+        pattern = self._keyword_pattern(keywords)
+        texts = [content[s:e] for s, e in sentences]
+
+        anchors = [
+            i for i, text in enumerate(texts) if pattern and pattern.search(text)
+        ]
+        keep = set()
+        if not anchors:
+            # Nothing to anchor on: send the leading text rather than just the
+            # headline, cut at max_chars below
+            keep = set(range(len(sentences)))
+        for i in anchors:
+            for j in range(i - self.reach, i + self.reach + 1):
+                if not 0 <= j < len(sentences) or j in keep:
+                    continue
+                if abs(j - i) <= self.window or (
+                    NUMBER.search(texts[j]) or LOCATION.search(texts[j])
+                ):
+                    keep.add(j)
+
+        headline = self._headline(content, title)
+        dateline = self._dateline(content, sentences, keep)
+        skip_until = max([e.end for e in headline], default=-1)
+
+        # Merge neighbouring sentences into contiguous excerpts
+        excerpts: List[Excerpt] = []
+        used = 0
+        for i in sorted(keep):
+            start, end = sentences[i]
+            if end <= skip_until:
+                continue
+            # Sentences next to each other are sent with the text between them
+            merge = bool(excerpts) and i - 1 in keep and excerpts[-1].end <= start
+            gap = start - excerpts[-1].end if merge else 0
+            clipped = used + gap + (end - start) > self.max_chars
+            if clipped:
+                # Long unpunctuated (e.g. OCR) sentences would otherwise leave
+                # the model with nothing at all
+                budget = self.max_chars - used - gap
+                if excerpts and budget < MIN_EXCERPT_CHARS:
+                    break
+                anchor = pattern if i in anchors else None
+                start, end = self._clip(content, start, end, budget, anchor)
+                if start != sentences[i][0]:
+                    merge, gap = False, 0
+            used += gap + end - start
+            if merge:
+                last = excerpts[-1]
+                last.end = end
+                last.text = content[last.start : end]
+            else:
+                excerpts.append(
+                    Excerpt(
+                        start=start, end=end, kind="context", text=content[start:end]
+                    )
+                )
+            if clipped:
+                break
+
+        excerpts = headline + dateline + excerpts
+        parts = [f"Headline: {title.strip()}"] if title.strip() else []
+        parts += [" ".join(e.text.split()) for e in excerpts]
+        return CompressedArticle(
+            text="\n[...]\n".join(parts),
+            excerpts=excerpts,
+            original_length=len(content),
+        )
@@ -1,7 +1,19 @@
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Union
 from pydantic import BaseModel
 from .article_processor import ArticleResponse
+from .context_window import Excerpt
+from .geocode_cache import GeocodeCache, MISS, normalize_location
+from .gazetteer import Gazetteer
 import requests
+from requests.adapters import HTTPAdapter
+
+MAPBOX_BASE_URL = "https://api.mapbox.com"
+
+# Requests per second allowed by each provider's free tier
+PROVIDER_RATE_LIMITS = {"mapbox": 10.0}
 
 
 class GeoDiseaseAnalysis(BaseModel):
@@ -20,6 +32,7 @@ class GeoProcessedArticle(BaseModel):
     article_id: str
     is_valid_article: bool
     data: List[GeoDiseaseAnalysis]
+    excerpts: List[Excerpt] = []
 
 
 class GeoLocation:
@@ -36,17 +49,106 @@ class GeoLocation:
         return {"latitude": self.latitude, "longitude": self.longitude}
 
 
+class RateLimiter:
+    """Thread-safe token bucket spacing out calls to a provider."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Calls allowed per second
+            burst: Calls allowed back to back after an idle period
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
 class GeocodingService:
     """Service for geocoding location names to coordinates."""
 
-    def __init__(self, api_key: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = MAPBOX_BASE_URL,
+        cache: Optional[GeocodeCache] = None,
+        gazetteer: Optional[Gazetteer] = None,
+        max_workers: int = 8,
+        timeout: Union[float, Tuple[float, float]] = (3.05, 5),
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
         """
         Initialize the geocoding service.
 
         Args:
             api_key: API key for the geocoding service (if required)
+            base_url: Geocoding API host, overridable for local benchmarking
+            cache: Cache consulted before any network call, in-process only when None
+            gazetteer: Offline index tried before the cache and the provider
+            max_workers: Provider requests in flight at once
+            timeout: Per-request (connect, read) timeout in seconds
+            rate_limiter: Throttle for provider requests, Mapbox's limit by default
         """
         self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache or GeocodeCache()
+        self.gazetteer = gazetteer
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter(
+            PROVIDER_RATE_LIMITS["mapbox"], burst=max_workers
+        )
+        # Pooled connections shared by the worker threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _fetch(self, location: str) -> Optional[GeoLocation]:
+        """
+        Query the geocoding API.
+
+        Returns:
+            The coordinates, or None when the provider has no match
+
+        Raises:
+            requests.RequestException on transport or HTTP errors, which must
+            not be cached
+        """
+        self.rate_limiter.acquire()
+        response = self.session.get(
+            f"{self.base_url}/geocoding/v5/mapbox.places/{location}.json",
+            params={
+                "access_token": self.api_key,  # You'll need a Mapbox access token
+                "limit": 1,
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data.get("features"):
+            coordinates = data["features"][0]["center"]
+            return GeoLocation(
+                latitude=coordinates[1],  # Mapbox returns [lng, lat]
+                longitude=coordinates[0],
+            )
+        return None
 
     def geocode(self, location: str) -> GeoLocation:
         """
@@ -58,31 +160,69 @@ class GeocodingService:
         Returns:
             GeoLocation object with latitude and longitude
         """
-        # Skip geocoding for unknown locations
-        if location.lower() == "unknown":
-            return GeoLocation(0.0, 0.0)
-
-        try:
-            # Option 1: Using Nominatim (OpenStreetMap) - no API key required but rate limited
-            response = requests.get(
-                f"https://api.mapbox.com/geocoding/v5/mapbox.places/{location}.json",
-                params={
-                    "access_token": self.api_key,  # You'll need a Mapbox access token
-                    "limit": 1,
-                },
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("features"):
-                    coordinates = data["features"][0]["center"]
-                    return GeoLocation(
-                        latitude=coordinates[1],  # Mapbox returns [lng, lat]
-                        longitude=coordinates[0],
-                    )
+        return self.geocode_many([location])[location]
+
+    def geocode_many(self, locations: List[str]) -> Dict[str, GeoLocation]:
+        """
+        Geocode location names, going to the network only for names that are
+        neither in the gazetteer nor cached.
+
+        Args:
+            locations: Location names to geocode
+
+        Returns:
+            Dictionary mapping each name to its GeoLocation, (0, 0) when unresolved
+        """
+        keys = {
+            location: normalize_location(location)
+            for location in set(locations)
+            # Skip geocoding for unknown locations
+            if location.lower() != "unknown" and normalize_location(location)
+        }
+
+        # Offline tier: well-known places never reach the cache or the network
+        offline = {}
+        if self.gazetteer is not None:
+            for location, key in keys.items():
+                entry = self.gazetteer.lookup(location)
+                if entry is not None:
+                    offline[key] = (entry.latitude, entry.longitude)
+        pending = {
+            location: key for location, key in keys.items() if key not in offline
+        }
+        cached = self.cache.get_many(pending.values())
+
+        # One request per distinct key, all in flight together
+        queries = {}
+        for location, key in pending.items():
+            if key not in cached:
+                queries.setdefault(key, location)
 
-        except Exception as e:
-            print(f"Geocoding error for {location}: {e}")
-            return GeoLocation(0.0, 0.0)
+        fetched = {}
+        if queries:
+            workers = min(self.max_workers, len(queries))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    key: executor.submit(self._fetch, location)
+                    for key, location in queries.items()
+                }
+            for key, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Geocoding error for {queries[key]}: {e}")
+                    continue
+                fetched[key] = (result.latitude, result.longitude) if result else MISS
+        self.cache.put_many(fetched, queries)
+
+        resolved = {**cached, **fetched, **offline}
+        results = {}
+        for location in set(locations):
+            value = resolved.get(keys.get(location))
+            results[location] = (
+                GeoLocation(*value) if value is not MISS else GeoLocation(0.0, 0.0)
+            )
+        return results
 
     def batch_geocode(self, articles: List[ArticleResponse]) -> Dict[str, GeoLocation]:
         """
@@ -94,16 +234,11 @@ class GeocodingService:
         Returns:
             Dictionary mapping location names to GeoLocation objects
         """
-        results = {}
-
-        # Create a unique set of locations to avoid redundant API calls
-        unique_locations = set(
+        # Unique locations are resolved together, concurrently where needed
+        results = self.geocode_many(
             [keyword.location for article in articles for keyword in article.data]
         )
 
-        for location in unique_locations:
-            results[location] = self.geocode(location)
-
         # Create a classes of GeoProcessedArticle for each article
         geo_processed_articles = []
 
@@ -125,6 +260,7 @@ class GeocodingService:
                     article_id=article.article_id,
                     is_valid_article=article.is_valid_article,
                     data=geo_disease_analysis,
+                    excerpts=article.excerpts,
                 )
             )
 
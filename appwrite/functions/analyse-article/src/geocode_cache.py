@@ -0,0 +1,150 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from pymongo import UpdateOne
+
+# Cached value for a name the provider could not resolve
+MISS = None
+
+
+def normalize_location(location: str) -> str:
+    """Cache key for a location name: case-folded, single-spaced, no edge punctuation."""
+    return re.sub(r"\s+", " ", location).strip(" \t\n.,;:'\"()").casefold()
+
+
+class LRUCache:
+    """Thread-safe, size-bounded in-process cache."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        # key -> (value, expires_at), least recently used first
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, now: datetime):
+        """Return (hit, value); expired entries count as misses."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def put(self, key: str, value, expires_at: datetime):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+# Shared across executions while the function runtime stays warm
+_memory_cache = LRUCache()
+
+
+class GeocodeCache:
+    """
+    Two-tier geocode cache: an in-process LRU in front of a Mongo collection.
+
+    Entries are keyed by the normalized location name and expire after a TTL.
+    Names the provider could not resolve are cached too (negative caching),
+    with a shorter TTL, so they are not looked up again on every run.
+    """
+
+    def __init__(
+        self,
+        collection=None,
+        ttl_days: int = 90,
+        negative_ttl_days: int = 7,
+        memory: Optional[LRUCache] = None,
+    ):
+        """
+        Args:
+            collection: Mongo collection backing the cache, memory only when None
+            ttl_days: Lifetime of resolved coordinates
+            negative_ttl_days: Lifetime of cached misses
+            memory: In-process tier, defaults to one shared by the whole process
+        """
+        self.collection = collection
+        self.ttl = timedelta(days=ttl_days)
+        self.negative_ttl = timedelta(days=negative_ttl_days)
+        self.memory = memory or _memory_cache
+
+    def ensure_indexes(self):
+        if self.collection is not None:
+            # Mongo drops documents once expiresAt has passed
+            self.collection.create_index("expiresAt", expireAfterSeconds=0)
+
+    def get_many(
+        self, keys: Iterable[str]
+    ) -> Dict[str, Optional[Tuple[float, float]]]:
+        """
+        Look up normalized names.
+
+        Returns:
+            {key: (latitude, longitude)} for cached hits and {key: MISS} for cached
+            misses; keys that were never seen are left out
+        """
+        now = datetime.utcnow()
+        found = {}
+        remaining = []
+        for key in set(keys):
+            hit, value = self.memory.get(key, now)
+            if hit:
+                found[key] = value
+            else:
+                remaining.append(key)
+
+        if remaining and self.collection is not None:
+            for doc in self.collection.find(
+                {"_id": {"$in": remaining}, "expiresAt": {"$gt": now}}
+            ):
+                value = (
+                    (doc["latitude"], doc["longitude"]) if doc.get("found") else MISS
+                )
+                found[doc["_id"]] = value
+                self.memory.put(doc["_id"], value, doc["expiresAt"])
+        return found
+
+    def put_many(
+        self,
+        entries: Dict[str, Optional[Tuple[float, float]]],
+        queries: Optional[Dict[str, str]] = None,
+        provider: str = "mapbox",
+    ):
+        """
+        Store lookups in both tiers.
+
+        Args:
+            entries: {key: (latitude, longitude) or MISS}
+            queries: Original spelling per key, kept for debugging
+            provider: Geocoder that produced the entries
+        """
+        if not entries:
+            return
+        now = datetime.utcnow()
+        operations = []
+        for key, value in entries.items():
+            expires_at = now + (self.ttl if value is not MISS else self.negative_ttl)
+            self.memory.put(key, value, expires_at)
+            document = {
+                "query": (queries or {}).get(key, key),
+                "found": value is not MISS,
+                "provider": provider,
+                "updatedAt": now,
+                "expiresAt": expires_at,
+            }
+            if value is not MISS:
+                document["latitude"], document["longitude"] = value
+            operations.append(
+                UpdateOne({"_id": key}, {"$set": document}, upsert=True)
+            )
+
+        if self.collection is not None:
+            self.collection.bulk_write(operations, ordered=False)
@@ -0,0 +1,197 @@
+import os
+from collections import Counter
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+from .logger import Logger
+from .article_processor import (
+    BaseArticleProcessor,
+    ArticleRequest,
+    ArticleResponse,
+    DiseaseAnalysis,
+    ProcessingResult,
+)
+
+# Articles shorter than this are treated as stubs (teasers, ads, navigation pages)
+MIN_ARTICLE_WORDS = 40
+
+# How many tokens either side of a keyword are searched for a case count
+CASE_COUNT_WINDOW = 8
+
+NUMBER_WORDS = {
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "eleven": 11,
+    "twelve": 12,
+    "dozen": 12,
+    "twenty": 20,
+    "fifty": 50,
+    "hundred": 100,
+    "thousand": 1000,
+}
+
+
+@lru_cache(maxsize=None)
+def load_spacy_model(model_name: str):
+    """Load a spaCy pipeline once per process."""
+    import spacy
+
+    return spacy.load(model_name, disable=["lemmatizer", "textcat"])
+
+
+def parse_case_count(text: str) -> Optional[int]:
+    """
+    Parse a numeric token such as "1,200", "35" or "three" into an integer.
+
+    Returns:
+        The parsed number, or None if the token is not a plausible case count
+    """
+    cleaned = text.lower().replace(",", "").strip()
+    if cleaned in NUMBER_WORDS:
+        return NUMBER_WORDS[cleaned]
+    if not cleaned.isdigit():
+        return None
+    value = int(cleaned)
+    # Four digit numbers in this range are almost always years
+    if len(cleaned) == 4 and 1900 <= value <= 2100:
+        return None
+    return value
+
+
+class LocalArticleProcessor(BaseArticleProcessor):
+    """Rule/NER based analyzer that runs entirely offline using spaCy."""
+
+    def __init__(
+        self,
+        context: Any,
+        logger: Logger,
+        model_name: Optional[str] = None,
+    ):
+        """
+        Initialize the local analyzer.
+
+        Args:
+            context: Execution context (for cloud functions or similar environments)
+            logger: Logger instance for recording execution information
+            model_name: spaCy pipeline to load, defaults to $SPACY_MODEL or en_core_web_sm
+        """
+        super().__init__(context, logger)
+        self.model_name = model_name or os.environ.get(
+            "SPACY_MODEL", "en_core_web_sm"
+        )
+        self.matcher = None
+
+        try:
+            self.nlp = load_spacy_model(self.model_name)
+            self.logger.info(f"Successfully loaded spaCy model {self.model_name}")
+        except Exception as e:
+            self.logger.error(f"Failed to load spaCy model: {e}")
+            raise RuntimeError(f"Failed to initialize local analyzer: {e}")
+
+    def set_keywords(self, keywords: List[str]) -> None:
+        """
+        Set the disease keywords and rebuild the phrase matcher.
+
+        Args:
+            keywords: List of disease names to search for
+        """
+        super().set_keywords(keywords)
+        from spacy.matcher import PhraseMatcher
+
+        self.matcher = PhraseMatcher(self.nlp.vocab, attr="LOWER")
+        for keyword in keywords:
+            self.matcher.add(keyword, [self.nlp.make_doc(keyword)])
+
+    def _nearest_location(self, doc, span, fallback: str) -> str:
+        """Return the GPE entity closest to span within its sentence."""
+        sentence = span.sent if doc.has_annotation("SENT_START") else doc[:]
+        best, best_distance = None, None
+        for ent in sentence.ents:
+            if ent.label_ != "GPE":
+                continue
+            distance = min(abs(ent.start - span.end), abs(span.start - ent.end))
+            if best_distance is None or distance < best_distance:
+                best, best_distance = ent.text, distance
+        return best or fallback
+
+    def _nearest_case_count(self, doc, span) -> int:
+        """Return the number closest to span, assuming 1 when none is stated."""
+        start = max(span.start - CASE_COUNT_WINDOW, 0)
+        end = min(span.end + CASE_COUNT_WINDOW, len(doc))
+        best, best_distance = None, None
+        for token in doc[start:end]:
+            if not token.like_num:
+                continue
+            value = parse_case_count(token.text)
+            if value is None:
+                continue
+            distance = min(abs(token.i - span.start), abs(token.i - span.end))
+            if best_distance is None or distance < best_distance:
+                best, best_distance = value, distance
+        return best if best is not None else 1
+
+    def _analyse(self, article: ArticleRequest) -> ArticleResponse:
+        doc = self.nlp(article.content)
+        is_valid_article = sum(1 for t in doc if t.is_alpha) >= MIN_ARTICLE_WORDS
+
+        # Article level location used when a sentence names no place
+        gpe_counts = Counter(ent.text for ent in doc.ents if ent.label_ == "GPE")
+        fallback_location = (
+            gpe_counts.most_common(1)[0][0] if gpe_counts else "unknown"
+        )
+
+        mentions: Dict[Tuple[str, str], int] = {}
+        for match_id, start, end in self.matcher(doc):
+            span = doc[start:end]
+            keyword = self.nlp.vocab.strings[match_id]
+            location = self._nearest_location(doc, span, fallback_location)
+            case_count = self._nearest_case_count(doc, span)
+            # Repeated mentions of the same outbreak should not add up
+            key = (keyword, location)
+            mentions[key] = max(mentions.get(key, 0), case_count)
+
+        return ArticleResponse(
+            article_id=article.article_id,
+            is_valid_article=is_valid_article,
+            data=[
+                DiseaseAnalysis(keyword=keyword, location=location, case_count=count)
+                for (keyword, location), count in mentions.items()
+            ],
+        )
+
+    def process_articles(self, articles: List[ArticleRequest]) -> Dict[str, Any]:
+        """
+        Process all articles locally.
+
+        Args:
+            articles: List of articles to process
+
+        Returns:
+            Dictionary containing processing results and any failed articles
+        """
+        if not articles:
+            self.logger.info("No articles provided for processing")
+            return {"results": [], "failed_articles": []}
+
+        if not self.keywords or self.matcher is None:
+            raise ValueError("Keywords not set. Call set_keywords() first.")
+
+        result = ProcessingResult()
+        for article in articles:
+            try:
+                result.add_success([self._analyse(article)])
+            except Exception as e:
+                result.add_failure([article])
+                self.logger.error(
+                    f"Error analysing article {article.article_id} locally: {str(e)}"
+                )
+
+        self.logger.info(f"Locally processed {len(articles)} articles")
+        return result.to_dict()
@@ -21,3 +21,11 @@ class Logger:
             "timestamp": datetime.now().isoformat(),
         }
         self.context.error(json.dumps(log_entry))
+
+    def warning(self, message):
+        log_entry = {
+            "type": "warning",
+            "message": message,
+            "timestamp": datetime.now().isoformat(),
+        }
+        self.context.log(json.dumps(log_entry))
@@ -1,8 +1,13 @@
 import os
 from .logger import Logger
 from .mongo import MongoSession
-from .article_processor import ArticleProcessor, ArticleRequest
+from .pipeline import AnalysisPipeline
+from .processors import build_processor, GEMINI_BACKEND
+from .article_processor import DEFAULT_MODEL_NAME
+from .batch_sizing import AdaptiveBatchSizer
 from .geocode import GeocodingService
+from .geocode_cache import GeocodeCache
+from .gazetteer import load_gazetteer
 from time import time
 
 
@@ -11,49 +16,50 @@ def main(context):
     api_key = os.environ.get("GEMINI_API_KEY")
     mongo_uri = os.environ.get("MONGODB_URI")
     mapbox_token = os.environ.get("MAPBOX_API_KEY")
+    default_backend = os.environ.get("ANALYZER_BACKEND", GEMINI_BACKEND)
+    fallback_backend = os.environ.get("ANALYZER_FALLBACK_BACKEND")
+    lease_seconds = int(os.environ.get("ANALYSIS_LEASE_SECONDS", 300))
+    model_name = os.environ.get("GEMINI_MODEL", DEFAULT_MODEL_NAME)
+    target_latency = float(os.environ.get("ANALYZER_TARGET_BATCH_LATENCY", 8))
+    gazetteer_path = os.environ.get("GAZETTEER_PATH")
     logger = Logger(context)
     try:
-        if not api_key:
-            raise ValueError("Gemini API key is missing")
         if not mongo_uri:
             raise ValueError("MongoDB URI is missing")
         if not mapbox_token:
             raise ValueError("Mapbox API key is missing")
         mongo_client = MongoSession(context, mongo_uri)
-        articles = mongo_client.get_articles_for_analysis()
-        total_articles = 0
-        while articles and len(articles) > 1 and time() - start_time < 600:
-
-            if not articles:
-                return context.res.json(
-                    {
-                        "status": "success",
-                        "message": "No articles to process",
-                    }
-                )
-            processor = ArticleProcessor(context, logger, api_key)
-            geocode_service = GeocodingService(mapbox_token)
-            category_id = articles[0]["categoryId"]
-            logger.info(
-                f"Processing {len(articles)} articles from category {category_id}"
-            )
-            keywords = mongo_client.get_keywords_from_category(category_id)
-            processor.set_keywords(keywords)
-            article_requests = [
-                ArticleRequest(
-                    article_id=str(article["_id"]),
-                    content=article["content"],
-                )
-                for article in articles
-            ]
-            results = processor.process_articles(article_requests)
-            geo_processed_articles = geocode_service.batch_geocode(results["results"])
-            mongo_client.update_articles_with_process_data(geo_processed_articles)
-            logger.info(
-                f"Article analysis completed successfully for {len(articles)} articles"
+        mongo_client.ensure_queue_indexes()
+        geocode_cache = GeocodeCache(mongo_client.geocode_cache_collection)
+        geocode_cache.ensure_indexes()
+        gazetteer = load_gazetteer(gazetteer_path)
+        if gazetteer is None:
+            logger.info("No gazetteer index, geocoding through Mapbox only")
+        batch_sizer = AdaptiveBatchSizer.from_dict(
+            model_name,
+            mongo_client.get_batch_tuning(model_name),
+            target_latency=target_latency,
+        )
+        logger.info(f"Starting with batch size {batch_sizer.size} for {model_name}")
+        pipeline = AnalysisPipeline(
+            mongo_client,
+            logger,
+            lambda backend: build_processor(
+                backend, context, logger, api_key, fallback_backend, model_name
+            ),
+            GeocodingService(mapbox_token, cache=geocode_cache, gazetteer=gazetteer),
+            default_backend,
+            lease_seconds=lease_seconds,
+            batch_sizer=batch_sizer,
+        )
+        total_articles = pipeline.run(start_time)
+        if not total_articles:
+            return context.res.json(
+                {
+                    "status": "success",
+                    "message": "No articles to process",
+                }
             )
-            total_articles += len(articles)
-            articles = mongo_client.get_articles_for_analysis()
         logger.info(f"Processed {total_articles} articles")
     except Exception as e:
         logger.error(f"Failed to process article: {str(e)}")
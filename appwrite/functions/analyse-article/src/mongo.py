@@ -1,19 +1,24 @@
 # create and export a mongodb session
 import pymongo
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
 from bson import ObjectId
 from .geocode import GeoProcessedArticle
-from typing import List
+from .rollups import rollup_operations
+from typing import Dict, List, Optional
 
 
 class MongoSession:
-    def __init__(self, context=None, mongo_uri=None):
+    def __init__(self, context=None, mongo_uri=None, database_name="disease-data"):
         self.client = pymongo.MongoClient(mongo_uri)
-        self.db = self.client["disease-data"]
+        self.db = self.client[database_name]
         self.categories_collection = self.db.get_collection("categories")
         self.sources_collection = self.db.get_collection("sources")
         self.articles_collection = self.db.get_collection("articles")
         self.job_executions_collection = self.db.get_collection("job-executions")
+        self.analyzer_tuning_collection = self.db.get_collection("analyzer-tuning")
+        self.geocode_cache_collection = self.db.get_collection("geocode_cache")
+        self.rollups_collection = self.db.get_collection("mention-rollups")
         self.context = context
 
     def __enter__(self):
@@ -22,32 +27,110 @@ class MongoSession:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.client.close()
 
-    def get_articles_for_analysis(self):
-        pipeline = [
-            # Match articles with "data_extracted" status
-            {"$match": {"status": "data_extracted"}},
-            # Group articles by sourceId
+    def ensure_queue_indexes(self):
+        # Serves the claim query below; create_index is a no-op when it exists
+        self.articles_collection.create_index(
+            [("status", pymongo.ASCENDING), ("leaseExpiresAt", pymongo.ASCENDING)]
+        )
+        self.articles_collection.create_index(
+            [("status", pymongo.ASCENDING), ("categoryId", pymongo.ASCENDING)]
+        )
+        # Oldest claimable article first
+        self.articles_collection.create_index(
+            [("status", pymongo.ASCENDING), ("createdAt", pymongo.ASCENDING)]
+        )
+
+    def _claimable_filter(self, now):
+        # Fresh articles, or articles whose previous claim was never finished
+        return {
+            "$or": [
+                {"status": "data_extracted"},
+                {"status": "analysing", "leaseExpiresAt": {"$lt": now}},
+            ]
+        }
+
+    def claim_articles_for_analysis(self, limit=10, lease_seconds=300):
+        """Atomically lease up to `limit` articles of one category for this execution.
+
+        Batches are filled across all sources of the category, so every article in
+        a batch is analysed with the same keyword list and trickle sources still
+        end up in full batches.
+
+        Claimed articles get status "analysing" and a lease expiry, so concurrent
+        executions never pick up the same article. Leases that expire without the
+        article being completed are reclaimed by the next call.
+        """
+        now = datetime.utcnow()
+        lease = {
+            "status": "analysing",
+            "leaseId": uuid.uuid4().hex,
+            "leaseExpiresAt": now + timedelta(seconds=lease_seconds),
+        }
+
+        first = self.articles_collection.find_one_and_update(
+            self._claimable_filter(now),
+            {"$set": lease},
+            sort=[("createdAt", pymongo.ASCENDING)],
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        if not first or limit <= 1:
+            return [first] if first else []
+
+        # Fill the batch with more articles of the same category, from any source
+        same_category = {
+            **self._claimable_filter(now),
+            "categoryId": first["categoryId"],
+        }
+        candidates = (
+            self.articles_collection.find(same_category, {"_id": 1})
+            .sort("createdAt", pymongo.ASCENDING)
+            .limit(limit - 1)
+        )
+        candidate_ids = [doc["_id"] for doc in candidates]
+        if not candidate_ids:
+            return [first]
+
+        # Re-check the filter so ids claimed by someone else in between are skipped
+        self.articles_collection.update_many(
+            {**same_category, "_id": {"$in": candidate_ids}}, {"$set": lease}
+        )
+        claimed = self.articles_collection.find(
+            {"_id": {"$in": candidate_ids}, "leaseId": lease["leaseId"]}
+        )
+        return [first] + list(claimed)
+
+    def release_articles(self, articles):
+        """Hand claimed articles back to the queue, e.g. after a failed batch.
+
+        Only articles still held under the lease they were claimed with are
+        released; one that expired and was reclaimed belongs to its new owner.
+        """
+        if not articles:
+            return
+        self.articles_collection.update_many(
             {
-                "$group": {
-                    "_id": "$sourceId",
-                    "articles": {"$push": "$$ROOT"},
-                    "count": {"$sum": 1},
-                }
+                "$or": [
+                    {
+                        "_id": article["_id"],
+                        "status": "analysing",
+                        "leaseId": article.get("leaseId"),
+                    }
+                    for article in articles
+                ]
+            },
+            {
+                "$set": {"status": "data_extracted"},
+                "$unset": {"leaseId": "", "leaseExpiresAt": ""},
             },
-            # Filter to only include groups with at least one article
-            {"$match": {"count": {"$gte": 1}}},
-            # Sort by count descending to get the sourceId with most articles first
-            {"$sort": {"count": -1}},
-            # Take just the first group
-            {"$limit": 1},
-            # Limit to 10 articles from this group if there are more
-            {"$project": {"articles": {"$slice": ["$articles", 10]}}},
-        ]
-
-        result = self.articles_collection.aggregate(pipeline)
-        result_list = list(result)
-        # Return the articles array from the first group, or empty list if none found
-        return result_list[0]["articles"] if result_list else []
+        )
+
+    def get_batch_tuning(self, model_name):
+        return self.analyzer_tuning_collection.find_one({"_id": model_name})
+
+    def save_batch_tuning(self, model_name, tuning):
+        self.analyzer_tuning_collection.update_one(
+            {"_id": model_name}, {"$set": tuning}, upsert=True
+        )
 
     def get_keywords_from_category(self, category_id):
         category = self.categories_collection.find_one(
@@ -55,6 +138,12 @@ class MongoSession:
         )
         return category["keywords"]
 
+    def get_analyzer_backend_from_category(self, category_id, default=None):
+        category = self.categories_collection.find_one(
+            {"_id": ObjectId(category_id)}, {"analyzerBackend": 1}
+        )
+        return (category or {}).get("analyzerBackend") or default
+
     def check_if_url_exists(self, url, category_id):
         return (
             self.articles_collection.find_one({"url": url, "categoryId": category_id})
@@ -65,9 +154,71 @@ class MongoSession:
         source = self.sources_collection.find_one({"_id": ObjectId(source_id)})
         return source["cronSchedule"]
 
-    def update_articles_with_process_data(self, articles: List[GeoProcessedArticle]):
+    def update_articles_with_process_data(
+        self,
+        articles: List[GeoProcessedArticle],
+        leases: Optional[Dict[str, str]] = None,
+    ):
+        """Save analysis results and mark the articles completed.
+
+        With `leases` (article id -> leaseId of the claim), an article is only
+        written while this execution still holds its lease, so a slow worker
+        never overwrites the results of the worker that reclaimed the article.
+        Without it, articles are upserted unconditionally.
+        """
+        if not articles:
+            return
+        # Millisecond precision, as stored, so the write can be found by updatedAt
+        now = datetime.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        # Dates for the rollups, and what re-analysed articles counted before
+        existing = {
+            doc["_id"]: doc
+            for doc in self.articles_collection.find(
+                {"_id": {"$in": [ObjectId(a.article_id) for a in articles]}},
+                {
+                    "status": 1,
+                    "leaseId": 1,
+                    "isArticleValid": 1,
+                    "keywords": 1,
+                    "publishDate": 1,
+                    "createdAt": 1,
+                },
+            )
+        }
+        # Rollup deltas per article, applied once its write is known to match
+        deltas = {}
+        written = []
+        operations = []
+        lost = 0
         for article in articles:
-            self.context.log(f"Processing article {str(article)}")
+            previous = existing.get(ObjectId(article.article_id), {})
+            lease_filter = {}
+            if leases is not None:
+                lease_filter = {
+                    "status": "analysing",
+                    "leaseId": leases.get(article.article_id),
+                }
+                if any(previous.get(k) != v for k, v in lease_filter.items()):
+                    # Reclaimed by another execution after our lease expired
+                    lost += 1
+                    continue
+            date = previous.get("publishDate") or previous.get("createdAt") or now
+            added, removed = [], []
+            # Only a completed analysis sets isArticleValid; a re-claimed article
+            # is "analysing" again but its earlier mentions are still counted
+            if previous.get("isArticleValid"):
+                removed = [
+                    (date, k["keyword"], k.get("location"), k.get("caseCount", 0))
+                    for k in previous.get("keywords", [])
+                ]
+            if article.is_valid_article:
+                added = [
+                    (date, a.keyword, a.location, a.case_count) for a in article.data
+                ]
+            deltas[ObjectId(article.article_id)] = (added, removed)
+            written.append(article)
+
             # Convert DiseaseAnalysis objects to dictionaries
             keywords_data = [
                 {
@@ -80,15 +231,57 @@ class MongoSession:
                 for analysis in article.data
             ]
 
-            self.articles_collection.update_one(
-                {"_id": ObjectId(article.article_id)},
-                {
-                    "$set": {
-                        "keywords": keywords_data,
-                        "isArticleValid": article.is_valid_article,
-                        "updatedAt": datetime.utcnow(),
-                        "status": "completed",
-                    }
-                },
-                upsert=True,
+            operations.append(
+                pymongo.UpdateOne(
+                    {"_id": ObjectId(article.article_id), **lease_filter},
+                    {
+                        "$set": {
+                            "keywords": keywords_data,
+                            "isArticleValid": article.is_valid_article,
+                            # Offsets of the article text the analysis was based on
+                            "analysisExcerpts": [
+                                {"start": e.start, "end": e.end, "kind": e.kind}
+                                for e in article.excerpts
+                            ],
+                            "updatedAt": now,
+                            "status": "completed",
+                        },
+                        "$unset": {"leaseId": "", "leaseExpiresAt": ""},
+                    },
+                    # An upsert would clash on _id when the lease no longer matches
+                    upsert=leases is None,
+                )
+            )
+
+        if lost:
+            self.context.log(f"Skipped {lost} articles whose lease expired")
+        if not operations:
+            return
+        # One round trip for the whole batch
+        result = self.articles_collection.bulk_write(operations, ordered=False)
+        self.context.log(
+            f"Saved {len(operations)} articles "
+            f"({sum(a.is_valid_article for a in written)} valid, "
+            f"{sum(len(a.data) for a in written)} mentions): "
+            f"{result.matched_count} matched, {result.modified_count} modified, "
+            f"{result.upserted_count} upserted"
+        )
+
+        if result.matched_count + result.upserted_count < len(operations):
+            # Some leases were lost between the read and the write; only the
+            # articles stamped by this write may move the rollups
+            stamped = {
+                doc["_id"]
+                for doc in self.articles_collection.find(
+                    {"_id": {"$in": list(deltas)}, "updatedAt": now}, {"_id": 1}
+                )
+            }
+            self.context.log(
+                f"Skipped {len(operations) - len(stamped)} articles whose lease expired"
             )
+            deltas = {k: v for k, v in deltas.items() if k in stamped}
+        added = [entry for delta in deltas.values() for entry in delta[0]]
+        removed = [entry for delta in deltas.values() for entry in delta[1]]
+        rollups = rollup_operations("articles", added, removed, now)
+        if rollups:
+            self.rollups_collection.bulk_write(rollups, ordered=False)
@@ -0,0 +1,227 @@
+import queue
+import threading
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .logger import Logger
+from .mongo import MongoSession
+from .article_processor import ArticleRequest, BaseArticleProcessor
+from .geocode import GeocodingService
+from .batch_sizing import AdaptiveBatchSizer
+
+# Marks the end of the stream between stages
+_DONE = object()
+
+
+class AnalysisPipeline:
+    """
+    Runs claim+analyse, geocode and write as three overlapping stages.
+
+    Each stage runs in its own thread and hands batches to the next one through a
+    bounded queue, so the next batch is already claimed and sent to the analyzer
+    while the previous one is being geocoded and written. Processors, keyword
+    lists and the geocoding service are built once per execution.
+    """
+
+    def __init__(
+        self,
+        mongo_client: MongoSession,
+        logger: Logger,
+        processor_factory: Callable[[str], BaseArticleProcessor],
+        geocode_service: GeocodingService,
+        default_backend: str,
+        lease_seconds: int = 300,
+        time_limit: float = 600,
+        queue_size: int = 2,
+        batch_sizer: Optional[AdaptiveBatchSizer] = None,
+    ):
+        """
+        Args:
+            mongo_client: Session used to claim, release and update articles
+            logger: Logger instance
+            processor_factory: Builds the analyzer for a backend name
+            geocode_service: Shared geocoding service
+            default_backend: Backend for categories that do not choose one
+            lease_seconds: Lease length for claimed articles
+            time_limit: Stop claiming new batches after this many seconds
+            queue_size: Maximum number of batches waiting between two stages
+            batch_sizer: Picks the number of articles claimed per batch from
+                observed model latency and errors; fixed at 10 when not given
+        """
+        self.mongo_client = mongo_client
+        self.logger = logger
+        self.processor_factory = processor_factory
+        self.geocode_service = geocode_service
+        self.default_backend = default_backend
+        self.lease_seconds = lease_seconds
+        self.time_limit = time_limit
+        self.batch_sizer = batch_sizer
+
+        self._geocode_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._write_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._processors: Dict[str, BaseArticleProcessor] = {}
+        self._categories: Dict[str, Tuple[str, List[str]]] = {}
+        self.total_articles = 0
+
+    def _fail(self, articles: List[Dict[str, Any]], error: BaseException):
+        """Record the first error, stop the pipeline and release the batch."""
+        self.logger.error(f"Pipeline stage failed: {str(error)}")
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+        self._release(articles)
+
+    def _release(self, articles: List[Dict[str, Any]]):
+        if not articles:
+            return
+        try:
+            self.mongo_client.release_articles(articles)
+        except Exception as e:
+            self.logger.error(f"Failed to release articles: {str(e)}")
+
+    def _category(self, category_id: str) -> Tuple[str, List[str]]:
+        if category_id not in self._categories:
+            backend = self.mongo_client.get_analyzer_backend_from_category(
+                category_id, self.default_backend
+            )
+            keywords = self.mongo_client.get_keywords_from_category(category_id)
+            self._categories[category_id] = (backend, keywords)
+        return self._categories[category_id]
+
+    def _processor(self, backend: str) -> BaseArticleProcessor:
+        if backend not in self._processors:
+            self._processors[backend] = self.processor_factory(backend)
+        return self._processors[backend]
+
+    def _analyse_stage(self, start_time: float):
+        try:
+            while not self._stop.is_set() and time() - start_time < self.time_limit:
+                articles = self.mongo_client.claim_articles_for_analysis(
+                    limit=self.batch_sizer.size if self.batch_sizer else 10,
+                    lease_seconds=self.lease_seconds,
+                )
+                if not articles:
+                    break
+                try:
+                    category_id = articles[0]["categoryId"]
+                    backend, keywords = self._category(category_id)
+                    processor = self._processor(backend)
+                    processor.set_keywords(keywords)
+                    self.logger.info(
+                        f"Processing {len(articles)} articles from category {category_id} with {backend} analyzer"
+                    )
+                    results = processor.process_articles(
+                        [
+                            ArticleRequest(
+                                article_id=str(article["_id"]),
+                                content=article["content"],
+                                title=article.get("title") or "",
+                            )
+                            for article in articles
+                        ]
+                    )
+                except Exception as e:
+                    self._fail(articles, e)
+                    break
+                if self.batch_sizer and processor.last_batch_stats:
+                    self.batch_sizer.record(processor.last_batch_stats)
+
+                # Articles the model never analysed go back to the queue instead
+                # of being stored as completed with empty results
+                failed = {a.article_id for a in results["failed_articles"]}
+                if failed:
+                    self.logger.error(
+                        f"Analysis failed for {len(failed)} articles, releasing them"
+                    )
+                    self._release([a for a in articles if str(a["_id"]) in failed])
+                    articles = [a for a in articles if str(a["_id"]) not in failed]
+                analysed = [r for r in results["results"] if r.article_id not in failed]
+                if articles:
+                    self._geocode_queue.put((articles, analysed))
+                if failed:
+                    # Claiming again would get the same articles; a later run retries them
+                    break
+        except Exception as e:
+            # Claiming itself failed, there is no batch to release
+            self._fail([], e)
+        finally:
+            self._geocode_queue.put(_DONE)
+
+    def _geocode_stage(self):
+        try:
+            while True:
+                item = self._geocode_queue.get()
+                if item is _DONE:
+                    break
+                articles, results = item
+                if self._stop.is_set():
+                    self._release(articles)
+                    continue
+                try:
+                    geo_processed_articles = self.geocode_service.batch_geocode(
+                        results
+                    )
+                except Exception as e:
+                    self._fail(articles, e)
+                    continue
+                self._write_queue.put((articles, geo_processed_articles))
+        finally:
+            self._write_queue.put(_DONE)
+
+    def _write_stage(self):
+        while True:
+            item = self._write_queue.get()
+            if item is _DONE:
+                break
+            articles, geo_processed_articles = item
+            if self._stop.is_set():
+                self._release(articles)
+                continue
+            try:
+                self.mongo_client.update_articles_with_process_data(
+                    geo_processed_articles,
+                    leases={str(a["_id"]): a["leaseId"] for a in articles},
+                )
+            except Exception as e:
+                self._fail(articles, e)
+                continue
+            self.total_articles += len(articles)
+            self.logger.info(
+                f"Article analysis completed successfully for {len(articles)} articles"
+            )
+
+    def run(self, start_time: Optional[float] = None) -> int:
+        """
+        Run the pipeline until the queue is empty or the time limit is reached.
+
+        Returns:
+            Number of articles written
+
+        Raises:
+            The first exception raised by any stage, after all claimed batches
+            have been written or released
+        """
+        start_time = start_time or time()
+        stages = [
+            threading.Thread(target=self._analyse_stage, args=(start_time,)),
+            threading.Thread(target=self._geocode_stage),
+        ]
+        for stage in stages:
+            stage.start()
+        # Writes happen on the calling thread
+        self._write_stage()
+        for stage in stages:
+            stage.join()
+
+        if self.batch_sizer:
+            try:
+                self.mongo_client.save_batch_tuning(
+                    self.batch_sizer.model_name, self.batch_sizer.to_dict()
+                )
+            except Exception as e:
+                self.logger.error(f"Failed to save batch tuning: {str(e)}")
+
+        if self._error is not None:
+            raise self._error
+        return self.total_articles
@@ -0,0 +1,97 @@
+import os
+from typing import List, Dict, Any, Optional
+from .logger import Logger
+from .article_processor import (
+    BaseArticleProcessor,
+    ArticleProcessor,
+    ArticleRequest,
+    DEFAULT_MODEL_NAME,
+)
+from .local_processor import LocalArticleProcessor
+from .context_window import ContextCompressor
+
+GEMINI_BACKEND = "gemini"
+LOCAL_BACKEND = "local"
+BACKENDS = (GEMINI_BACKEND, LOCAL_BACKEND)
+
+
+class FallbackArticleProcessor(BaseArticleProcessor):
+    """Uses Gemini and switches to the local analyzer once the Gemini quota runs out."""
+
+    def __init__(
+        self,
+        context: Any,
+        logger: Logger,
+        primary: ArticleProcessor,
+        fallback: BaseArticleProcessor,
+    ):
+        super().__init__(context, logger)
+        self.primary = primary
+        self.fallback = fallback
+
+    def set_keywords(self, keywords: List[str]) -> None:
+        super().set_keywords(keywords)
+        self.primary.set_keywords(keywords)
+        self.fallback.set_keywords(keywords)
+
+    def process_articles(self, articles: List[ArticleRequest]) -> Dict[str, Any]:
+        self.last_batch_stats = None
+        if self.primary.quota_exhausted:
+            return self.fallback.process_articles(articles)
+
+        result = self.primary.process_articles(articles)
+        self.last_batch_stats = self.primary.last_batch_stats
+        if self.primary.quota_exhausted:
+            # The whole batch failed on the quota error, redo it locally
+            self.logger.info(
+                f"Falling back to local analyzer for {len(articles)} articles"
+            )
+            return self.fallback.process_articles(articles)
+        return result
+
+
+def build_processor(
+    backend: str,
+    context: Any,
+    logger: Logger,
+    api_key: Optional[str] = None,
+    fallback_backend: Optional[str] = None,
+    model_name: str = DEFAULT_MODEL_NAME,
+) -> BaseArticleProcessor:
+    """
+    Create the analyzer for a backend name.
+
+    Args:
+        backend: "gemini" or "local"
+        context: Execution context
+        logger: Logger instance
+        api_key: Gemini API key, required for the gemini backend
+        fallback_backend: Backend to use when the Gemini quota is exhausted
+        model_name: Gemini model to use
+
+    Returns:
+        An analyzer implementing BaseArticleProcessor
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown analyzer backend: {backend}")
+
+    if backend == LOCAL_BACKEND:
+        return LocalArticleProcessor(context, logger)
+
+    if not api_key:
+        raise ValueError("Gemini API key is missing")
+    # ANALYZER_CONTEXT_WINDOW=0 sends whole articles to Gemini again
+    compressor = (
+        ContextCompressor()
+        if os.environ.get("ANALYZER_CONTEXT_WINDOW", "1") != "0"
+        else None
+    )
+    processor = ArticleProcessor(
+        context, logger, api_key, model_name, context_compressor=compressor
+    )
+
+    if fallback_backend == LOCAL_BACKEND:
+        return FallbackArticleProcessor(
+            context, logger, processor, LocalArticleProcessor(context, logger)
+        )
+    return processor
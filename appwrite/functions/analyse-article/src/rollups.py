@@ -0,0 +1,91 @@
+# Shared module: kept byte-identical in scripts/ and in the analyse-article
+# function, which is deployed on its own. Check with
+# `python -m scripts.check_shared_modules`.
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+
+GRANULARITIES = ("day", "week")
+
+# (date, keyword, region, case count) of one mention
+Mention = Tuple[datetime, str, str, int]
+
+
+def normalize_region(region: Optional[str]) -> str:
+    region = " ".join((region or "").split()).lower()
+    return region or "unknown"
+
+
+def bucket_start(date: datetime, granularity: str) -> datetime:
+    """Start of the day, or of the ISO week (Monday), containing date."""
+    day = datetime(date.year, date.month, date.day)
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def rollup_operations(
+    source: str,
+    added: Iterable[Mention] = (),
+    removed: Iterable[Mention] = (),
+    now: Optional[datetime] = None,
+) -> List[UpdateOne]:
+    """
+    Build the $inc upserts that move the rollup buckets by a change in mentions.
+
+    Each bucket counts the mentions and sums their case counts per granularity,
+    period, keyword and region. Its _id is derived from those, so concurrent
+    writers upsert the same document and never create duplicates.
+
+    Args:
+        source: Dataset the mentions belong to, e.g. "articles"
+        added: Mentions that were written
+        removed: Mentions that were replaced and no longer count
+
+    Returns:
+        One UpdateOne per bucket whose totals changed
+    """
+    now = now or datetime.utcnow()
+    totals: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0])
+    for sign, mentions in ((1, added), (-1, removed)):
+        for date, keyword, region, case_count in mentions:
+            if not isinstance(date, datetime):
+                # Undated records cannot be bucketed
+                continue
+            for granularity in GRANULARITIES:
+                key = (
+                    granularity,
+                    bucket_start(date, granularity),
+                    keyword.lower(),
+                    normalize_region(region),
+                )
+                totals[key][0] += sign
+                totals[key][1] += sign * (case_count or 0)
+
+    operations = []
+    for (granularity, period, keyword, region), (count, cases) in totals.items():
+        if count == 0 and cases == 0:
+            continue
+        operations.append(
+            UpdateOne(
+                {
+                    "_id": "|".join(
+                        (granularity, source, f"{period:%Y-%m-%d}", keyword, region)
+                    )
+                },
+                {
+                    "$inc": {"mentions": count, "caseCount": cases},
+                    "$set": {"updatedAt": now},
+                    "$setOnInsert": {
+                        "granularity": granularity,
+                        "source": source,
+                        "period": period,
+                        "keyword": keyword,
+                        "region": region,
+                    },
+                },
+                upsert=True,
+            )
+        )
+    return operations
@@ -1,6 +1,7 @@
-from datetime import datetime, timezone
-from typing import Optional, Dict, Any
-from pymongo import MongoClient
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient, ReturnDocument, ASCENDING
 from dataclasses import dataclass
 from bson import ObjectId
 from appwrite.client import Client
@@ -8,6 +9,28 @@ from appwrite.services.functions import Functions
 import os
 import json
 
+# Finished job executions are deleted by a TTL index after this long
+JOB_RETENTION = timedelta(days=float(os.environ.get("JOB_RETENTION_DAYS", 30)))
+# Sources claimed per run, so a backlog cannot push the pooler past its timeout
+MAX_SOURCES_PER_POLL = int(os.environ.get("MAX_SOURCES_PER_POLL", 200))
+TRIGGER_WORKERS = int(os.environ.get("TRIGGER_WORKERS", 16))
+# Sources crawling at the same time, across all executions and poller runs
+MAX_RUNNING_CRAWLS = int(os.environ.get("MAX_RUNNING_CRAWLS", 50))
+# Crawl seconds one process-source execution is given; cheap sources share one
+EXECUTION_BUDGET = float(os.environ.get("EXECUTION_BUDGET", 600))
+# Delay before a source that could not be started is claimed again, doubled
+# with every consecutive failure up to the maximum
+FAILURE_BACKOFF = timedelta(
+    seconds=float(os.environ.get("FAILURE_BACKOFF_SECONDS", 300))
+)
+MAX_FAILURE_BACKOFF = timedelta(
+    seconds=float(os.environ.get("MAX_FAILURE_BACKOFF_SECONDS", 24 * 3600))
+)
+# How long a claimed source counts as running without a heartbeat from its crawl
+RUNNING_LEASE = timedelta(
+    seconds=float(os.environ.get("RUNNING_LEASE_SECONDS", 3 * EXECUTION_BUDGET))
+)
+
 
 @dataclass
 class JobExecution:
@@ -26,6 +49,28 @@ class JobExecution:
     metadata: Optional[Dict[str, Any]] = None
 
 
+def pack_by_cost(
+    jobs: List[JobExecution], costs: Dict[str, float], capacity: float
+) -> List[List[JobExecution]]:
+    """First-fit decreasing: groups jobs whose estimated costs add up to at most capacity.
+
+    A job costing capacity or more always gets an execution of its own.
+    """
+    bins: List[List[JobExecution]] = []
+    loads: List[float] = []
+    for job in sorted(jobs, key=lambda job: costs[job.sourceId], reverse=True):
+        cost = costs[job.sourceId]
+        for index, load in enumerate(loads):
+            if load + cost <= capacity:
+                bins[index].append(job)
+                loads[index] += cost
+                break
+        else:
+            bins.append([job])
+            loads.append(cost)
+    return bins
+
+
 class SourcePoller:
     def __init__(self, mongo_uri: str, context):
         self.client = MongoClient(mongo_uri)
@@ -33,6 +78,7 @@ class SourcePoller:
         self.sources = self.db.get_collection("sources")
         self.categories = self.db.get_collection("categories")
         self.job_executions = self.db.get_collection("job-executions")
+        self.source_stats = self.db.get_collection("source-stats")
         self.context = context
 
         # Initialize Appwrite client
@@ -42,12 +88,12 @@ class SourcePoller:
         self.appwrite_client.set_key(context.req.headers["x-appwrite-key"])
         self.functions = Functions(self.appwrite_client)
 
-    def trigger_function(self, source_id: str, job_id: str, url: str) -> bool:
-        """Triggers the Appwrite function for processing"""
+    def trigger_function(self, job_ids: List[str]) -> bool:
+        """Triggers one Appwrite execution processing the given jobs in turn"""
         try:
             self.functions.create_execution(
                 os.environ["APPWRITE_PROCESS_SOURCE_FUNCTION_ID"],
-                body=json.dumps({"jobId": job_id}),
+                body=json.dumps({"jobIds": job_ids}),
                 xasync=True,
             )
             return True
@@ -55,89 +101,247 @@ class SourcePoller:
             self.context.error(f"Failed to trigger function: {str(e)}")
             return False
 
-    def process_source(self, source: Dict[str, Any]):
-        source_id = str(source["_id"])
-        now = datetime.now(timezone.utc)
-        self.context.log(f"Processing source {source_id}, url: {source['url']}")
+    def claim_due_sources(self, now: datetime, limit: int) -> List[Dict[str, Any]]:
+        """Atomically marks due sources as running, so concurrent pollers never share one
 
-        # Get associated category data
-        category = self.categories.find_one({"_id": ObjectId(source["categoryId"])})
-        if not category:
-            self.context.error(f"Category not found for source {source_id}")
-            return
+        Sources are claimed most overdue first; those left over stay due and
+        are claimed in that order on later runs.
+        A claim holds until `runningUntil`, which the crawl keeps extending.
+        """
+        claimed = []
+        while len(claimed) < limit:
+            source = self.sources.find_one_and_update(
+                {
+                    "isActive": True,
+                    "status": {"$in": ["idle", "error"]},
+                    "cronSchedule": {"$exists": True},
+                    "nextRunAt": {"$lte": now},
+                },
+                {
+                    "$set": {
+                        "status": "running",
+                        "lastRunAt": now,
+                        "runningUntil": now + RUNNING_LEASE,
+                    }
+                },
+                sort=[("nextRunAt", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if source is None:
+                break
+            claimed.append(source)
+        return claimed
 
-        # Create job execution record
-        job_execution = JobExecution(
-            _id=str(ObjectId()),
-            sourceId=source_id,
-            categoryId=str(category["_id"]),
-            sourceUrl=source["url"],
-            categoryKeywords=category.get("keywords", []),
-            startedAt=now,
-            createdAt=now,
-            updatedAt=now,
+    def fail_source(self, source_id: ObjectId, error_msg: str):
+        """Marks a source as failed and backs off its next run
+
+        Error sources are claimable again once due; without the backoff a
+        source that cannot start would be reclaimed, most overdue, every poll.
+        """
+        self.context.error(error_msg)
+        source = self.sources.find_one_and_update(
+            {"_id": source_id},
+            {
+                "$set": {"status": "error", "lastError": error_msg},
+                "$inc": {"failureCount": 1},
+                "$unset": {"runningUntil": ""},
+            },
+            projection={"failureCount": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if source is None:
+            return
+        backoff = min(
+            MAX_FAILURE_BACKOFF,
+            FAILURE_BACKOFF * 2 ** min(source["failureCount"] - 1, 20),
+        )
+        self.sources.update_one(
+            {"_id": source_id},
+            {"$set": {"nextRunAt": datetime.now(timezone.utc) + backoff}},
         )
 
-        try:
-            # Insert job execution record
-            self.job_executions.insert_one({**job_execution.__dict__, "_id": ObjectId(job_execution._id)})
-            self.context.log(f"Job execution created: {job_execution._id}")
-            # Update source status to running
-            result = self.sources.update_one(
-                {"_id": source["_id"], "status": {"$ne": "running"}},
-                {"$set": {"status": "running", "lastRunAt": now}},
+    def create_job_executions(
+        self, sources: List[Dict[str, Any]], now: datetime
+    ) -> List[JobExecution]:
+        """Creates the job execution records of the claimed sources in one insert"""
+        category_ids = {ObjectId(source["categoryId"]) for source in sources}
+        categories = {
+            category["_id"]: category
+            for category in self.categories.find(
+                {"_id": {"$in": list(category_ids)}}, {"keywords": 1}
             )
-            self.context.log(f"Source status updated: {result.modified_count}")
-
-            if result.modified_count == 0:
-                return
+        }
 
-            # Trigger the function asynchronously
-            self.trigger_function(source_id, job_execution._id, source["url"])
-            self.sources.update_one(
-                {"_id": ObjectId(source_id)},
-                {"$push": {"jobExecutionIds": job_execution._id}},
+        job_executions = []
+        for source in sources:
+            category = categories.get(ObjectId(source["categoryId"]))
+            if not category:
+                self.fail_source(
+                    source["_id"], f"Category not found for source {source['_id']}"
+                )
+                continue
+            job_executions.append(
+                JobExecution(
+                    _id=str(ObjectId()),
+                    sourceId=str(source["_id"]),
+                    categoryId=str(category["_id"]),
+                    sourceUrl=source["url"],
+                    categoryKeywords=category.get("keywords", []),
+                    startedAt=now,
+                    createdAt=now,
+                    updatedAt=now,
+                )
             )
-            self.context.log("Function triggered successfully")
-        except Exception as e:
-            error_msg = f"Error processing source {source_id}: {str(e)}"
-            self.context.error(error_msg)
 
-            # Update job execution status to error
-            self.job_executions.update_one(
-                {"_id": ObjectId(job_execution._id)},
-                {
-                    "$set": {
-                        "status": "error",
-                        "error": error_msg,
-                        "updatedAt": datetime.now(timezone.utc),
-                    }
-                },
+        if job_executions:
+            self.job_executions.insert_many(
+                [
+                    {**job_execution.__dict__, "_id": ObjectId(job_execution._id)}
+                    for job_execution in job_executions
+                ],
+                ordered=False,
             )
+            self.context.log(f"Job executions created: {len(job_executions)}")
+        return job_executions
+
+    def fail_job(self, job_execution: JobExecution, error_msg: str):
+        now = datetime.now(timezone.utc)
+        self.job_executions.update_one(
+            {"_id": ObjectId(job_execution._id)},
+            {
+                "$set": {
+                    "status": "error",
+                    "error": error_msg,
+                    "updatedAt": now,
+                    "expiresAt": now + JOB_RETENTION,
+                }
+            },
+        )
+        self.fail_source(ObjectId(job_execution.sourceId), error_msg)
+
+    def estimate_costs(self, job_executions: List[JobExecution]) -> Dict[str, float]:
+        """Average crawl seconds per execution of each source, from its job history
 
-            # Update source status
-            self.sources.update_one(
-                {"_id": source["_id"]},
-                {"$set": {"status": "error", "lastError": error_msg}},
+        Sources without history are assumed to need a full execution.
+        """
+        source_ids = [job.sourceId for job in job_executions]
+        costs = {source_id: EXECUTION_BUDGET for source_id in source_ids}
+        for stats in self.source_stats.find(
+            {"_id": {"$in": source_ids}}, {"executions": 1, "totalDuration": 1}
+        ):
+            if stats.get("executions"):
+                costs[stats["_id"]] = (
+                    stats.get("totalDuration", 0) / stats["executions"]
+                )
+        return costs
+
+    def trigger_jobs(self, job_executions: List[JobExecution]) -> int:
+        """Packs the jobs into executions by cost and triggers those concurrently"""
+        batches = pack_by_cost(
+            job_executions, self.estimate_costs(job_executions), EXECUTION_BUDGET
+        )
+        self.context.log(
+            f"Packed {len(job_executions)} jobs into {len(batches)} executions"
+        )
+        with ThreadPoolExecutor(max_workers=TRIGGER_WORKERS) as executor:
+            results = executor.map(
+                lambda batch: self.trigger_function([job._id for job in batch]),
+                batches,
             )
+            triggered = 0
+            for batch, success in zip(batches, results):
+                if success:
+                    triggered += len(batch)
+                    continue
+                for job_execution in batch:
+                    self.fail_job(
+                        job_execution,
+                        f"Error processing source {job_execution.sourceId}: "
+                        "failed to trigger function",
+                    )
+        return triggered
+
+    def release_expired_sources(self, now: datetime) -> int:
+        """Hands back sources whose crawl stopped without releasing them
+
+        A crawl killed by the function timeout, or whose continuation was
+        never triggered, leaves its source running; once the lease expires the
+        source is idle again and, being overdue, claimed on this poll.
+        Sources claimed before leases existed expire from their last run.
+        """
+        expired = self.sources.distinct(
+            "_id",
+            {
+                "status": "running",
+                "$or": [
+                    {"runningUntil": {"$lt": now}},
+                    {
+                        "runningUntil": {"$exists": False},
+                        "lastRunAt": {"$lt": now - RUNNING_LEASE},
+                    },
+                ],
+            },
+        )
+        if not expired:
+            return 0
+        error_msg = "Crawl lease expired"
+        self.sources.update_many(
+            {"_id": {"$in": expired}, "status": "running"},
+            {
+                "$set": {"status": "idle", "lastError": error_msg},
+                "$unset": {"runningUntil": ""},
+            },
+        )
+        # Their unfinished jobs will not be continued
+        self.job_executions.update_many(
+            {
+                "sourceId": {"$in": [str(source_id) for source_id in expired]},
+                "status": {"$in": ["running", "in_progress"]},
+            },
+            {
+                "$set": {
+                    "status": "error",
+                    "error": error_msg,
+                    "updatedAt": now,
+                    "expiresAt": now + JOB_RETENTION,
+                }
+            },
+        )
+        self.context.log(f"Released {len(expired)} stale running sources")
+        return len(expired)
 
     def poll(self):
         try:
             now = datetime.now(timezone.utc)
 
-            # Find sources that need processing
             self.context.log("Polling sources...")
-            sources = self.sources.find(
-                {
-                    "isActive": True,
-                    "status": {"$in": ["idle", "error"]},
-                    "cronSchedule": {"$exists": True},
-                    "nextRunAt": {"$lte": now},
-                }
-            ).to_list(length=None)
-            self.context.log(f"Found {len(sources)} sources to process")
-            for source in sources:
-                self.process_source(source)
+            self.release_expired_sources(now)
+            running = self.sources.count_documents(
+                {"status": "running", "runningUntil": {"$gte": now}}
+            )
+            capacity = min(MAX_SOURCES_PER_POLL, MAX_RUNNING_CRAWLS - running)
+            if capacity <= 0:
+                self.context.log(f"{running} crawls running, at the limit")
+                return {"success": True, "message": "Polling completed successfully"}
+            sources = self.claim_due_sources(now, capacity)
+            self.context.log(
+                f"Claimed {len(sources)} sources to process ({running} already running)"
+            )
+            if not sources:
+                return {"success": True, "message": "Polling completed successfully"}
+
+            try:
+                job_executions = self.create_job_executions(sources, now)
+            except Exception as e:
+                # Hand the claimed sources back instead of leaving them running
+                for source in sources:
+                    self.fail_source(
+                        source["_id"], f"Error processing source {source['_id']}: {e}"
+                    )
+                raise
+
+            triggered = self.trigger_jobs(job_executions)
+            self.context.log(f"Triggered {triggered}/{len(job_executions)} functions")
 
             return {"success": True, "message": "Polling completed successfully"}
 
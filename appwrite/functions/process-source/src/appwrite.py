@@ -1,5 +1,6 @@
 from appwrite.client import Client
 from appwrite.services.functions import Functions
+from typing import List
 import os
 import json
 
@@ -34,3 +35,7 @@ class AppwriteClient:
         except Exception as e:
             self.error("Failed to trigger function: " + str(e))
             return False
+
+    def trigger_jobs(self, job_ids: List[str]) -> bool:
+        """Hands jobs this execution had no time left for to a new execution"""
+        return self.trigger_function(job_ids[0], {"jobIds": job_ids})
@@ -1,7 +1,8 @@
+import hashlib
 import json
 import time
-from datetime import datetime
-from typing import Dict, Any
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
 from urllib.parse import urlparse
 from bson import ObjectId
 import croniter
@@ -15,6 +16,31 @@ from .link_extractor import LinkExtractor
 from .mongo import MongoSession
 from .article_processor import ArticleProcessor, ArticleRequest
 
+# Upper bound of the per-source delay added to cron run times
+MAX_JITTER_SECONDS = float(os.environ.get("MAX_JITTER_SECONDS", 900))
+# Crawl seconds shared by all jobs of one execution, below the function timeout
+EXECUTION_BUDGET = float(os.environ.get("EXECUTION_BUDGET", 600))
+# How long the pooler counts a source as running without a heartbeat
+RUNNING_LEASE = timedelta(
+    seconds=float(os.environ.get("RUNNING_LEASE_SECONDS", 3 * EXECUTION_BUDGET))
+)
+
+
+def jittered_next_run(cron_schedule: str, source_id: str, base: datetime) -> datetime:
+    """Next cron run of a source, shifted by a fixed per-source offset
+
+    Sources with the same schedule would otherwise all become due in the same
+    minute. The offset is derived from the source id, so a source keeps its
+    slot from run to run, and stays below a tenth of the cron interval.
+    """
+    cron = croniter.croniter(cron_schedule, base)
+    next_run_at = cron.get_next(datetime)
+    interval = (cron.get_next(datetime) - next_run_at).total_seconds()
+    max_jitter = min(MAX_JITTER_SECONDS, interval / 10)
+    digest = hashlib.sha1(str(source_id).encode()).hexdigest()
+    fraction = int(digest[:8], 16) / 0xFFFFFFFF
+    return next_run_at + timedelta(seconds=fraction * max_jitter)
+
 
 class Crawler:
     def __init__(
@@ -37,6 +63,10 @@ class Crawler:
         self.max_depth = 2
         self.max_pages = 1000
         self.time_limit = 600
+        # Finished job executions are deleted by a TTL index after this long
+        self.job_retention = timedelta(
+            days=float(os.environ.get("JOB_RETENTION_DAYS", 30))
+        )
 
         self.api_key = os.environ.get("GEMINI_API_KEY")
         if not self.api_key:
@@ -53,12 +83,12 @@ class Crawler:
         """Initialize metadata structure for new job"""
         return {
             "crawl_progress": {
-                "visited": [],
-                "to_visit": [(job_data["sourceUrl"], 0)],
+                "visitedCount": 0,
+                "toVisitCount": 1,
                 "total_processed": 0,
                 "is_completed": False,
             },
-            "articleIds": [],
+            "articleCount": 0,
             "last_execution_duration": 0,
             "total_executions": 1,
         }
@@ -74,47 +104,98 @@ class Crawler:
             self.error(f"Failed to update job status: {str(e)}", "ERROR")
             raise
 
-    def update_source_status(self, source_id: str, updates: Dict[str, Any]) -> None:
-        """Update source status in MongoDB"""
+    def update_source_status(
+        self, source_id: str, updates: Dict[str, Any], unset: List[str] = ()
+    ) -> None:
+        """Update source status in MongoDB, removing the `unset` fields"""
         try:
+            update = {"$set": {**updates, "updatedAt": datetime.utcnow()}}
+            if unset:
+                update["$unset"] = {field: "" for field in unset}
             self.db.sources_collection.update_one(
-                {"_id": ObjectId(source_id)},
-                {"$set": {**updates, "updatedAt": datetime.utcnow()}},
+                {"_id": ObjectId(source_id)}, update
             )
         except Exception as e:
             self.error(f"Failed to update source status: {str(e)}")
 
-    def crawl(self, job_id: str) -> Dict[str, Any]:
-        """Main processing function with timeout handling"""
+    def release_source(self, source_id: str, status: str, error: str = None) -> None:
+        """Hand a source back to the pooler once its job finished or failed
+
+        The next run is scheduled either way, so a failing source is retried
+        on its schedule instead of on every poll.
+        """
+        updates = {"status": status}
+        if error:
+            updates["lastError"] = error
+        try:
+            cron_schedule = self.db.get_cron_schedule_from_sourceId(source_id)
+            updates["nextRunAt"] = jittered_next_run(
+                cron_schedule, source_id, datetime.now()
+            )
+        except Exception as e:
+            self.error(f"Failed to schedule the next run of {source_id}: {str(e)}")
+            updates.update({"status": "error", "lastError": str(e)})
+        # Released sources carry no lease, like sources that never ran; a
+        # completed crawl also ends the pooler's failure backoff
+        unset = ["runningUntil"]
+        if updates["status"] == "idle":
+            unset.append("failureCount")
+        self.update_source_status(source_id, updates, unset=unset)
+
+    def extend_source_lease(self, source_id: str) -> None:
+        """Heartbeat: keep the pooler counting the source as running"""
+        self.update_source_status(
+            source_id, {"runningUntil": datetime.utcnow() + RUNNING_LEASE}
+        )
+
+    def crawl(
+        self, job_id: str, deadline: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Main processing function with timeout handling
+
+        `deadline` caps the crawl when several jobs share one execution.
+        """
         start_time = datetime.utcnow()
+        time_limit = self.time_limit
+        if deadline is not None:
+            time_limit = min(time_limit, (deadline - start_time).total_seconds())
         print("Crawling")
         self.log("Processing started")
 
-        job_data = self.db.job_executions_collection.find_one({"_id": ObjectId(job_id)})
-        if not job_data:
-            raise ValueError(f"Job not found: {job_id}")
-
-        # Initialize or load metadata
-        if job_data.get("metadata") is None:
-            metadata = self.initialize_metadata(job_data)
-            self.update_job_status(job_id, {"metadata": metadata})
-        else:
-            metadata = job_data["metadata"]
-
-        # Load progress from metadata
-        progress = metadata["crawl_progress"]
-        visited = set(progress.get("visited", []))
-        to_visit = progress.get("to_visit", [(job_data["sourceUrl"], 0)])
+        job_data = None
         processed_urls = []
-        total_processed = progress.get("total_processed", 0)
-        remaining_pages = self.max_pages - total_processed
-        unique_processed_count = 0  # Counter for new articles only
-
-        domain = urlparse(job_data["sourceUrl"]).netloc
+        # The source stays running only while its job is to be continued
+        outcome, failure = "error", None
 
         try:
+            job_data = self.db.job_executions_collection.find_one({"_id": ObjectId(job_id)})
+            if not job_data:
+                raise ValueError(f"Job not found: {job_id}")
+
+            # Initialize or load metadata
+            if job_data.get("metadata") is None:
+                metadata = self.initialize_metadata(job_data)
+                self.update_job_status(job_id, {"metadata": metadata})
+            else:
+                metadata = job_data["metadata"]
+
+            # Load progress; the URL lists live in the crawl frontier, not the job
+            progress = metadata["crawl_progress"]
+            visited, to_visit = self.db.load_frontier(job_id)
+            if not visited and not to_visit:
+                # Jobs started before the frontier kept the lists in their metadata
+                visited = set(progress.get("visited", []))
+                to_visit = progress.get("to_visit", [(job_data["sourceUrl"], 0)])
+            newly_visited = set()
+            total_processed = progress.get("total_processed", 0)
+            remaining_pages = self.max_pages - total_processed
+            unique_processed_count = 0  # Counter for new articles only
+
+            domain = urlparse(job_data["sourceUrl"]).netloc
+            self.extend_source_lease(job_data["sourceId"])
+
             while to_visit and unique_processed_count < remaining_pages:
-                if (datetime.utcnow() - start_time).total_seconds() > self.time_limit:
+                if (datetime.utcnow() - start_time).total_seconds() > time_limit:
                     self.log("Time limit reached, saving progress")
                     break
 
@@ -123,6 +204,7 @@ class Crawler:
 
                 if current_url not in visited:
                     visited.add(current_url)
+                    newly_visited.add(current_url)
 
                     # Process article if it doesnt exist
                     does_article_exist = self.is_article_exists(
@@ -174,11 +256,13 @@ class Crawler:
                                 to_visit.append((link, depth + 1))
 
             new_total_processed = total_processed + len(processed_urls)
+            self.db.link_job_articles(job_id, job_data["sourceId"], processed_urls)
 
-            # Update progress data
+            # Update progress data, only counters on the job document
+            to_visit = [(url, depth) for url, depth in to_visit if url not in visited]
             execution_progress = {
-                "visited": list(visited),
-                "to_visit": to_visit,
+                "visitedCount": len(visited),
+                "toVisitCount": len(to_visit),
                 "total_processed": new_total_processed,
                 "is_completed": len(to_visit) == 0
                 or new_total_processed >= self.max_pages,
@@ -188,7 +272,7 @@ class Crawler:
 
             new_metadata = {
                 "crawl_progress": execution_progress,
-                "articleIds": metadata.get("articleIds", []) + processed_urls,
+                "articleCount": metadata.get("articleCount", 0) + len(processed_urls),
                 "last_execution_duration": (
                     datetime.utcnow() - start_time
                 ).total_seconds(),
@@ -202,26 +286,25 @@ class Crawler:
                 "metadata": new_metadata,
             }
 
+            if execution_progress["is_completed"]:
+                self.db.clear_frontier(job_id)
+            else:
+                self.db.save_frontier(
+                    job_id,
+                    newly_visited,
+                    to_visit,
+                    datetime.utcnow() + self.job_retention,
+                )
+
             if execution_progress["is_completed"]:
                 status_update.update(
                     {
                         "completedAt": datetime.utcnow(),
                         "duration": (datetime.utcnow() - start_time).total_seconds(),
+                        "expiresAt": datetime.utcnow() + self.job_retention,
                     }
                 )
-                base = datetime.now()
-                sourceId = job_data.get("sourceId", None)
-                cron_schedule = self.db.get_cron_schedule_from_sourceId(sourceId)
-                cron = croniter.croniter(cron_schedule, base)
-                next_run_at = cron.get_next(datetime)
-                self.update_source_status(
-                    job_data.get("sourceId"),
-                    {
-                        "status": "idle",
-                        "nextRunAt": next_run_at if next_run_at else None,
-                        "updatedAt": datetime.utcnow(),
-                    },
-                )
+                self.db.expire_job_articles(job_id, status_update["expiresAt"])
                 self.log("Processing completed")
 
                 # Trigger article processing function
@@ -254,7 +337,16 @@ class Crawler:
             # else:
             #     self.appwrite_client.trigger_function(job_id)
 
-            # self.update_job_status(job_id, status_update)
+            self.update_job_status(job_id, status_update)
+            self.db.record_job_stats(
+                job_data["sourceId"],
+                len(processed_urls),
+                new_metadata["last_execution_duration"],
+                "completed" if execution_progress["is_completed"] else None,
+            )
+            outcome = (
+                "completed" if execution_progress["is_completed"] else "in_progress"
+            )
 
             return {
                 "success": True,
@@ -270,28 +362,59 @@ class Crawler:
             }
 
         except Exception as e:
+            failure = str(e)
             self.error(f"Processing failed: {str(e)}")
+            if job_data is None:
+                raise
+            duration = (datetime.utcnow() - start_time).total_seconds()
+            expires_at = datetime.utcnow() + self.job_retention
             self.update_job_status(
                 job_id,
                 {
                     "status": "error",
                     "error": str(e),
                     "completedAt": datetime.utcnow(),
-                    "duration": (datetime.utcnow() - start_time).total_seconds(),
+                    "duration": duration,
+                    "expiresAt": expires_at,
                 },
             )
+            self.db.expire_job_articles(job_id, expires_at)
+            self.db.clear_frontier(job_id)
+            self.db.record_job_stats(
+                job_data["sourceId"], len(processed_urls), duration, "error"
+            )
             raise
 
+        finally:
+            # Without the job there is no source to hand back
+            source_id = job_data["sourceId"] if job_data else None
+            if source_id and outcome == "completed":
+                self.release_source(source_id, "idle")
+            elif source_id and outcome == "error":
+                self.release_source(
+                    source_id, "error", failure or "Processing interrupted"
+                )
+            elif source_id:
+                # Covers the wait for the execution continuing the job
+                self.extend_source_lease(source_id)
+
+
+# A job is not started with less time left; it goes to a new execution instead
+MIN_JOB_SECONDS = 30
+
 
 def main(context):
     """Main entry point for the function"""
     try:
         start_time = time.time()
         request_data = json.loads(context.req.body)
-        job_id = request_data.get("jobId")
+        # The pooler packs cheap sources into one execution as a list of jobs
+        job_ids = request_data.get("jobIds") or [request_data.get("jobId")]
+        job_ids = [job_id for job_id in job_ids if job_id]
 
-        if not job_id:
+        if not job_ids:
             raise ValueError("Job ID is required")
+        deadline = datetime.utcnow() + timedelta(seconds=EXECUTION_BUDGET)
 
         with MongoSession(context) as mongo_client:
             appwrite_client = AppwriteClient(context)
@@ -307,10 +430,39 @@ def main(context):
                 logger,
             )
 
-            result = crawler.crawl(job_id=job_id)
+            results = []
+            # Jobs cut short by the time limit and jobs not started yet
+            pending = []
+            for index, job_id in enumerate(job_ids):
+                remaining = (deadline - datetime.utcnow()).total_seconds()
+                if remaining < MIN_JOB_SECONDS:
+                    pending.extend(job_ids[index:])
+                    break
+                try:
+                    result = crawler.crawl(job_id=job_id, deadline=deadline)
+                except Exception as e:
+                    # The job is marked as failed; the others still get their turn
+                    result = {"success": False, "message": str(e)}
+                results.append(result)
+                if result.get("needsNextExecution"):
+                    pending.append(job_id)
+
+            if pending:
+                logger.info(f"Continuing {pending} in a new execution")
+                if not appwrite_client.trigger_jobs(pending):
+                    logger.error(f"Failed to continue {pending}")
 
         context.log(f"Execution time: {time.time() - start_time} seconds")
-        return context.res.json(result)
+        if len(job_ids) == 1 and results:
+            return context.res.json(results[0])
+        return context.res.json(
+            {
+                "success": all(result["success"] for result in results),
+                "message": f"Processed {len(results)}/{len(job_ids)} jobs",
+                "articleCount": sum(r.get("articleCount", 0) for r in results),
+                "results": results,
+            }
+        )
 
     except Exception as e:
         context.error(f"Error occurred: {str(e)}")
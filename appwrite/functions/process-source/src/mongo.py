@@ -1,6 +1,7 @@
 # create and export a mongodb session
 import pymongo
 import os
+from datetime import datetime
 from bson import ObjectId
 from .article_processor import ArticleResponse
 from typing import List
@@ -17,6 +18,13 @@ class MongoSession:
         self.sources_collection = self.db.get_collection("sources")
         self.articles_collection = self.db.get_collection("articles")
         self.job_executions_collection = self.db.get_collection("job-executions")
+        # Which articles a job execution produced, one small document each
+        self.job_execution_articles_collection = self.db.get_collection(
+            "job-execution-articles"
+        )
+        self.source_stats_collection = self.db.get_collection("source-stats")
+        # URLs crawled and still queued by unfinished jobs, one document each
+        self.crawl_frontier_collection = self.db.get_collection("crawl-frontier")
         self.context = context
 
     def __enter__(self):
@@ -33,6 +41,100 @@ class MongoSession:
             {"_id": ObjectId(job_id)}, {"$set": data}
         )
 
+    def link_job_articles(self, job_id, source_id, article_ids):
+        """Record the articles of a job execution outside the job document."""
+        if not article_ids:
+            return
+        now = datetime.utcnow()
+        self.job_execution_articles_collection.insert_many(
+            [
+                {
+                    "jobExecutionId": ObjectId(job_id),
+                    "articleId": ObjectId(article_id),
+                    "sourceId": source_id,
+                    "createdAt": now,
+                }
+                for article_id in article_ids
+            ],
+            ordered=False,
+        )
+
+    def expire_job_articles(self, job_id, expires_at):
+        """Let the article links of a finished job expire with the job itself."""
+        self.job_execution_articles_collection.update_many(
+            {"jobExecutionId": ObjectId(job_id)}, {"$set": {"expiresAt": expires_at}}
+        )
+
+    def load_frontier(self, job_id):
+        """Return the visited URLs and the queue an unfinished job left behind."""
+        visited, queued = set(), []
+        for entry in self.crawl_frontier_collection.find(
+            {"jobExecutionId": ObjectId(job_id)}
+        ):
+            if entry["visited"]:
+                visited.add(entry["url"])
+            else:
+                queued.append(entry)
+        queued.sort(key=lambda entry: entry["order"])
+        return visited, [(entry["url"], entry["depth"]) for entry in queued]
+
+    def save_frontier(self, job_id, visited, to_visit, expires_at):
+        """Store the progress of a job so its next execution resumes the crawl.
+
+        `visited` are the URLs crawled by this execution only; `to_visit` is
+        the whole queue, in crawl order, without URLs crawled before.
+        Abandoned frontiers expire at `expires_at`.
+        """
+        job_object_id = ObjectId(job_id)
+        operations = [
+            pymongo.UpdateOne(
+                {"jobExecutionId": job_object_id, "url": url},
+                {"$set": {"visited": True, "expiresAt": expires_at}},
+                upsert=True,
+            )
+            for url in visited
+        ]
+        queued = set()
+        for order, (url, depth) in enumerate(to_visit):
+            if url in visited or url in queued:
+                continue
+            queued.add(url)
+            operations.append(
+                pymongo.UpdateOne(
+                    {"jobExecutionId": job_object_id, "url": url},
+                    {
+                        "$set": {"visited": False, "order": order, "expiresAt": expires_at},
+                        "$min": {"depth": depth},
+                    },
+                    upsert=True,
+                )
+            )
+        if operations:
+            self.crawl_frontier_collection.bulk_write(operations, ordered=False)
+
+    def clear_frontier(self, job_id):
+        """Drop the frontier of a finished job."""
+        self.crawl_frontier_collection.delete_many({"jobExecutionId": ObjectId(job_id)})
+
+    def record_job_stats(self, source_id, article_count, duration, status=None):
+        """Fold one crawl execution into the per-source statistics.
+
+        The statistics outlive the raw job executions, which expire after the
+        retention period. `status` is the final status of a finished job.
+        """
+        increments = {
+            "executions": 1,
+            "articles": article_count,
+            "totalDuration": duration,
+        }
+        updates = {"lastRunAt": datetime.utcnow()}
+        if status:
+            increments[f"jobs.{status}"] = 1
+            updates["lastStatus"] = status
+        self.source_stats_collection.update_one(
+            {"_id": source_id}, {"$inc": increments, "$set": updates}, upsert=True
+        )
+
     def check_if_url_exists(self, url, category_id):
         return (
             self.articles_collection.find_one({"url": url, "categoryId": category_id})
@@ -44,8 +146,10 @@ class MongoSession:
         return source["cronSchedule"]
 
     def update_articles_with_process_data(self, articles: List[ArticleResponse]):
+        if not articles:
+            return
+        operations = []
         for article in articles:
-            self.context.log(f"Processing article {str(article)}")
             # Convert DiseaseAnalysis objects to dictionaries
             keywords_data = [
                 {
@@ -56,14 +160,25 @@ class MongoSession:
                 for analysis in article.data
             ]
 
-            self.articles_collection.update_one(
-                {"_id": ObjectId(article.article_id)},
-                {
-                    "$set": {
-                        "keywords": keywords_data,
-                        "isArticleValid": article.is_valid_article,
-                        "updatedAt": article.updated_at,
-                    }
-                },
-                upsert=True,
+            operations.append(
+                pymongo.UpdateOne(
+                    {"_id": ObjectId(article.article_id)},
+                    {
+                        "$set": {
+                            "keywords": keywords_data,
+                            "isArticleValid": article.is_valid_article,
+                            "updatedAt": article.updated_at,
+                        }
+                    },
+                    upsert=True,
+                )
             )
+
+        # One round trip for the whole batch
+        result = self.articles_collection.bulk_write(operations, ordered=False)
+        self.context.log(
+            f"Saved {len(operations)} articles "
+            f"({sum(a.is_valid_article for a in articles)} valid): "
+            f"{result.matched_count} matched, {result.modified_count} modified, "
+            f"{result.upserted_count} upserted"
+        )
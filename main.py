@@ -1,15 +1,17 @@
 import spacy
+import asyncio
 import re
 import sys
 from collections import defaultdict
 import os
 import pytesseract
-from pdf2image import convert_from_path
+from scripts.pdf_pages import iter_pdf_pages
 from scripts.find_location import find_keyword_locations, get_coords
 import pandas as pd
-from fastapi import FastAPI, Request, UploadFile, Form, File, BackgroundTasks, Body
+from fastapi import FastAPI, Request, UploadFile, Form, File, BackgroundTasks, Body, Query, HTTPException, Depends
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
@@ -17,16 +19,22 @@ import uvicorn
 import pickle
 from datetime import datetime, timedelta
 # from models.model import train_model, train_and_evaluate
-from scripts.database import connect_to_mongo, insert_record, update_text, update_data, update_status, get_all_names, get_record_by_id, get_filter_data, get_filter_data2, insert_web_data, get_filter_webdata
+from scripts.database import connect_to_mongo, insert_record, update_text, update_data, update_status, insert_web_data
+from scripts.async_database import create_client, iter_mentions, iter_record_summaries, get_record_mentions, get_record, get_mention_versions, cluster_mentions, get_rollups
+from scripts.query_cache import QueryCache, normalize_filter
 from scripts.extract_article import extract_from_url
 import pymongo
 import os
 import random
-from scripts.database import connect_to_mongo
+from scripts.database import connect_to_mongo, get_client, add_mention_listener
+from scripts.live import MentionBroker, MentionFilter
+from scripts.schema import apply_indexes
 import math
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional, Dict, Any
 import dateutil.parser
+import json
+from bson.objectid import ObjectId
 # from bson import ISODate
 
 
@@ -36,7 +44,30 @@ nlp = spacy.load("en_core_web_trf")
 KEYWORDS = ["virus", "influenza", "LSD", "covid", "fever", "pandemic", "cold"]
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create any missing news_bug indexes; existing ones are left untouched
+    for target, result in apply_indexes(get_client(), databases=['news_bug']).items():
+        print(f"Indexes {target}: {result}")
+    # One pooled async client for all request handlers
+    app.state.mongo = create_client()
+    app.state.db = app.state.mongo['news_bug']
+    # Filter results, invalidated by the mention version bumps of the writers
+    app.state.filter_cache = QueryCache(
+        max_entries=int(os.environ.get('FILTER_CACHE_SIZE', 256)),
+        ttl_seconds=float(os.environ.get('FILTER_CACHE_TTL_SECONDS', 300)),
+    )
+    # Live mentions from the change streams, or from this process's writers without a replica set
+    app.state.broker = MentionBroker(max_queued=int(os.environ.get('LIVE_MAX_QUEUED', 1000)))
+    if not await app.state.broker.start(app.state.db['mentions'], app.state.mongo['disease-data']['articles']):
+        print("Change streams unavailable, pushing only mentions written by this server")
+        add_mention_listener(app.state.broker.publish_threadsafe)
+    yield
+    await app.state.broker.stop()
+    app.state.mongo.close()
+
+
+app = FastAPI(lifespan=lifespan)
 origins = [
     "*",
 ]
@@ -46,6 +77,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 templates = Jinja2Templates(directory="templates")
@@ -77,125 +109,154 @@ class DataField(BaseModel):
 
 
 
-@app.post("/filter")
-async def filter_articles(filter_request: FilterRequest):
-    query = {}
-    date_query = {}
-    location_query = {}
+class Page:
+    """Keyset pagination and output format, shared by the list and filter endpoints."""
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=1000),
+        cursor: Optional[str] = None,
+        format: str = Query("json", pattern="^(json|ndjson)$"),
+    ):
+        if cursor is not None and not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        self.limit = limit
+        self.cursor = cursor
+        self.format = format
+
+    def query(self):
+        # One extra row tells whether there is a next page
+        return {"after": self.cursor, "limit": self.limit + 1 if self.limit else None}
+
+    @property
+    def streams(self):
+        return self.format == "ndjson" and not self.limit
+
+    async def collect(self, rows):
+        """Reads a page of (cursor, row) pairs; bounded by limit when one is given."""
+        return [(key, row) async for key, row in rows]
+
+    def render(self, page):
+        """Serializes collected rows; the next page's cursor goes in X-Next-Cursor."""
+        headers = {}
+        if self.limit and len(page) > self.limit:
+            page = page[:self.limit]
+            headers["X-Next-Cursor"] = page[-1][0]
+        items = jsonable_encoder([row for _, row in page])
+        if self.format == "ndjson":
+            body = "".join(json.dumps(item) + "\n" for item in items)
+            return Response(body, media_type="application/x-ndjson", headers=headers)
+        return JSONResponse(items, headers=headers)
+
+    async def respond(self, rows):
+        if self.streams:
+            async def lines():
+                async for _, row in rows:
+                    yield json.dumps(jsonable_encoder(row)) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+        return self.render(await self.collect(rows))
+
+
+async def filter_mentions_cached(request: Request, source: str, filter_request: FilterRequest, page: Page):
+    """Answers a filter from the result cache while the mentions it reads are unchanged."""
+    filters = filter_request.model_dump()
+    rows = lambda: iter_mentions(request.app.state.db['mentions'], source, **filters, **page.query())
+    if page.streams:
+        # Unbounded streams are never buffered, so they are not cached either
+        return await page.respond(rows())
+    versions = await get_mention_versions(request.app.state.db, source, filter_request.keywords)
+    key = (source, normalize_filter(filters), page.cursor, page.limit)
+    result = await request.app.state.filter_cache.get_or_load(key, versions, lambda: page.collect(rows()))
+    return page.render(result)
 
 
+@app.post("/filter")
+async def filter_articles(filter_request: FilterRequest, request: Request, page: Page = Depends()):
+    return await filter_mentions_cached(request, 'newspapers', filter_request, page)
 
-    
-    stage1 = {
-        '$match': {
-            'status': 'Completed'
-        }
-    }
-    stage2 = {
-        '$project': {
-            'name': 1, 
-            'date': 1, 
-            'status': 1, 
-            'data': 1
-        }
-    }
-    stage3 = {
-        '$unwind': {
-            'path': '$data'
-        }
-    }
-    stage4 = {
-        '$match': {
-        }
-    }
-    
-    if filter_request.start_date or filter_request.end_date:
-        if filter_request.start_date:
-            date_query["$gte"] = filter_request.start_date
-        if filter_request.end_date:
-            date_query["$lte"] = filter_request.end_date
-        query["date"] = date_query
-        stage1['$match']['date'] = date_query
-        
-    
-    
-    
-    if filter_request.latitude and filter_request.longitude and filter_request.radius:
-        location_query = {
-                '$geoWithin': {
-                    '$centerSphere': [
-                        [
-                            filter_request.longitude, filter_request.latitude
-                        ], filter_request.radius / 6378.1
-                    ]
-                }
-            }
-        stage4['$match']['data.location'] = location_query
-    
-    if filter_request.keywords:
-        stage4['$match']['data.keyword'] = {'$in': filter_request.keywords}
-    
-    
-    collection = connect_to_mongo()
-    results = get_filter_data2(collection=collection, stage1=stage1, stage2=stage2, stage3=stage3, stage4=stage4)
-    return results
-    
 @app.post("/webfilter")
-async def filter_webdata(filter_request: FilterRequest):
-    query = {}
-    date_query = {}
-    location_query = {}
-
-    stage1 = {
-        '$match': {
-        }
-    }
-    stage2 = {
-        '$project': {
-            'name': 1,
-            'date': 1,
-            'upload_time': 1,
-            'data': 1
-        }
-    }
-    stage3 = {
-        '$unwind': {
-            'path': '$data'
-        }
-    }
-    stage4 = {
-        '$match': {
-        }
-    }
+async def filter_webdata(filter_request: FilterRequest, request: Request, page: Page = Depends()):
+    return await filter_mentions_cached(request, 'webpages', filter_request, page)
 
-    if filter_request.start_date or filter_request.end_date:
-        if filter_request.start_date:
-            date_query["$gte"] = filter_request.start_date
-        if filter_request.end_date:
-            date_query["$lte"] = filter_request.end_date
-        query["date"] = date_query
-        stage1['$match']['date'] = date_query
-
-    if filter_request.latitude and filter_request.longitude and filter_request.radius:
-        location_query = {
-            '$geoWithin': {
-                '$centerSphere': [
-                    [
-                        filter_request.longitude, filter_request.latitude
-                    ], filter_request.radius / 6378.1
-                ]
-            }
-        }
-        stage4['$match']['data.location'] = location_query
-
-    if filter_request.keywords:
-        stage4['$match']['data.keyword'] = {'$in': filter_request.keywords}
+    
+@app.get("/clusters")
+async def get_clusters(
+    request: Request,
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22),
+    source: str = Query("newspapers", pattern="^(newspapers|webpages)$"),
+    keywords: Optional[List[str]] = Query(None),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+):
+    # min_lon > max_lon is a viewport across the antimeridian
+    if min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    return await cluster_mentions(
+        request.app.state.db['mentions'], source, min_lat, min_lon, max_lat, max_lon, zoom,
+        keywords=keywords, start_date=start_date, end_date=end_date,
+    )
+
+
+@app.get("/rollups")
+async def get_mention_rollups(
+    request: Request,
+    granularity: str = Query("day", pattern="^(day|week)$"),
+    source: str = Query("newspapers", pattern="^(newspapers|webpages|articles)$"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    keywords: Optional[List[str]] = Query(None),
+    regions: Optional[List[str]] = Query(None),
+):
+    # Analysed articles are rolled up in disease-data by the analyzer function
+    collection = (
+        request.app.state.mongo['disease-data']['mention-rollups']
+        if source == 'articles'
+        else request.app.state.db['mention_rollups']
+    )
+    return await get_rollups(collection, granularity, source, start_date, end_date, keywords, regions)
+
+
+@app.get("/mentions/live")
+async def stream_new_mentions(
+    request: Request,
+    source: str = Query("newspapers", pattern="^(newspapers|webpages|articles)$"),
+    keywords: Optional[List[str]] = Query(None),
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    radius: Optional[float] = Query(None, gt=0),
+):
+    """Server-Sent Events stream of new mentions matching the filter, instead of re-polling /filter."""
+    mention_filter = MentionFilter(
+        source,
+        {keyword.lower() for keyword in keywords} if keywords else None,
+        latitude, longitude, radius,
+    )
+    subscription = request.app.state.broker.subscribe(mention_filter)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    mention = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: mention\ndata: {json.dumps(jsonable_encoder(mention))}\n\n"
+        finally:
+            request.app.state.broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    collection = connect_to_mongo(collection_name='webpages')
-    results = get_filter_webdata(collection, stage1, stage2, stage3, stage4)
-    return results
 
-    
 @app.post("/upload_pdf")
 async def process_pdf(background_tasks: BackgroundTasks, file: UploadFile = File(...), newspaper_name: str = Form(...), date: datetime = Form(...)):
     # Create a folder to store the uploaded file
@@ -209,8 +270,6 @@ async def process_pdf(background_tasks: BackgroundTasks, file: UploadFile = File
         os.makedirs(f"uploads/{foldername}")
     if not os.path.exists(f"uploads/{foldername}/input"):
         os.makedirs(f"uploads/{foldername}/input")
-    if not os.path.exists(f"uploads/{foldername}/images"):
-        os.makedirs(f"uploads/{foldername}/images")
     if not os.path.exists(f"uploads/{foldername}/text"):
         os.makedirs(f"uploads/{foldername}/text")
     # Write the file to disk with random name pdfname=filename, 
@@ -226,26 +285,32 @@ async def submit_url(background_tasks: BackgroundTasks, url: str = Form(...), pl
 
 
 @app.get("/data/names")
-def get_all_records():
-    collection = connect_to_mongo()
-    records = get_all_names(collection)
-    records = [{**record, '_id': str(record['_id'])} for record in records]
-    return records
+async def get_all_records(request: Request, page: Page = Depends()):
+    return await page.respond(iter_record_summaries(request.app.state.db['newspapers'], **page.query()))
 
 @app.get("/data/webdata")
-def get_all_webdata():
-    collection = connect_to_mongo(collection_name='webpages')
-    records = get_all_names(collection)
-    records = [{**record, '_id': str(record['_id'])} for record in records]
-    return records
+async def get_all_webdata(request: Request, page: Page = Depends()):
+    return await page.respond(iter_record_summaries(request.app.state.db['webpages'], **page.query()))
+
+@app.get("/data/webdata/{_id}/mentions")
+async def get_webdata_mentions(_id: str, request: Request):
+    mentions = await get_record_mentions(request.app.state.db['webpages'], _id)
+    if mentions is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return mentions
+
+@app.get("/data/{_id}/mentions")
+async def get_record_data_mentions(_id: str, request: Request):
+    mentions = await get_record_mentions(request.app.state.db['newspapers'], _id)
+    if mentions is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return mentions
     
 @app.get("/data/{_id}")
-def get_record_data(_id: str):
-    collection = connect_to_mongo()
-    record = get_record_by_id(collection, _id)
+async def get_record_data(_id: str, request: Request):
+    record = await get_record(request.app.state.db['newspapers'], _id)
     if record is None:
         return {"error": "Record not found"}
-    record['id'] = record['id'].str()
     return record
 
 def process_url(url: str, platform: str):
@@ -285,10 +350,8 @@ def process_url(url: str, platform: str):
 def process_and_save_data(foldername: str, filename: str, newspaper_name: str, date: datetime):
     collection = connect_to_mongo()
     _id: str = insert_record(collection, newspaper_name, date)
-    update_status(collection, _id, "Converting to images...")
-    convert(f"uploads/{foldername}/input/{filename}", f"uploads/{foldername}/images")
     update_status(collection, _id, "Converting to text...")
-    ocr(f"uploads/{foldername}/images", textfolder=f"uploads/{foldername}/text", collection=collection, _id=_id)
+    ocr_pdf(f"uploads/{foldername}/input/{filename}", textfolder=f"uploads/{foldername}/text", collection=collection, _id=_id)
     update_status(collection, _id, "Processing data with NER...")
     data = []
     for txtfile in os.listdir(f"uploads/{foldername}/text"):
@@ -319,15 +382,17 @@ def process_and_save_data(foldername: str, filename: str, newspaper_name: str, d
     print("Completed")
     print(df)
 
-def ocr(folderpath: str, textfolder: str, collection: pymongo.collection.Collection, _id: str):
-    print(f"OCR on folder: {folderpath}")
-    for filename in os.listdir(folderpath):
-        if filename.endswith(".jpg"):
-            print(f"Performing OCR on: {filename}")
-            page_text = pytesseract.image_to_string(os.path.join(folderpath, filename))
-            update_text(collection, _id, filename, page_text)
-            with open(f"{textfolder}/{os.path.splitext(os.path.basename(filename))[0]}.txt", "w") as f:
-                f.write(page_text)
+def ocr_pdf(filepath: str, textfolder: str, collection: Optional[pymongo.collection.Collection] = None, _id: Optional[str] = None):
+    print(f"OCR on pdf: {filepath}")
+    # Each page goes to OCR as soon as it is rendered; only one is held in memory
+    for i, image in enumerate(iter_pdf_pages(filepath)):
+        print(f"Performing OCR on page: {i}")
+        page_text = pytesseract.image_to_string(image)
+        if collection is not None:
+            # Same page names as the images the pages used to be saved as
+            update_text(collection, _id, f"page{i}.jpg", page_text)
+        with open(f"{textfolder}/page{i}.txt", "w") as f:
+            f.write(page_text)
 
 def preprocess_text(text):
     """
@@ -357,28 +422,12 @@ def group_paragraphs(preprocessed_paragraphs):
     return grouped_paragraphs
 
 
-def convert(filepath: str, img_destination_folder: str):
-    print(filepath)
-    filename = os.path.splitext(os.path.basename(filepath))[0]
-    print(f"Converting pdf: {filename}")
-    images = convert_from_path(filepath)
-
-    print(f"PDF converted: {filename} done")
-    for i in range(len(images)):
-        images[i].save(img_destination_folder + "/page" + str(i) + ".jpg", "JPEG")
-    print(f"Images saved to: {img_destination_folder}")
-    # clear memory after converting
-    del images
-
-
 def main(folder_path: str):
     # List of all pdf in this folder
     files = [f for f in os.listdir(folder_path) if f.endswith(".pdf")]
     # Iterate over each file
     if not os.path.exists("text"):
         os.makedirs("text")
-    if not os.path.exists("images"):
-        os.makedirs("images")
     if not os.path.exists("data"):
         os.makedirs("data")
     
@@ -386,12 +435,10 @@ def main(folder_path: str):
         filepath = os.path.join(folder_path, file)
         # create folder text/filename if not exists
         filename = os.path.splitext(file)[0]
-        img_destination_folder = "images/" + filename
-        if not os.path.exists("images/" + filename):
-            os.makedirs("images/" + filename)
-        # Convert pdf to images
-        convert(filepath, img_destination_folder)
-        ocr(img_destination_folder, pdfname=filename)
+        if not os.path.exists("text/" + filename):
+            os.makedirs("text/" + filename)
+        # Pages are rendered and OCRed one at a time, without image files
+        ocr_pdf(filepath, f"text/{filename}")
         data = []
         for txtfile in os.listdir(f"text/{filename}"):
             ocrtext = ""
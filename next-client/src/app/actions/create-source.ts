@@ -59,7 +59,6 @@ export async function createSource(prevState: FormState, formData: FormData): Pr
         const sourceDocument = {
             ...validatedFields.data,
             status: 'idle' as const,
-            jobExecutionIds: [] as Array<string>,
             createdAt: now,
             updatedAt: now,
             lastRunAt: null,
@@ -91,7 +90,6 @@ export async function createSource(prevState: FormState, formData: FormData): Pr
             nextRunAt: source.nextRunAt ? source.nextRunAt.toISOString() : null,
             lastError: source.lastError,
             status: source.status,
-            jobExecutionIds: source.jobExecutionIds,
         }));
 
         return {
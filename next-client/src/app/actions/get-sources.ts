@@ -1,7 +1,7 @@
 'use server';
 
 import db from "@/lib/mongodb";
-import { Source } from "@/lib/types/souces";
+import { Source, SourceStats } from "@/lib/types/souces";
 
 interface Props {
     categoryId: string;
@@ -10,7 +10,14 @@ interface Props {
 export const getSources = async ({ categoryId }: Props) => {
     try {
         const sources = db.collection("sources");
-        const result: Source[] = (await sources.find({ categoryId }).toArray()).map((doc) => ({
+        const docs = await sources.find({ categoryId }).toArray();
+        // Job history is summarised per source instead of kept on the source document
+        const stats = await db
+            .collection<SourceStats & { _id: string }>("source-stats")
+            .find({ _id: { $in: docs.map((doc) => doc._id.toString()) } })
+            .toArray();
+        const statsById = new Map(stats.map(({ _id, ...rest }) => [_id, rest]));
+        const result: Source[] = docs.map((doc) => ({
             _id: doc._id.toString(),
             title: doc.title,
             url: doc.url,
@@ -23,7 +30,7 @@ export const getSources = async ({ categoryId }: Props) => {
             nextRunAt: doc.nextRunAt,
             lastError: doc.lastError,
             status: doc.status,
-            jobExecutionIds: doc.jobExecutionIds
+            stats: statsById.get(doc._id.toString())
         }));
         return { success: true, data: result };
     } catch (e: any) {
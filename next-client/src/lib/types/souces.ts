@@ -1,3 +1,12 @@
+export interface SourceStats {
+    executions: number;
+    articles: number;
+    totalDuration: number;
+    jobs: { completed?: number; error?: number };
+    lastRunAt: string | null;
+    lastStatus?: string;
+}
+
 export interface Source {
     _id: string;
     title: string;
@@ -11,5 +20,5 @@ export interface Source {
     nextRunAt: string;
     lastError: string | null;
     status: 'idle' | 'running' | 'error';
-    jobExecutionIds: string[];
+    stats?: SourceStats;
 }
\ No newline at end of file
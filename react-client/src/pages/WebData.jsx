@@ -43,8 +43,21 @@ const WebData = () => {
     fetchData();
   }, []);
 
-  const handleNewspaperClick = (newspaper) => {
-    setSelectedNewspaper(newspaper);
+  const handleNewspaperClick = async (newspaper) => {
+    // The listing only carries counts; mentions are loaded per newspaper
+    try {
+      const backend_url = import.meta.env.VITE_BACKEND_URL;
+      const response = await fetch(
+        `${backend_url}/data/webdata/${newspaper._id}/mentions`
+      );
+      if (!response.ok) {
+        throw new Error("Can't fetch mentions for this newspaper");
+      }
+      const data = await response.json();
+      setSelectedNewspaper({ ...newspaper, data });
+    } catch (error) {
+      setError(error.message);
+    }
   };
 
   return (
@@ -80,7 +93,7 @@ const WebData = () => {
                 onClick={() => handleNewspaperClick(newspaper)}
               >
                 {newspaper.name} - {ISODate(newspaper.date)} <br />
-                {newspaper.status}
+                {newspaper.status} ({newspaper.mention_count} mentions)
               </li>
             ))}
           </ul>
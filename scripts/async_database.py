@@ -0,0 +1,407 @@
+import math
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, TypedDict
+import pymongo
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from .query_cache import version_key
+from .geo_grid import cell_size, geohash_from_cell, precision_for_zoom
+
+EARTH_RADIUS_KM = 6378.1
+# Longitude between the vertices of a viewport's north and south edges
+VIEWPORT_EDGE_STEP = 5
+# Widest polygon a viewport is queried with, in degrees of longitude
+VIEWPORT_MAX_SPAN = 90
+
+
+class MentionRecord(TypedDict):
+    """One keyword mention of a newspaper or webpage, as served by /filter."""
+
+    _id: str
+    name: str
+    paper_name: str
+    date: str
+    keyword: str
+    address: str
+    page: str
+    paragraph: str
+    latitude: float
+    longitude: float
+
+
+def create_client(mongo_uri: Optional[str] = None) -> AsyncIOMotorClient:
+    """Creates the pooled Motor client shared by every request.
+
+    Args:
+        mongo_uri (str, optional): Connection string. Defaults to MONGO_URI.
+
+    Returns:
+        AsyncIOMotorClient: The client; create it once per process and close it on shutdown.
+    """
+    mongo_uri = mongo_uri or os.environ.get('MONGO_URI') or "mongodb://127.0.0.1:27017/"
+    return AsyncIOMotorClient(
+        mongo_uri,
+        maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+        minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+    )
+
+
+def _mention_query(
+    source: str,
+    keywords: Optional[List[str]],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    latitude: Optional[float],
+    longitude: Optional[float],
+    radius: Optional[float],
+) -> Dict[str, Any]:
+    """Builds a query on the mentions collection, served by its compound indexes."""
+    query: Dict[str, Any] = {'source': source}
+    if keywords:
+        query['keyword'] = {'$in': keywords}
+    if latitude and longitude and radius:
+        query['location'] = {
+            '$geoWithin': {
+                '$centerSphere': [[longitude, latitude], radius / EARTH_RADIUS_KM]
+            }
+        }
+    if start_date or end_date:
+        date_query = {}
+        if start_date:
+            date_query['$gte'] = start_date
+        if end_date:
+            date_query['$lte'] = end_date
+        query['date'] = date_query
+    return query
+
+
+def _after(query: Dict[str, Any], after: Optional[str]) -> Dict[str, Any]:
+    """Restricts a query to documents past a keyset cursor (raises InvalidId if malformed)."""
+    if after:
+        query = {**query, '_id': {'$gt': ObjectId(after)}}
+    return query
+
+
+def _paged(cursor, after: Optional[str], limit: Optional[int]):
+    # Keyset pagination walks _id in order; plain reads keep natural order
+    if after or limit:
+        cursor = cursor.sort('_id', pymongo.ASCENDING)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def _to_mention(mention: Dict[str, Any]) -> MentionRecord:
+    return {
+        '_id': str(mention['recordId']),
+        'name': mention['name'],
+        'paper_name': mention['name'],
+        'date': mention['date'].strftime("%d-%m-%Y"),
+        'keyword': mention['keyword'],
+        'address': mention['address'],
+        'page': mention['page'],
+        'paragraph': mention['paragraph'],
+        'latitude': mention['location']['coordinates'][1],
+        'longitude': mention['location']['coordinates'][0],
+    }
+
+
+async def iter_mentions(
+    collection: AsyncIOMotorCollection,
+    source: str,
+    keywords: Optional[List[str]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    radius: Optional[float] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, MentionRecord]]:
+    """Streams keyword mentions matching the filter from the flattened mentions collection.
+
+    Args:
+        collection (AsyncIOMotorCollection): The mentions collection.
+        source (str): 'newspapers' or 'webpages'.
+        keywords (list, optional): Keep only these keywords.
+        start_date (datetime, optional): Earliest record date.
+        end_date (datetime, optional): Latest record date.
+        latitude (float, optional): Centre of the search circle.
+        longitude (float, optional): Centre of the search circle.
+        radius (float, optional): Radius of the search circle in km.
+        after (str, optional): Cursor returned with the previous page.
+        limit (int, optional): Maximum number of mentions.
+
+    Yields:
+        tuple: The mention's cursor and its MentionRecord, as the cursor produces them.
+    """
+    query = _after(_mention_query(source, keywords, start_date, end_date, latitude, longitude, radius), after)
+    async for mention in _paged(collection.find(query), after, limit):
+        yield str(mention['_id']), _to_mention(mention)
+
+
+def _viewport_polygon(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Dict[str, Any]:
+    """GeoJSON polygon of a viewport that does not cross the antimeridian.
+
+    GeoJSON edges are geodesic, so the north and south edges get a vertex
+    every VIEWPORT_EDGE_STEP degrees to keep them close to the parallels
+    shown on screen.
+    """
+    steps = max(1, math.ceil((max_lon - min_lon) / VIEWPORT_EDGE_STEP))
+    lons = [min_lon + (max_lon - min_lon) * i / steps for i in range(steps + 1)]
+    ring = [[lon, min_lat] for lon in lons] + [[lon, max_lat] for lon in reversed(lons)]
+    ring.append(ring[0])
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+def _viewport_filter(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Dict[str, Any]:
+    """Query on location matching a map viewport, using the 2dsphere index.
+
+    A viewport with min_lon > max_lon crosses the antimeridian and is split
+    at it. Each side is cut into polygons at most VIEWPORT_MAX_SPAN degrees
+    wide, as a single polygon must stay within one hemisphere.
+    """
+    spans = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180), (-180, max_lon)]
+    conditions = []
+    for west, east in spans:
+        parts = max(1, math.ceil((east - west) / VIEWPORT_MAX_SPAN))
+        for i in range(parts):
+            polygon = _viewport_polygon(min_lat, west + (east - west) * i / parts, max_lat, west + (east - west) * (i + 1) / parts)
+            conditions.append({'location': {'$geoWithin': {'$geometry': polygon}}})
+    return conditions[0] if len(conditions) == 1 else {'$or': conditions}
+
+
+async def cluster_mentions(
+    collection: AsyncIOMotorCollection,
+    source: str,
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    zoom: int,
+    keywords: Optional[List[str]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Counts the mentions inside a viewport per geohash cell and keyword.
+
+    The cells are sized from the zoom level, so the number of clusters depends
+    on the viewport rather than on the number of mentions.
+
+    Args:
+        collection (AsyncIOMotorCollection): The mentions collection.
+        source (str): 'newspapers' or 'webpages'.
+        min_lat (float): South edge of the viewport.
+        min_lon (float): West edge of the viewport; east of max_lon when the
+            viewport crosses the antimeridian.
+        max_lat (float): North edge of the viewport.
+        max_lon (float): East edge of the viewport.
+        zoom (int): Web map zoom level.
+        keywords (list, optional): Keep only these keywords.
+        start_date (datetime, optional): Earliest record date.
+        end_date (datetime, optional): Latest record date.
+
+    Returns:
+        dict: The geohash precision and one cluster per non-empty cell, with its
+            total count, mean position and count per keyword.
+    """
+    precision = precision_for_zoom(zoom)
+    width, height = cell_size(precision)
+    query = _mention_query(source, keywords, start_date, end_date, None, None, None)
+    query.update(_viewport_filter(min_lat, min_lon, max_lat, max_lon))
+
+    pipeline = [
+        {'$match': query},
+        {
+            '$project': {
+                'keyword': 1,
+                'lon': {'$arrayElemAt': ['$location.coordinates', 0]},
+                'lat': {'$arrayElemAt': ['$location.coordinates', 1]},
+            }
+        },
+        {
+            '$group': {
+                '_id': {
+                    'x': {'$floor': {'$divide': [{'$add': ['$lon', 180]}, width]}},
+                    'y': {'$floor': {'$divide': [{'$add': ['$lat', 90]}, height]}},
+                    'keyword': '$keyword',
+                },
+                'count': {'$sum': 1},
+                'lon': {'$sum': '$lon'},
+                'lat': {'$sum': '$lat'},
+            }
+        },
+        {
+            '$group': {
+                '_id': {'x': '$_id.x', 'y': '$_id.y'},
+                'count': {'$sum': '$count'},
+                'lon': {'$sum': '$lon'},
+                'lat': {'$sum': '$lat'},
+                'keywords': {'$push': {'keyword': '$_id.keyword', 'count': '$count'}},
+            }
+        },
+    ]
+    clusters = []
+    async for cell in collection.aggregate(pipeline):
+        clusters.append({
+            'geohash': geohash_from_cell(int(cell['_id']['x']), int(cell['_id']['y']), precision),
+            'count': cell['count'],
+            'latitude': cell['lat'] / cell['count'],
+            'longitude': cell['lon'] / cell['count'],
+            'keywords': sorted(cell['keywords'], key=lambda k: k['count'], reverse=True),
+        })
+    return {'precision': precision, 'clusters': clusters}
+
+
+async def get_rollups(
+    collection: AsyncIOMotorCollection,
+    granularity: str,
+    source: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    keywords: Optional[List[str]] = None,
+    regions: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Reads daily or weekly mention buckets; no mention or article is touched.
+
+    Args:
+        collection (AsyncIOMotorCollection): The rollups collection.
+        granularity (str): 'day' or 'week'.
+        source (str): 'newspapers', 'webpages' or 'articles'.
+        start_date (datetime, optional): Earliest bucket start.
+        end_date (datetime, optional): Latest bucket start.
+        keywords (list, optional): Keep only these keywords.
+        regions (list, optional): Keep only these regions.
+
+    Returns:
+        list: Buckets ordered by keyword and period, with mention and case counts.
+    """
+    query: Dict[str, Any] = {'granularity': granularity, 'source': source}
+    if keywords:
+        query['keyword'] = {'$in': [keyword.lower() for keyword in keywords]}
+    if start_date or end_date:
+        query['period'] = {}
+        if start_date:
+            query['period']['$gte'] = start_date
+        if end_date:
+            query['period']['$lte'] = end_date
+    if regions:
+        query['region'] = {'$in': [" ".join(region.split()).lower() for region in regions]}
+    projection = {'_id': 0, 'period': 1, 'keyword': 1, 'region': 1, 'mentions': 1, 'caseCount': 1}
+    cursor = collection.find(query, projection).sort([('keyword', pymongo.ASCENDING), ('period', pymongo.ASCENDING)])
+    return [bucket async for bucket in cursor if bucket['mentions'] > 0]
+
+
+async def get_mention_versions(db: AsyncIOMotorDatabase, source: str, keywords: Optional[List[str]] = None) -> Tuple:
+    """Versions of the mentions a filter reads, as bumped by database.bump_mention_versions.
+
+    Args:
+        db (AsyncIOMotorDatabase): The news_bug database.
+        source (str): 'newspapers' or 'webpages'.
+        keywords (list, optional): The filter's keywords; all mentions when empty.
+
+    Returns:
+        tuple: Versions to validate a cached result against.
+    """
+    versions = await db['mention_versions'].find_one({'_id': source}) or {}
+    if not keywords:
+        return ('*', versions.get('version', 0))
+    counters = versions.get('keywords', {})
+    return tuple(counters.get(version_key(keyword), 0) for keyword in sorted(set(keywords)))
+
+
+async def iter_record_summaries(
+    collection: AsyncIOMotorCollection,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Streams a lightweight listing of records: name, dates, status and mention count.
+
+    The page texts and mention paragraphs never leave the server; the listing
+    is projected by the aggregation pipeline.
+
+    Args:
+        collection (AsyncIOMotorCollection): The newspapers or webpages collection.
+        after (str, optional): Cursor returned with the previous page.
+        limit (int, optional): Maximum number of records.
+
+    Yields:
+        tuple: The record's cursor and its summary.
+    """
+    pipeline: List[Dict[str, Any]] = [{'$match': _after({}, after)}]
+    if after or limit:
+        pipeline.append({'$sort': {'_id': pymongo.ASCENDING}})
+    if limit:
+        pipeline.append({'$limit': limit})
+    pipeline.append({
+        '$project': {
+            '_id': {'$toString': '$_id'},
+            'name': 1,
+            'date': 1,
+            'upload_time': 1,
+            'status': 1,
+            'mention_count': {'$size': {'$ifNull': ['$data', []]}},
+        }
+    })
+    async for summary in collection.aggregate(pipeline):
+        yield summary['_id'], summary
+
+
+async def get_record_mentions(collection: AsyncIOMotorCollection, _id: str) -> Optional[List[Dict[str, Any]]]:
+    """Retrieves the keyword mentions of one record, coordinates split out by the pipeline.
+
+    Args:
+        collection (AsyncIOMotorCollection): The newspapers or webpages collection.
+        _id (str): The ID of the record.
+
+    Returns:
+        list: The mentions, or None if the ID is unknown or malformed.
+    """
+    if not ObjectId.is_valid(_id):
+        return None
+    pipeline = [
+        {'$match': {'_id': ObjectId(_id)}},
+        {
+            '$project': {
+                '_id': 0,
+                'data': {
+                    '$map': {
+                        'input': {'$ifNull': ['$data', []]},
+                        'as': 'mention',
+                        'in': {
+                            'keyword': '$$mention.keyword',
+                            'address': '$$mention.address',
+                            'page': '$$mention.page',
+                            'paragraph': '$$mention.paragraph',
+                            'latitude': {'$arrayElemAt': ['$$mention.location.coordinates', 1]},
+                            'longitude': {'$arrayElemAt': ['$$mention.location.coordinates', 0]},
+                        },
+                    }
+                },
+            }
+        },
+    ]
+    async for record in collection.aggregate(pipeline):
+        return record['data']
+    return None
+
+
+async def get_record(collection: AsyncIOMotorCollection, _id: str) -> Optional[Dict[str, Any]]:
+    """Retrieves a record by ID.
+
+    Args:
+        collection (AsyncIOMotorCollection): The connected collection.
+        _id (str): The ID of the record.
+
+    Returns:
+        dict: The record with a string id, or None if the ID is unknown or malformed.
+    """
+    try:
+        record = await collection.find_one({"_id": ObjectId(_id)})
+    except InvalidId:
+        return None
+    if record is not None:
+        record['_id'] = str(record['_id'])
+    return record
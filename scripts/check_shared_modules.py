@@ -0,0 +1,52 @@
+"""Checks that the modules shared with the Appwrite functions are identical.
+
+Each Appwrite function is deployed from its own directory and cannot import
+from scripts/, so the modules both sides need are kept as copies. Edit the
+scripts/ version and run with --fix to copy it over.
+
+    python -m scripts.check_shared_modules [--fix]
+"""
+import argparse
+import filecmp
+import os
+import shutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# scripts/ module -> its copies, relative to the repository root
+SHARED_MODULES = {
+    'scripts/gazetteer.py': ['appwrite/functions/analyse-article/src/gazetteer.py'],
+    'scripts/rollups.py': ['appwrite/functions/analyse-article/src/rollups.py'],
+}
+
+
+def out_of_sync(root=ROOT):
+    """Lists the copies that differ from their scripts/ module.
+
+    Args:
+        root (str, optional): Repository root. Defaults to this checkout.
+
+    Returns:
+        list: (module, copy) pairs of relative paths.
+    """
+    return [
+        (module, copy)
+        for module, copies in SHARED_MODULES.items()
+        for copy in copies
+        if not filecmp.cmp(os.path.join(root, module), os.path.join(root, copy), shallow=False)
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the modules shared with the Appwrite functions')
+    parser.add_argument('--fix', action='store_true', help='Overwrite the copies with the scripts/ modules')
+    args = parser.parse_args()
+
+    stale = out_of_sync()
+    for module, copy in stale:
+        if args.fix:
+            shutil.copyfile(os.path.join(ROOT, module), os.path.join(ROOT, copy))
+            print(f"Copied {module} -> {copy}")
+        else:
+            print(f"{copy} differs from {module}")
+    raise SystemExit(1 if stale and not args.fix else 0)
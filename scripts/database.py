@@ -2,11 +2,46 @@ import pymongo
 import os
 import datetime
 import pymongo
-from bson.objectid import ObjectId
+import hashlib
+import json
+from functools import lru_cache
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
+from .query_cache import version_key
+from .rollups import rollup_operations
 
 load_dotenv()
 
+# Called with (source, mention documents) with the mentions new to each write_mentions
+_mention_listeners = []
+
+
+def add_mention_listener(listener):
+    """Registers a callable notified of the mentions written by this process.
+
+    Args:
+        listener (callable): Called with the source name and the mention documents
+            a write inserted; mentions it left unchanged are not passed again.
+
+    Returns:
+        None
+    """
+    _mention_listeners.append(listener)
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Returns the process-wide MongoDB client for the MONGO_URI environment variable.
+
+    The client is created once and pools its connections, so background tasks
+    share it instead of opening a new connection each time.
+
+    Returns:
+        pymongo.MongoClient: The MongoDB client.
+    """
+    MONGO_URL = os.environ.get('MONGO_URI') or "mongodb://127.0.0.1:27017/"
+    return pymongo.MongoClient(MONGO_URL)
+
+
 def connect_to_mongo(database_name='news_bug', collection_name='newspapers'):
     """Connects to a MongoDB database.
 
@@ -18,8 +53,7 @@ def connect_to_mongo(database_name='news_bug', collection_name='newspapers'):
         pymongo.collection.Collection: The connected MongoDB collection.
     """
 
-    MONGO_URL = os.environ.get('MONGO_URI') or "mongodb://127.0.0.1:27017/"
-    client = pymongo.MongoClient(MONGO_URL)  
+    client = get_client()
     db = client[database_name]
     collection = db[collection_name]
     return collection
@@ -64,6 +98,7 @@ def insert_web_data(collection, data):
     # record['pages'] = []
     record['data'] = data['data']
     _id = collection.insert_one(record).inserted_id
+    write_mentions(collection, _id, record['name'], record['date'], record['data'])
     return _id
 
 def update_text(collection, _id, page_no, text):
@@ -102,6 +137,8 @@ def update_data(collection, _id, data):
         {"_id": _id},
         {"$set": {"data": data, "status": "Completed"}}
     )
+    record = collection.find_one({"_id": _id}, {"name": 1, "date": 1})
+    write_mentions(collection, _id, record['name'], record['date'], data)
 
 def update_status(collection, _id, status):
     """Updates the status of a record in the MongoDB collection.
@@ -131,96 +168,139 @@ def get_predictions(collection):
     """
     return list(collection.find())
 
-def get_all_names(collection):
-    """Retrieves all newspaper names from the MongoDB collection.
+def _has_point(element):
+    coordinates = (element.get("location") or {}).get("coordinates") or []
+    return len(coordinates) == 2 and all(isinstance(c, (int, float)) for c in coordinates)
+
+
+def mention_key(document):
+    """Identifies a mention by its content, so rewriting an unchanged record is a no-op.
 
     Args:
-        collection (pymongo.collection.Collection): The connected MongoDB collection.
+        document (dict): The mention document, without its _id.
 
     Returns:
-        list: A list of all newspaper names in the collection.
+        str: Hex digest of the mention fields.
     """
-    data = list(collection.find({}, {"pages": 0}))
-    print("Here")
-    def convert(element):
-        return {
+    fields = {k: document[k] for k in ("name", "date", "keyword", "address", "location", "page", "paragraph")}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def write_mentions(collection, _id, name, date, data, backfill=False):
+    """Replaces the flattened mentions of a record in the mentions collection.
+
+    Every keyword mention becomes one document, so the filters can be served
+    from the mentions indexes instead of unwinding every record. Mentions the
+    record still has are left in place; only the new ones are inserted, so
+    the change stream and the listeners see each mention once.
+
+    Args:
+        collection (pymongo.collection.Collection): The newspapers or webpages collection.
+        _id (ObjectId): The ID of the record.
+        name (str): The newspaper or webpage name.
+        date (datetime): The date of the record.
+        data (list): The keyword mentions of the record.
+        backfill (bool, optional): Tag the inserted mentions as rebuilt rather
+            than new, so they are not pushed to live subscribers. Defaults to False.
+
+    Returns:
+        int: The number of mentions the record has.
+    """
+    mentions = collection.database['mentions']
+    previous = {
+        d.get("key", d["_id"]): d
+        for d in mentions.find({"recordId": _id}, {"key": 1, "keyword": 1, "address": 1, "date": 1})
+    }
+    documents = {}
+    for element in data:
+        # Mentions without coordinates cannot go into a 2dsphere index
+        if not _has_point(element):
+            continue
+        document = {
+            "source": collection.name,
+            "recordId": _id,
+            "name": name,
+            "date": date,
             "keyword": element["keyword"],
             "address": element["address"],
+            "location": element["location"],
             "page": element["page"],
             "paragraph": element["paragraph"],
-            "latitude": element["location"]["coordinates"][1],
-            "longitude": element["location"]["coordinates"][0],
         }
-    for item in data:
-        items = []
-        for element in item["data"]:
-            items.append(convert(element))
-        item["data"] = items
-    # data = [item.data = convert(element) for item in data for element in item.data]
-    return data
+        document["key"] = mention_key(document)
+        documents[document["key"]] = document
+
+    removed = [d for key, d in previous.items() if key not in documents]
+    added = [d for key, d in documents.items() if key not in previous]
+    if removed:
+        mentions.delete_many({"_id": {"$in": [d["_id"] for d in removed]}})
+    if added:
+        if backfill:
+            for document in added:
+                document["backfill"] = True
+        try:
+            mentions.insert_many(added, ordered=False)
+        except BulkWriteError as error:
+            # A concurrent write of the same record inserted these already
+            failed = {e["index"] for e in error.details["writeErrors"] if e["code"] == 11000}
+            if len(failed) < len(error.details["writeErrors"]):
+                raise
+            added = [d for i, d in enumerate(added) if i not in failed]
+        if not backfill:
+            for listener in _mention_listeners:
+                listener(collection.name, added)
+
+    # Move the daily/weekly buckets by the difference to the previous mentions
+    rollups = rollup_operations(
+        collection.name,
+        added=[(d["date"], d["keyword"], d["address"], 0) for d in added],
+        removed=[(d["date"], d["keyword"], d.get("address"), 0) for d in removed],
+    )
+    if rollups:
+        collection.database['mention_rollups'].bulk_write(rollups, ordered=False)
+    if added or removed:
+        bump_mention_versions(
+            collection.database, collection.name, [d["keyword"] for d in removed + added]
+        )
+    return len(documents)
 
-def get_record_by_id(collection, _id):
-    """Retrieves a record from the MongoDB collection by ID.
+
+def bump_mention_versions(db, source, keywords):
+    """Marks the mentions of a source as changed, invalidating cached filter results.
+
+    Results of filters on these keywords, and of unfiltered queries, are
+    recomputed on their next request; other cached keyword filters stay valid.
 
     Args:
-        collection (pymongo.collection.Collection): The connected MongoDB collection.
-        _id (str): The ID of the record.
+        db (pymongo.database.Database): The news_bug database.
+        source (str): 'newspapers' or 'webpages'.
+        keywords (list): Keywords whose mentions were added or removed.
 
     Returns:
-        dict: The record with the given ID.
+        None
     """
-    return collection.find_one({"_id": ObjectId(_id)})
+    increments = {"version": 1}
+    increments.update({f"keywords.{version_key(keyword)}": 1 for keyword in set(keywords)})
+    db['mention_versions'].update_one({"_id": source}, {"$inc": increments}, upsert=True)
 
-def get_filter_data(collection, query, projection=None):
-    """Retrieves records from the MongoDB collection based on a query.
+
+def rebuild_mentions(client, database_name='news_bug'):
+    """Rebuilds the mentions collection from the newspapers and webpages records.
+
+    Mentions already stored are kept and the rebuilt ones are tagged as a
+    backfill, so live subscribers are not sent the whole history again.
 
     Args:
-        collection (pymongo.collection.Collection): The connected MongoDB collection.
-        query (dict): The query to filter records.
-        projection (dict): The projection to filter fields.
+        client (pymongo.MongoClient): Connected client.
+        database_name (str, optional): Name of the database. Defaults to 'news_bug'.
 
     Returns:
-        list: A list of records that match the query.
+        int: The number of mentions the records have.
     """
-    data = list(collection.find(query, projection))
-    return data
-
-
-def get_filter_data2(collection, stage1, stage2, stage3, stage4):
-
-    pipeline = [stage1, stage2, stage3, stage4]
-    print(pipeline)
-    data = collection.aggregate(pipeline)
-    results = []
-    for item in data:
-        item['_id'] = item['_id'].__str__()
-        item["keyword"] = item["data"]["keyword"]
-        item["address"] = item["data"]["address"]
-        item["page"] = item["data"]["page"]
-        item["paragraph"] = item["data"]["paragraph"]
-        item["latitude"] = item["data"]["location"]["coordinates"][1]
-        item["longitude"] = item["data"]["location"]["coordinates"][0]
-        del item["data"]
-        item['paper_name'] = item['name']
-        item['date'] = item['date'].strftime("%d-%m-%Y")
-        results.append(item)
-    return results
-
-def get_filter_webdata(collection, stage1, stage2, stage3, stage4):
-    pipeline = [stage1, stage2, stage3, stage4]
-    print(pipeline)
-    data = collection.aggregate(pipeline)
-    results = []
-    for item in data:
-        item['_id'] = item['_id'].__str__()
-        item["keyword"] = item["data"]["keyword"]
-        item["address"] = item["data"]["address"]
-        item["page"] = item["data"]["page"]
-        item["paragraph"] = item["data"]["paragraph"]
-        item["latitude"] = item["data"]["location"]["coordinates"][1]
-        item["longitude"] = item["data"]["location"]["coordinates"][0]
-        del item["data"]
-        item['paper_name'] = item['name']
-        item['date'] = item['date'].strftime("%d-%m-%Y")
-        results.append(item)
-    return results
\ No newline at end of file
+    db = client[database_name]
+    total = 0
+    for collection_name, query in (('newspapers', {'status': 'Completed'}), ('webpages', {})):
+        collection = db[collection_name]
+        for record in collection.find(query, {"name": 1, "date": 1, "data": 1}):
+            total += write_mentions(collection, record['_id'], record['name'], record['date'], record.get('data', []), backfill=True)
+    return total
@@ -3,6 +3,8 @@ from spacy.matcher import Matcher
 import geopy.distance
 from geopy.geocoders import Nominatim
 import re
+from functools import lru_cache
+from .gazetteer import load_gazetteer
 
 geolocator = Nominatim(user_agent="Disease-Location-Extraction")
 nlp = spacy.load("en_core_web_trf")
@@ -38,8 +40,18 @@ matcher.add("LOCATION", location_patterns)
 #   return locations
         
 
+@lru_cache(maxsize=1)
+def get_gazetteer():
+    # Offline index from $GAZETTEER_PATH, None when it was not built
+    return load_gazetteer()
+
+
 #   Add geocoding if desired
 def get_coords(location_text):
+    gazetteer = get_gazetteer()
+    entry = gazetteer.lookup(location_text) if gazetteer and location_text else None
+    if entry:
+        return entry.name, entry.latitude, entry.longitude
     location = geolocator.geocode(location_text)
     if location:
         return location.address, location.latitude, location.longitude
@@ -0,0 +1,315 @@
+# Shared module: kept byte-identical in scripts/ and in the analyse-article
+# function, which is deployed on its own. Check with
+# `python -m scripts.check_shared_modules`.
+"""
+Offline gazetteer: resolves well-known place names without a network call.
+
+The index is built once from a GeoNames-style dump (tab separated "geoname"
+table, e.g. cities15000.txt or a filtered allCountries.txt):
+
+    python -m scripts.gazetteer cities15000.txt allCountries.txt -o gazetteer.idx
+
+(`python -m src.gazetteer` from the analyse-article function directory)
+
+and is memory-mapped at runtime. Names are stored sorted, so exact lookups and
+prefix searches are binary searches over the mapped file. A name shared by
+several places keeps its few most populous candidates, weighted so countries
+beat regions and regions beat towns; "Paris, Texas" style qualifiers pick among
+them and the heaviest candidate wins otherwise.
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import re
+import struct
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+MAGIC = b"GZT1"
+# magic, entry count, key blob size, display name blob size
+HEADER = struct.Struct("<4sIII")
+OFFSET = struct.Struct("<I")
+# latitude, longitude, population, display name offset, display name length,
+# country code, kind
+RECORD = struct.Struct("<ffIIH2sB3x")
+
+PLACE, REGION, COUNTRY = 0, 1, 2
+# Candidates kept per name
+MAX_CANDIDATES = 5
+# Population multiplier used to disambiguate names shared by several places
+KIND_WEIGHT = {PLACE: 1, REGION: 5, COUNTRY: 50}
+
+# GeoNames column positions
+NAME, ASCIINAME, ALTERNATENAMES = 1, 2, 3
+LATITUDE, LONGITUDE = 4, 5
+FEATURE_CLASS, FEATURE_CODE, COUNTRY_CODE, POPULATION = 6, 7, 8, 14
+
+
+class GazetteerEntry(NamedTuple):
+    name: str
+    country_code: str
+    latitude: float
+    longitude: float
+    population: int
+    kind: int
+
+
+def normalize_name(name: str) -> str:
+    """Index key: accents stripped, case-folded, single-spaced, no edge punctuation."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", stripped).strip(" \t\n.,;:'\"()").casefold()
+
+
+def _feature_kind(feature_class: str, feature_code: str) -> Optional[int]:
+    if feature_class == "P":
+        return PLACE
+    if feature_class == "A" and feature_code.startswith("PCL"):
+        return COUNTRY
+    if feature_class == "A" and feature_code in ("ADM1", "ADM2"):
+        return REGION
+    return None
+
+
+def _weight(entry: GazetteerEntry) -> int:
+    return (entry.population + 1) * KIND_WEIGHT[entry.kind]
+
+
+def _read_geonames(
+    paths: Iterable[str], min_population: int, alternate_names: bool
+) -> Dict[str, List[GazetteerEntry]]:
+    candidates: Dict[str, List[GazetteerEntry]] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                row = line.rstrip("\n").split("\t")
+                if len(row) <= POPULATION:
+                    continue
+                kind = _feature_kind(row[FEATURE_CLASS], row[FEATURE_CODE])
+                population = int(row[POPULATION] or 0)
+                if kind is None or (kind == PLACE and population < min_population):
+                    continue
+
+                entry = GazetteerEntry(
+                    name=row[NAME],
+                    country_code=row[COUNTRY_CODE][:2],
+                    latitude=float(row[LATITUDE]),
+                    longitude=float(row[LONGITUDE]),
+                    population=population,
+                    kind=kind,
+                )
+                names = {row[NAME], row[ASCIINAME]}
+                if alternate_names and row[ALTERNATENAMES]:
+                    names.update(
+                        n for n in row[ALTERNATENAMES].split(",") if len(n) >= 3
+                    )
+                for key in {normalize_name(name) for name in names}:
+                    if key:
+                        candidates.setdefault(key, []).append(entry)
+
+    for key, entries in candidates.items():
+        entries.sort(key=_weight, reverse=True)
+        del entries[MAX_CANDIDATES:]
+    return candidates
+
+
+def build_index(
+    paths: Iterable[str],
+    output: str,
+    min_population: int = 1000,
+    alternate_names: bool = True,
+) -> int:
+    """
+    Build a gazetteer index file from GeoNames dumps.
+
+    Args:
+        paths: GeoNames "geoname" table files
+        output: Index file to write
+        min_population: Populated places below this are skipped
+        alternate_names: Also index the alternatenames column
+
+    Returns:
+        Number of entries indexed
+    """
+    candidates = _read_geonames(paths, min_population, alternate_names)
+    # A name with several candidates is stored once per candidate, heaviest first
+    rows = [(key, entry) for key in sorted(candidates) for entry in candidates[key]]
+
+    key_blob = bytearray()
+    key_offsets = []
+    name_blob = bytearray()
+    name_offsets: Dict[str, Tuple[int, int]] = {}
+    records = bytearray()
+    for key, entry in rows:
+        key_offsets.append(len(key_blob))
+        key_blob += key.encode("utf-8")
+
+        display = (
+            entry.name
+            if entry.kind == COUNTRY
+            else f"{entry.name}, {entry.country_code}"
+        )
+        if display not in name_offsets:
+            encoded = display.encode("utf-8")[:0xFFFF]
+            name_offsets[display] = (len(name_blob), len(encoded))
+            name_blob += encoded
+        name_offset, name_length = name_offsets[display]
+        records += RECORD.pack(
+            entry.latitude,
+            entry.longitude,
+            min(entry.population, 0xFFFFFFFF),
+            name_offset,
+            name_length,
+            entry.country_code.encode("ascii", "replace")[:2].ljust(2),
+            entry.kind,
+        )
+    key_offsets.append(len(key_blob))
+
+    with open(output, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(rows), len(key_blob), len(name_blob)))
+        for offset in key_offsets:
+            f.write(OFFSET.pack(offset))
+        f.write(records)
+        f.write(key_blob)
+        f.write(name_blob)
+    return len(rows)
+
+
+class _Keys:
+    """Sequence view over the sorted keys of a mapped index, for bisect."""
+
+    def __init__(self, gazetteer: "Gazetteer"):
+        self.gazetteer = gazetteer
+
+    def __len__(self):
+        return self.gazetteer.size
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.gazetteer._key(i)
+
+
+class Gazetteer:
+    """Read-only, memory-mapped gazetteer index."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Index file written by build_index
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.size, key_size, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a gazetteer index: {path}")
+        self._offsets_at = HEADER.size
+        self._records_at = self._offsets_at + (self.size + 1) * OFFSET.size
+        self._keys_at = self._records_at + self.size * RECORD.size
+        self._names_at = self._keys_at + key_size
+        self._keys = _Keys(self)
+
+    def close(self):
+        self._map.close()
+
+    def _key(self, i: int) -> bytes:
+        start, end = struct.unpack_from("<II", self._map, self._offsets_at + i * 4)
+        return self._map[self._keys_at + start : self._keys_at + end]
+
+    def _entry(self, i: int) -> GazetteerEntry:
+        latitude, longitude, population, name_offset, name_length, country, kind = (
+            RECORD.unpack_from(self._map, self._records_at + i * RECORD.size)
+        )
+        start = self._names_at + name_offset
+        return GazetteerEntry(
+            name=self._map[start : start + name_length].decode("utf-8"),
+            country_code=country.decode("ascii").strip(),
+            latitude=latitude,
+            longitude=longitude,
+            population=population,
+            kind=kind,
+        )
+
+    def _candidates(self, name: str) -> List[GazetteerEntry]:
+        key = normalize_name(name).encode("utf-8")
+        if not key:
+            return []
+        entries = []
+        i = bisect.bisect_left(self._keys, key)
+        while i < self.size and self._keys[i] == key:
+            entries.append(self._entry(i))
+            i += 1
+        return entries
+
+    def lookup(self, name: str) -> Optional[GazetteerEntry]:
+        """
+        Resolve a place name.
+
+        "Paris, Texas" style names are tried in full first, then by their leading
+        part, preferring candidates in the country of the trailing parts.
+
+        Args:
+            name: Place name as written in the article
+
+        Returns:
+            The best matching entry, or None when the name is not in the index
+        """
+        candidates = self._candidates(name)
+        if candidates or "," not in name:
+            return candidates[0] if candidates else None
+
+        place, *qualifiers = name.split(",")
+        candidates = self._candidates(place)
+        if not candidates:
+            return None
+        countries = {
+            entry.country_code
+            for qualifier in qualifiers
+            for entry in self._candidates(qualifier)
+        }
+        for entry in candidates:
+            if entry.country_code in countries:
+                return entry
+        return candidates[0]
+
+    def prefix(self, prefix: str, limit: int = 10) -> List[GazetteerEntry]:
+        """
+        Entries whose name starts with prefix, most populous first.
+
+        Args:
+            prefix: Beginning of a place name
+            limit: Maximum number of entries returned
+        """
+        key = normalize_name(prefix).encode("utf-8")
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_left(self._keys, key + b"\xff", lo=start)
+        # Alternate names point at the same place more than once
+        entries = list({self._entry(i): None for i in range(start, end)})
+        entries.sort(key=_weight, reverse=True)
+        return entries[:limit]
+
+
+def load_gazetteer(path: Optional[str] = None) -> Optional[Gazetteer]:
+    """Open the index at path (default $GAZETTEER_PATH), or None if there is none."""
+    path = path or os.environ.get("GAZETTEER_PATH")
+    if not path or not os.path.exists(path):
+        return None
+    return Gazetteer(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a gazetteer index")
+    parser.add_argument("dumps", nargs="+", help="GeoNames geoname table files")
+    parser.add_argument("-o", "--output", default="gazetteer.idx")
+    parser.add_argument("--min-population", type=int, default=1000)
+    parser.add_argument("--no-alternate-names", action="store_true")
+    args = parser.parse_args()
+    count = build_index(
+        args.dumps,
+        args.output,
+        min_population=args.min_population,
+        alternate_names=not args.no_alternate_names,
+    )
+    print(f"Indexed {count} names into {args.output}")
@@ -0,0 +1,66 @@
+from typing import Tuple
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+MAX_PRECISION = 12
+# Grid cells per map tile width; a 256px tile then shows clusters ~32px apart
+CELLS_PER_TILE = 8
+
+
+def precision_for_zoom(zoom: int) -> int:
+    """Geohash precision whose cells are about 1/CELLS_PER_TILE of a tile at a web map zoom level.
+
+    Args:
+        zoom (int): Web map zoom level, 0 shows the whole world in one tile.
+
+    Returns:
+        int: Geohash precision between 1 and MAX_PRECISION.
+    """
+    # A tile spans 2^-zoom of the longitudes; precision p splits them in 2^ceil(5p/2)
+    lon_bits = zoom + CELLS_PER_TILE.bit_length() - 1
+    return max(1, min(MAX_PRECISION, round(lon_bits * 2 / 5)))
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Width and height in degrees of a geohash cell.
+
+    Args:
+        precision (int): Geohash length.
+
+    Returns:
+        tuple: (longitude degrees, latitude degrees).
+    """
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 360 / 2 ** lon_bits, 180 / 2 ** lat_bits
+
+
+def geohash_from_cell(x: int, y: int, precision: int) -> str:
+    """Geohash of the cell at column x (from -180°) and row y (from -90°).
+
+    Args:
+        x (int): Cell column, floor((longitude + 180) / cell width).
+        y (int): Cell row, floor((latitude + 90) / cell height).
+        precision (int): Geohash length.
+
+    Returns:
+        str: The geohash of the cell.
+    """
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    x = min(max(x, 0), 2 ** lon_bits - 1)
+    y = min(max(y, 0), 2 ** lat_bits - 1)
+    value = 0
+    lon_bit, lat_bit = lon_bits, lat_bits
+    # Geohash interleaves the bits, starting with longitude
+    for i in range(bits):
+        if i % 2 == 0:
+            lon_bit -= 1
+            value = (value << 1) | ((x >> lon_bit) & 1)
+        else:
+            lat_bit -= 1
+            value = (value << 1) | ((y >> lat_bit) & 1)
+    return "".join(
+        GEOHASH_ALPHABET[(value >> (5 * (precision - 1 - i))) & 31] for i in range(precision)
+    )
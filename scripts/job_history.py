@@ -0,0 +1,81 @@
+import datetime
+from bson.objectid import ObjectId
+
+
+def migrate_job_history(client, retention_days=30, database_name='disease-data'):
+    """Moves the unbounded job arrays out of the sources and job executions.
+
+    The article ids of every job execution are copied into
+    job-execution-articles, the per-source statistics are computed from the
+    job executions still stored, and finished jobs get the expiresAt read by
+    the TTL index. Run it once when deploying; afterwards the crawler keeps the
+    statistics up to date and expired jobs are no longer there to count.
+
+    Only the duration of its last execution is stored on a job, so, like
+    record_job_stats, every counted execution adds its own duration: a job
+    contributes one execution and that duration, keeping totalDuration /
+    executions the average per-execution cost the job pooler packs by.
+
+    Args:
+        client (pymongo.MongoClient): Connected client.
+        retention_days (float, optional): Days finished jobs are kept. Defaults to 30.
+        database_name (str, optional): Name of the database. Defaults to 'disease-data'.
+
+    Returns:
+        int: The number of article links written.
+    """
+    db = client[database_name]
+    jobs = db['job-executions']
+    retention = datetime.timedelta(days=retention_days)
+
+    # Finished jobs expire retention after they finished
+    jobs.update_many(
+        {'status': {'$in': ['completed', 'error']}, 'expiresAt': {'$exists': False}},
+        [{'$set': {'expiresAt': {'$add': [
+            {'$ifNull': ['$completedAt', '$updatedAt']},
+            retention.total_seconds() * 1000,
+        ]}}}],
+    )
+
+    links = 0
+    for job in jobs.find({'metadata.articleIds.0': {'$exists': True}}, {'sourceId': 1, 'createdAt': 1, 'expiresAt': 1, 'metadata.articleIds': 1}):
+        article_ids = [ObjectId(a) for a in job['metadata']['articleIds'] if ObjectId.is_valid(a)]
+        documents = [
+            {
+                'jobExecutionId': job['_id'],
+                'articleId': article_id,
+                'sourceId': job.get('sourceId'),
+                'createdAt': job.get('createdAt'),
+                **({'expiresAt': job['expiresAt']} if job.get('expiresAt') else {}),
+            }
+            for article_id in article_ids
+        ]
+        if documents:
+            db['job-execution-articles'].insert_many(documents, ordered=False)
+        jobs.update_one(
+            {'_id': job['_id']},
+            {'$set': {'metadata.articleCount': len(documents)}, '$unset': {'metadata.articleIds': ''}},
+        )
+        links += len(documents)
+
+    jobs.aggregate([
+        {'$match': {'sourceId': {'$ne': None}}},
+        {'$set': {'executionDuration': {'$ifNull': ['$metadata.last_execution_duration', '$duration']}}},
+        {'$group': {
+            '_id': '$sourceId',
+            'executions': {'$sum': {'$cond': [{'$eq': [{'$ifNull': ['$executionDuration', None]}, None]}, 0, 1]}},
+            'articles': {'$sum': {'$ifNull': ['$metadata.articleCount', 0]}},
+            'totalDuration': {'$sum': {'$ifNull': ['$executionDuration', 0]}},
+            'completed': {'$sum': {'$cond': [{'$eq': ['$status', 'completed']}, 1, 0]}},
+            'error': {'$sum': {'$cond': [{'$eq': ['$status', 'error']}, 1, 0]}},
+            'lastRunAt': {'$max': '$startedAt'},
+        }},
+        {'$project': {
+            'executions': 1, 'articles': 1, 'totalDuration': 1, 'lastRunAt': 1,
+            'jobs': {'completed': '$completed', 'error': '$error'},
+        }},
+        {'$merge': {'into': 'source-stats', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ])
+
+    db['sources'].update_many({'jobExecutionIds': {'$exists': True}}, {'$unset': {'jobExecutionIds': ''}})
+    return links
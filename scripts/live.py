@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+from pymongo.errors import OperationFailure, PyMongoError
+from motor.motor_asyncio import AsyncIOMotorCollection
+from .async_database import EARTH_RADIUS_KM, _to_mention
+
+logger = logging.getLogger(__name__)
+
+# Server exits the change stream on a standalone mongod with these codes
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40415}
+# The resume token is invalid or fell off the oplog; resuming with it never succeeds
+RESUME_TOKEN_LOST = {260, 280, 286}
+RETRY_SECONDS = 5
+# write_mentions only inserts mentions a record did not have; rebuilt ones are tagged
+NEW_MENTIONS = [{'$match': {'operationType': 'insert', 'fullDocument.backfill': {'$ne': True}}}]
+
+
+@dataclass
+class MentionFilter:
+    """What one subscriber wants to hear about; unset fields match everything."""
+
+    source: str
+    keywords: Optional[Set[str]] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    radius: Optional[float] = None
+
+    def matches(self, source: str, mention: Dict[str, Any]) -> bool:
+        if source != self.source:
+            return False
+        if self.keywords and mention['keyword'].lower() not in self.keywords:
+            return False
+        if self.latitude is not None and self.longitude is not None and self.radius:
+            return distance_km(self.latitude, self.longitude, mention['latitude'], mention['longitude']) <= self.radius
+        return True
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance, on the same sphere as the $centerSphere filters."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _from_article(article: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Mentions of an analysed article, shaped like the newspaper ones plus caseCount."""
+    date = article.get('publishDate') or article.get('createdAt')
+    return [
+        {
+            '_id': str(article['_id']),
+            'name': article.get('title'),
+            'url': article.get('url'),
+            'date': date.strftime("%d-%m-%Y") if date else None,
+            'keyword': keyword['keyword'],
+            'address': keyword.get('location'),
+            'caseCount': keyword.get('caseCount', 0),
+            'latitude': keyword['latitude'],
+            'longitude': keyword['longitude'],
+        }
+        for keyword in article.get('keywords', [])
+        if keyword.get('latitude') is not None and keyword.get('longitude') is not None
+    ]
+
+
+class Subscription:
+    """A subscriber's filter and the mentions waiting to be sent to it."""
+
+    def __init__(self, mention_filter: MentionFilter, max_queued: int):
+        self.filter = mention_filter
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self.dropped = 0
+
+    def offer(self, event: Dict[str, Any]):
+        # A client that does not keep up loses mentions instead of holding memory
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+
+class MentionBroker:
+    """Fans new mentions out to the live subscribers whose filter they match.
+
+    Mentions come from Mongo change streams on the news_bug mentions and the
+    analysed articles. Without a replica set there are no change streams; the
+    writers of this process then publish their mentions directly instead,
+    see scripts.database.add_mention_listener.
+    """
+
+    def __init__(self, max_queued: int = 1000):
+        """
+        Args:
+            max_queued (int, optional): Mentions buffered per subscriber. Defaults to 1000.
+        """
+        self.max_queued = max_queued
+        self._subscriptions: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def subscribe(self, mention_filter: MentionFilter) -> Subscription:
+        subscription = Subscription(mention_filter, self.max_queued)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def publish(self, source: str, mentions: List[Dict[str, Any]]):
+        """Queues each mention for every subscriber it matches; call on the event loop."""
+        for subscription in list(self._subscriptions):
+            for mention in mentions:
+                if subscription.filter.matches(source, mention):
+                    subscription.offer({'source': source, **mention})
+
+    def publish_threadsafe(self, source: str, documents: List[Dict[str, Any]]):
+        """Listener for the synchronous writers, which run in the threadpool."""
+        if self._loop is None or not self._subscriptions:
+            return
+        mentions = [_to_mention(document) for document in documents]
+        self._loop.call_soon_threadsafe(self.publish, source, mentions)
+
+    async def start(self, mentions: AsyncIOMotorCollection, articles: AsyncIOMotorCollection) -> bool:
+        """Follows the change streams of both collections.
+
+        Args:
+            mentions (AsyncIOMotorCollection): The news_bug mentions collection.
+            articles (AsyncIOMotorCollection): The disease-data articles collection.
+
+        Returns:
+            bool: False when the server has no change streams; only mentions
+                published through publish_threadsafe are pushed then.
+        """
+        self._loop = asyncio.get_running_loop()
+        try:
+            # Opening a stream fails fast on a standalone server
+            async with mentions.watch(NEW_MENTIONS):
+                pass
+        except OperationFailure as error:
+            if error.code in CHANGE_STREAMS_UNSUPPORTED:
+                return False
+            raise
+        self._tasks = [
+            asyncio.create_task(self._follow(mentions, NEW_MENTIONS, self._on_mention)),
+            asyncio.create_task(self._follow(
+                articles,
+                [{'$match': {
+                    'operationType': 'update',
+                    # Only the transition to completed, not every later touch of the article
+                    'updateDescription.updatedFields.status': 'completed',
+                    'fullDocument.isArticleValid': True,
+                }}],
+                self._on_article,
+                full_document='updateLookup',
+            )),
+        ]
+        return True
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _on_mention(self, change: Dict[str, Any]):
+        document = change['fullDocument']
+        if self._subscriptions:
+            self.publish(document['source'], [_to_mention(document)])
+
+    def _on_article(self, change: Dict[str, Any]):
+        if self._subscriptions and change.get('fullDocument'):
+            self.publish('articles', _from_article(change['fullDocument']))
+
+    async def _follow(self, collection: AsyncIOMotorCollection, pipeline, handle, **kwargs):
+        # Resume where the stream broke off, so no mention is lost on a failover
+        resume_token = None
+        while True:
+            try:
+                async with collection.watch(pipeline, resume_after=resume_token, **kwargs) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        handle(change)
+            except PyMongoError as error:
+                if isinstance(error, OperationFailure) and error.code in RESUME_TOKEN_LOST:
+                    # Start over from now; changes made meanwhile are not pushed
+                    logger.warning('Change stream on %s cannot resume, restarting: %s', collection.name, error)
+                    resume_token = None
+                else:
+                    logger.warning('Change stream on %s interrupted: %s', collection.name, error)
+                await asyncio.sleep(RETRY_SECONDS)
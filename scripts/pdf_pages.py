@@ -0,0 +1,31 @@
+import os
+from typing import Iterator, Optional
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+
+def iter_pdf_pages(filepath: str, dpi: Optional[int] = None, grayscale: Optional[bool] = None) -> Iterator[Image.Image]:
+    """Renders a PDF one page at a time.
+
+    Only the page being processed is held in memory, instead of every page of
+    the document at once; each page is closed when the next one is requested.
+
+    Args:
+        filepath (str): Path of the PDF.
+        dpi (int, optional): Render resolution. Defaults to PDF_DPI, or 200.
+        grayscale (bool, optional): Render in grayscale, a third of the memory
+            of RGB and all OCR needs. Defaults to PDF_GRAYSCALE, or True.
+
+    Yields:
+        PIL.Image.Image: The pages, in order.
+    """
+    dpi = dpi or int(os.environ.get('PDF_DPI', 200))
+    if grayscale is None:
+        grayscale = os.environ.get('PDF_GRAYSCALE', 'true').lower() != 'false'
+    page_count = pdfinfo_from_path(filepath)['Pages']
+    for page in range(1, page_count + 1):
+        image, = convert_from_path(filepath, dpi=dpi, grayscale=grayscale, first_page=page, last_page=page)
+        try:
+            yield image
+        finally:
+            image.close()
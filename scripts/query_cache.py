@@ -0,0 +1,82 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+def version_key(keyword: str) -> str:
+    """Field name of a keyword's counter; '.' and '$' are not allowed in field names."""
+    return keyword.replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+
+def normalize_filter(filters: Dict[str, Any]) -> str:
+    """Cache key for a filter: keyword order and duplicates do not matter.
+
+    Args:
+        filters (dict): The FilterRequest fields.
+
+    Returns:
+        str: A canonical JSON representation of the filter.
+    """
+    filters = dict(filters)
+    filters['keywords'] = sorted(set(filters.get('keywords') or [])) or None
+    return json.dumps(filters, sort_keys=True, default=str)
+
+
+class QueryCache:
+    """In-process LRU of query results with single-flight loading.
+
+    Every entry is stored with the data versions it was computed from; a
+    lookup with different versions misses, so writers invalidate entries by
+    bumping versions. Identical requests that arrive while a result is being
+    computed wait for that computation instead of starting their own.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300):
+        """
+        Args:
+            max_entries (int, optional): Results kept. Defaults to 256.
+            ttl_seconds (float, optional): Upper bound on the age of a result,
+                in case a write bypassed the version bump. Defaults to 300.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (versions, expires_at, value), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_load(self, key: Hashable, versions: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns the cached result for key at versions, computing it at most once.
+
+        Args:
+            key (Hashable): Normalized query.
+            versions (Hashable): Versions of the data the query reads.
+            loader (callable): Coroutine function computing the result on a miss.
+
+        Returns:
+            The result; treat it as read-only, it is shared between requests.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == versions and entry[1] > time.monotonic():
+            self._entries.move_to_end(key)
+            return entry[2]
+
+        flight = (key, versions)
+        task = self._inflight.get(flight)
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._inflight[flight] = task
+            task.add_done_callback(lambda done: self._store(flight, done))
+        # A client going away must not cancel the load the others wait for
+        return await asyncio.shield(task)
+
+    def _store(self, flight, task: asyncio.Future):
+        self._inflight.pop(flight, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        key, versions = flight
+        self._entries[key] = (versions, time.monotonic() + self.ttl_seconds, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
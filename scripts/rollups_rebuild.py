@@ -0,0 +1,65 @@
+from .rollups import GRANULARITIES
+
+
+def _rebuild_pipeline(granularity, source, match, unwind, date, keyword, region, case_count, into):
+    """Groups mentions into buckets server-side and merges them into the rollups collection."""
+    period = {"$dateTrunc": {"date": date, "unit": granularity, "startOfWeek": "monday"}}
+    region = {"$let": {
+        "vars": {"r": {"$toLower": {"$trim": {"input": {"$ifNull": [region, ""]}}}}},
+        "in": {"$cond": [{"$eq": ["$$r", ""]}, "unknown", "$$r"]},
+    }}
+    return [
+        {"$match": match},
+        *unwind,
+        {"$group": {
+            "_id": {"period": period, "keyword": {"$toLower": keyword}, "region": region},
+            "mentions": {"$sum": 1},
+            "caseCount": {"$sum": {"$ifNull": [case_count, 0]}},
+        }},
+        {"$project": {
+            "_id": {"$concat": [
+                granularity, "|", source, "|",
+                {"$dateToString": {"date": "$_id.period", "format": "%Y-%m-%d"}}, "|",
+                "$_id.keyword", "|", "$_id.region",
+            ]},
+            "granularity": granularity,
+            "source": source,
+            "period": "$_id.period",
+            "keyword": "$_id.keyword",
+            "region": "$_id.region",
+            "mentions": 1,
+            "caseCount": 1,
+            "updatedAt": "$$NOW",
+        }},
+        {"$merge": {"into": into, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def rebuild_rollups(client):
+    """Recomputes every rollup bucket from the stored mentions and analysed articles.
+
+    Use it once to initialise the rollups; afterwards the writers keep them up
+    to date incrementally.
+
+    Args:
+        client (pymongo.MongoClient): Connected client.
+
+    Returns:
+        None
+    """
+    news_bug = client["news_bug"]
+    news_bug["mention_rollups"].delete_many({})
+    disease_data = client["disease-data"]
+    disease_data["mention-rollups"].delete_many({})
+    for granularity in GRANULARITIES:
+        for source in ("newspapers", "webpages"):
+            news_bug["mentions"].aggregate(_rebuild_pipeline(
+                granularity, source, {"source": source}, [],
+                "$date", "$keyword", "$address", None, "mention_rollups",
+            ))
+        disease_data["articles"].aggregate(_rebuild_pipeline(
+            granularity, "articles", {"status": "completed", "isArticleValid": True},
+            [{"$unwind": "$keywords"}],
+            {"$ifNull": ["$publishDate", "$createdAt"]},
+            "$keywords.keyword", "$keywords.location", "$keywords.caseCount", "mention-rollups",
+        ))
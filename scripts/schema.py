@@ -0,0 +1,202 @@
+import argparse
+import datetime
+import os
+import pymongo
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+from scripts.database import rebuild_mentions
+from scripts.rollups_rebuild import rebuild_rollups
+from scripts.job_history import migrate_job_history
+
+# Indexes required by the hot queries, per database and collection. Names are
+# left to MongoDB so they match indexes created elsewhere with the same keys
+# (e.g. by the analyse-article function), which keeps create_indexes a no-op.
+INDEXES = {
+    'disease-data': {
+        'articles': [
+            # Analyzer queue: claim by status / expired lease, oldest first,
+            # and batches of one category
+            IndexModel([('status', ASCENDING), ('leaseExpiresAt', ASCENDING)]),
+            IndexModel([('status', ASCENDING), ('categoryId', ASCENDING)]),
+            IndexModel([('status', ASCENDING), ('createdAt', ASCENDING)]),
+            IndexModel([('sourceId', ASCENDING)]),
+            # Duplicate check before an article is inserted
+            IndexModel([('url', ASCENDING), ('categoryId', ASCENDING)]),
+        ],
+        'sources': [
+            # Job pooler: active, idle sources that are due, most overdue first
+            IndexModel([('isActive', ASCENDING), ('status', ASCENDING), ('nextRunAt', ASCENDING)]),
+            # Running crawls with a live lease count against the pooler's
+            # concurrency cap; expired ones are released
+            IndexModel([('status', ASCENDING)]),
+            IndexModel([('status', ASCENDING), ('runningUntil', ASCENDING)]),
+            IndexModel([('url', ASCENDING)]),
+        ],
+        'job-executions': [
+            IndexModel([('sourceId', ASCENDING), ('createdAt', DESCENDING)]),
+            # Finished jobs are deleted once expired; per-source totals live in source-stats
+            IndexModel([('expiresAt', ASCENDING)], expireAfterSeconds=0),
+        ],
+        'job-execution-articles': [
+            IndexModel([('jobExecutionId', ASCENDING)]),
+            IndexModel([('articleId', ASCENDING)]),
+            IndexModel([('sourceId', ASCENDING), ('createdAt', DESCENDING)]),
+            IndexModel([('expiresAt', ASCENDING)], expireAfterSeconds=0),
+        ],
+        # Crawl progress of unfinished jobs; abandoned frontiers expire
+        'crawl-frontier': [
+            IndexModel([('jobExecutionId', ASCENDING), ('url', ASCENDING)], unique=True),
+            IndexModel([('expiresAt', ASCENDING)], expireAfterSeconds=0),
+        ],
+        'geocode_cache': [
+            IndexModel([('expiresAt', ASCENDING)], expireAfterSeconds=0),
+        ],
+        # Range reads of the daily/weekly buckets
+        'mention-rollups': [
+            IndexModel([('granularity', ASCENDING), ('source', ASCENDING), ('keyword', ASCENDING), ('period', ASCENDING)]),
+        ],
+    },
+    'news_bug': {
+        'newspapers': [
+            IndexModel([('status', ASCENDING), ('date', ASCENDING)]),
+            IndexModel([('data.keyword', ASCENDING)]),
+            IndexModel([('data.location', GEOSPHERE)]),
+        ],
+        'webpages': [
+            IndexModel([('date', ASCENDING)]),
+            IndexModel([('data.keyword', ASCENDING)]),
+            IndexModel([('data.location', GEOSPHERE)]),
+        ],
+        # One document per keyword mention, written alongside the records
+        'mentions': [
+            IndexModel([('source', ASCENDING), ('keyword', ASCENDING), ('location', GEOSPHERE), ('date', ASCENDING)]),
+            IndexModel([('source', ASCENDING), ('keyword', ASCENDING), ('date', ASCENDING)]),
+            IndexModel([('source', ASCENDING), ('date', ASCENDING)]),
+            IndexModel([('recordId', ASCENDING)]),
+            # Mentions written before the key existed are replaced on their record's next write
+            IndexModel([('recordId', ASCENDING), ('key', ASCENDING)], unique=True, partialFilterExpression={'key': {'$exists': True}}),
+        ],
+        'mention_rollups': [
+            IndexModel([('granularity', ASCENDING), ('source', ASCENDING), ('keyword', ASCENDING), ('period', ASCENDING)]),
+        ],
+    },
+}
+
+# (database, collection, filter, sort) of the queries that must not scan
+_DATE = datetime.datetime(2024, 1, 1)
+_VIEWPORT = {'type': 'Polygon', 'coordinates': [[[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]]}
+HOT_QUERIES = [
+    ('disease-data', 'articles', {'status': 'data_extracted'}, [('createdAt', ASCENDING)]),
+    ('disease-data', 'articles', {'status': 'data_extracted', 'categoryId': 'x'}, None),
+    ('disease-data', 'articles', {'url': 'x', 'categoryId': 'x'}, None),
+    ('disease-data', 'articles', {'sourceId': 'x'}, None),
+    ('disease-data', 'sources', {'isActive': True, 'status': {'$in': ['idle', 'error']}, 'nextRunAt': {'$lte': _DATE}}, [('nextRunAt', ASCENDING)]),
+    ('disease-data', 'sources', {'status': 'running'}, None),
+    ('disease-data', 'sources', {'status': 'running', 'runningUntil': {'$gte': _DATE}}, None),
+    ('disease-data', 'job-executions', {'sourceId': 'x'}, None),
+    ('disease-data', 'job-execution-articles', {'jobExecutionId': 'x'}, None),
+    ('disease-data', 'job-execution-articles', {'articleId': 'x'}, None),
+    ('disease-data', 'crawl-frontier', {'jobExecutionId': 'x'}, None),
+    ('news_bug', 'newspapers', {'status': 'Completed', 'date': {'$gte': _DATE}}, None),
+    ('news_bug', 'newspapers', {'data.keyword': {'$in': ['x']}}, None),
+    ('news_bug', 'webpages', {'date': {'$gte': _DATE}}, None),
+    ('news_bug', 'webpages', {'data.keyword': {'$in': ['x']}}, None),
+    ('news_bug', 'mentions', {'source': 'newspapers', 'keyword': {'$in': ['x']}, 'date': {'$gte': _DATE}}, None),
+    ('news_bug', 'mentions', {'source': 'newspapers', 'keyword': {'$in': ['x']}, 'location': {'$geoWithin': {'$centerSphere': [[0, 0], 0.01]}}}, None),
+    ('news_bug', 'mentions', {'source': 'webpages', 'date': {'$gte': _DATE}}, None),
+    # /clusters viewport
+    ('news_bug', 'mentions', {'source': 'newspapers', 'location': {'$geoWithin': {'$geometry': _VIEWPORT}}}, None),
+]
+
+
+def apply_indexes(client, databases=None):
+    """Creates the declared indexes that do not exist yet.
+
+    Safe to run on every startup or deploy: existing indexes are left alone.
+    An index that cannot be built (e.g. documents with malformed GeoJSON) is
+    reported without stopping the others.
+
+    Args:
+        client (pymongo.MongoClient): Connected client.
+        databases (list, optional): Databases to migrate. Defaults to all declared.
+
+    Returns:
+        dict: Index names per "database.collection", or the error message.
+    """
+    summary = {}
+    for database_name, collections in INDEXES.items():
+        if databases is not None and database_name not in databases:
+            continue
+        for collection_name, indexes in collections.items():
+            collection = client[database_name][collection_name]
+            target = f"{database_name}.{collection_name}"
+            try:
+                summary[target] = collection.create_indexes(indexes)
+            except OperationFailure as e:
+                summary[target] = f"failed: {e}"
+    return summary
+
+
+def _plan_stages(plan):
+    """Yields every stage name of an explain() plan tree."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+
+def verify_queries(client, databases=None):
+    """Explains the hot queries and checks that none of them scans a collection.
+
+    Args:
+        client (pymongo.MongoClient): Connected client.
+        databases (list, optional): Databases to check. Defaults to all declared.
+
+    Returns:
+        list: (query description, winning plan stages, uses an index) tuples.
+    """
+    results = []
+    for database_name, collection_name, query, sort in HOT_QUERIES:
+        if databases is not None and database_name not in databases:
+            continue
+        cursor = client[database_name][collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = list(_plan_stages(plan))
+        description = f"{database_name}.{collection_name} {sorted(query)}"
+        results.append((description, stages, 'COLLSCAN' not in stages))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create MongoDB indexes and check the hot queries use them')
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI') or 'mongodb://127.0.0.1:27017/')
+    parser.add_argument('--database', action='append', choices=list(INDEXES), help='Defaults to all databases')
+    parser.add_argument('--verify', action='store_true', help='Explain the hot queries after migrating')
+    parser.add_argument('--backfill-mentions', action='store_true', help='Rebuild news_bug.mentions from the stored records')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Recompute the mention rollups from scratch')
+    parser.add_argument('--migrate-job-history', action='store_true', help='Move job article ids and source job ids into their own collections, once')
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(args.uri)
+    for target, result in apply_indexes(client, args.database).items():
+        print(f"{target}: {result}")
+    if args.backfill_mentions:
+        print(f"Mentions written: {rebuild_mentions(client)}")
+    if args.rebuild_rollups:
+        rebuild_rollups(client)
+        print("Rollups rebuilt")
+    if args.migrate_job_history:
+        retention_days = float(os.environ.get('JOB_RETENTION_DAYS', 30))
+        print(f"Job article links written: {migrate_job_history(client, retention_days)}")
+    if args.verify:
+        failed = False
+        for description, stages, indexed in verify_queries(client, args.database):
+            print(f"{'OK  ' if indexed else 'SCAN'} {description}: {' > '.join(stages)}")
+            failed = failed or not indexed
+        raise SystemExit(1 if failed else 0)
@@ -0,0 +1,34 @@
+"""Shared test helpers.
+
+Run with `python -m pytest` from the repository root. Tests of code that needs
+pymongo, motor, mongomock (for the lease tests) or a function's dependencies
+are skipped when those are not installed.
+"""
+import importlib
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = os.path.join(ROOT, 'appwrite', 'functions')
+
+
+def load_function_module(function, module):
+    """Imports a module of an Appwrite function's src directory.
+
+    The functions use relative imports and all have a src directory, so each
+    is loaded as its own package, e.g. analyse-article as fn_analyse_article.
+
+    Args:
+        function (str): Function directory name, e.g. 'job-pooler'.
+        module (str): Module name inside src, e.g. 'main'.
+
+    Returns:
+        module: The imported module.
+    """
+    package = 'fn_' + function.replace('-', '_')
+    if package not in sys.modules:
+        namespace = types.ModuleType(package)
+        namespace.__path__ = [os.path.join(FUNCTIONS, function, 'src')]
+        sys.modules[package] = namespace
+    return importlib.import_module(f'{package}.{module}')
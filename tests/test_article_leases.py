@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+pytest.importorskip('requests')
+pytest.importorskip('pydantic')
+pytest.importorskip('google.generativeai')
+from conftest import load_function_module
+
+mongo = load_function_module('analyse-article', 'mongo')
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(mongo.pymongo, 'MongoClient', mongomock.MongoClient)
+    session = mongo.MongoSession(mongo_uri='mongodb://localhost')
+    created = datetime(2024, 1, 1)
+    session.articles_collection.insert_many([
+        {'_id': i, 'status': 'data_extracted', 'categoryId': category, 'createdAt': created + timedelta(minutes=i)}
+        for i, category in enumerate(['flu', 'flu', 'covid', 'flu'])
+    ])
+    return session
+
+
+def statuses(session):
+    return {a['_id']: a['status'] for a in session.articles_collection.find()}
+
+
+def test_claim_fills_batch_from_one_category(session):
+    claimed = session.claim_articles_for_analysis(limit=3)
+
+    assert [a['_id'] for a in claimed] == [0, 1, 3]
+    assert {a['leaseId'] for a in claimed} == {claimed[0]['leaseId']}
+    assert statuses(session) == {0: 'analysing', 1: 'analysing', 2: 'data_extracted', 3: 'analysing'}
+
+
+def test_claimed_articles_are_not_claimed_again(session):
+    first = session.claim_articles_for_analysis(limit=3)
+    second = session.claim_articles_for_analysis(limit=3)
+
+    assert [a['_id'] for a in second] == [2]
+    assert first[0]['leaseId'] != second[0]['leaseId']
+    assert session.claim_articles_for_analysis(limit=3) == []
+
+
+def test_expired_lease_is_reclaimed(session):
+    session.claim_articles_for_analysis(limit=1, lease_seconds=-1)
+    reclaimed = session.claim_articles_for_analysis(limit=1)
+
+    assert [a['_id'] for a in reclaimed] == [0]
+
+
+def test_release_returns_articles_to_the_queue(session):
+    claimed = session.claim_articles_for_analysis(limit=3)
+    session.release_articles(claimed)
+
+    assert set(statuses(session).values()) == {'data_extracted'}
+    assert all('leaseId' not in a for a in session.articles_collection.find())
+
+
+def test_release_ignores_articles_reclaimed_by_another_lease(session):
+    stale = session.claim_articles_for_analysis(limit=1, lease_seconds=-1)
+    current = session.claim_articles_for_analysis(limit=1)
+    session.release_articles(stale)
+
+    article = session.articles_collection.find_one({'_id': 0})
+    assert article['status'] == 'analysing'
+    assert article['leaseId'] == current[0]['leaseId']
+
+
+def test_release_of_nothing_is_a_no_op(session):
+    session.release_articles([])
+    assert set(statuses(session).values()) == {'data_extracted'}
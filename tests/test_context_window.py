@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip('pydantic')
+from conftest import load_function_module
+
+context_window = load_function_module('analyse-article', 'context_window')
+
+
+def compress(content, keywords, max_chars=2500):
+    return context_window.ContextCompressor(max_chars=max_chars).compress(content, keywords, title='Title')
+
+
+def test_keyword_sentences_and_their_neighbours_are_kept():
+    content = 'Sports news today. The weather is fine. Cholera cases rose in Dhaka. Officials met. Markets closed.'
+    excerpts = compress(content, ['cholera']).excerpts
+
+    assert [e.text for e in excerpts] == ['The weather is fine. Cholera cases rose in Dhaka. Officials met.']
+
+
+def test_keywords_match_whole_words_and_plurals():
+    pattern = context_window.ContextCompressor._keyword_pattern(['flu', 'fever'])
+    assert pattern.search('two fevers') and pattern.search('the Flu')
+    assert not pattern.search('fluid intake')
+
+
+def test_without_keywords_the_leading_text_is_kept():
+    content = ' '.join(f'Sentence number {i} about local news.' for i in range(200))
+    article = compress(content, ['cholera'], max_chars=500)
+
+    assert article.excerpts[0].start == 0
+    assert 0 < sum(e.end - e.start for e in article.excerpts) <= 500
+
+
+def test_long_anchor_sentence_is_cut_around_the_keyword():
+    # OCR text without punctuation is one sentence far over the budget
+    content = 'word ' * 600 + 'cholera outbreak reported ' + 'word ' * 600
+    article = compress(content, ['cholera'])
+
+    [excerpt] = article.excerpts
+    assert 'cholera' in excerpt.text
+    assert len(excerpt.text) == 2500
+    assert excerpt.text == content[excerpt.start:excerpt.end]
+
+
+def test_long_sentence_after_kept_ones_uses_the_remaining_budget():
+    content = 'Cholera spreads in Dhaka. ' + 'cholera ' + 'word ' * 1000
+    article = compress(content, ['cholera'], max_chars=1000)
+
+    assert sum(e.end - e.start for e in article.excerpts) <= 1000
+    assert article.excerpts[0].text.startswith('Cholera spreads in Dhaka.')
+    assert len(article.excerpts) == 1
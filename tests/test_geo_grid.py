@@ -0,0 +1,65 @@
+import math
+import pytest
+from scripts.geo_grid import MAX_PRECISION, cell_size, geohash_from_cell, precision_for_zoom
+
+
+def geohash(latitude, longitude, precision):
+    width, height = cell_size(precision)
+    return geohash_from_cell(
+        math.floor((longitude + 180) / width), math.floor((latitude + 90) / height), precision
+    )
+
+
+def test_matches_reference_geohash():
+    # Reference value from the geohash specification
+    assert geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+
+
+def test_prefix_of_finer_cell():
+    fine = geohash(-33.8688, 151.2093, 9)
+    for precision in range(1, 9):
+        assert geohash(-33.8688, 151.2093, precision) == fine[:precision]
+
+
+def test_neighbouring_points_share_a_cluster():
+    assert geohash(48.8566, 2.3522, 5) == geohash(48.8570, 2.3530, 5)
+    assert geohash(48.8566, 2.3522, 5) != geohash(51.5074, -0.1278, 5)
+
+
+def test_edges_are_clamped_into_the_grid():
+    assert geohash(90, 180, 4) == 'zzzz'
+    assert geohash(-90, -180, 4) == '0000'
+
+
+def test_cell_size_halves_with_each_bit():
+    assert cell_size(1) == (45, 45)
+    assert cell_size(2) == (45 / 4, 45 / 8)
+
+
+def test_precision_grows_with_zoom_within_bounds():
+    precisions = [precision_for_zoom(zoom) for zoom in range(0, 30)]
+    assert precisions == sorted(precisions)
+    assert precisions[0] >= 1 and precisions[-1] == MAX_PRECISION
+
+
+def test_viewport_across_the_antimeridian_is_split():
+    async_database = pytest.importorskip('scripts.async_database')
+    query = async_database._viewport_filter(-10, 170, 10, -170)
+    polygons = [condition['location']['$geoWithin']['$geometry'] for condition in query['$or']]
+    rings = [polygon['coordinates'][0] for polygon in polygons]
+    assert [(min(lon for lon, _ in ring), max(lon for lon, _ in ring)) for ring in rings] == [(170, 180), (-180, -170)]
+    for ring in rings:
+        assert ring[0] == ring[-1]
+        assert {lat for _, lat in ring} == {-10, 10}
+
+
+def test_wide_viewport_is_cut_into_polygons_within_a_hemisphere():
+    async_database = pytest.importorskip('scripts.async_database')
+    query = async_database._viewport_filter(-60, -180, 60, 180)
+    rings = [condition['location']['$geoWithin']['$geometry']['coordinates'][0] for condition in query['$or']]
+    assert len(rings) == 4
+    for ring in rings:
+        lons = [lon for lon, _ in ring]
+        assert max(lons) - min(lons) <= async_database.VIEWPORT_MAX_SPAN
+        # North and south edges follow the parallels in small steps
+        assert all(abs(b[0] - a[0]) <= async_database.VIEWPORT_EDGE_STEP for a, b in zip(ring, ring[1:]))
@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+import pytest
+
+pytest.importorskip('pymongo')
+pytest.importorskip('appwrite.client')
+from conftest import load_function_module
+
+pooler = load_function_module('job-pooler', 'main')
+
+
+def job(source_id):
+    return pooler.JobExecution(
+        _id=source_id, sourceId=source_id, categoryId='c', sourceUrl='https://example.com',
+        categoryKeywords=[], startedAt='', createdAt='', updatedAt='',
+    )
+
+
+def test_packs_cheap_jobs_within_capacity():
+    costs = {'a': 300, 'b': 200, 'c': 250, 'd': 100}
+    batches = pooler.pack_by_cost([job(s) for s in costs], costs, 600)
+
+    assert sorted(j.sourceId for batch in batches for j in batch) == sorted(costs)
+    assert all(sum(costs[j.sourceId] for j in batch) <= 600 for batch in batches)
+    assert len(batches) == 2
+
+
+def test_expensive_job_runs_alone():
+    costs = {'big': 900, 'small': 10}
+    batches = pooler.pack_by_cost([job(s) for s in costs], costs, 600)
+
+    assert [[j.sourceId for j in batch] for batch in batches] == [['big'], ['small']]
+
+
+def test_no_jobs_no_batches():
+    assert pooler.pack_by_cost([], {}, 600) == []
+
+
+class FakeContext:
+    def log(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+
+def test_failed_source_backs_off_and_drops_its_lease():
+    mongomock = pytest.importorskip('mongomock')
+    sources = mongomock.MongoClient(tz_aware=True)['disease-data']['sources']
+    poller = object.__new__(pooler.SourcePoller)
+    poller.sources, poller.context = sources, FakeContext()
+    now = datetime.now(timezone.utc)
+    sources.insert_one({'_id': 1, 'status': 'running', 'runningUntil': now, 'nextRunAt': now})
+
+    delays = []
+    for _ in range(3):
+        poller.fail_source(1, 'Category not found')
+        source = sources.find_one({'_id': 1})
+        delays.append(round((source['nextRunAt'] - datetime.now(timezone.utc)) / pooler.FAILURE_BACKOFF))
+
+    assert delays == [1, 2, 4]
+    assert source['status'] == 'error' and 'runningUntil' not in source
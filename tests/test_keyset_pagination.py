@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime
+import pytest
+
+pytest.importorskip('motor')
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from scripts.async_database import _after, iter_mentions
+
+
+class FakeCursor:
+    """The part of a Motor cursor iter_mentions uses, over documents in memory."""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        self.documents = sorted(self.documents, key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+class FakeMentions:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query):
+        after = query.get('_id', {}).get('$gt')
+        return FakeCursor([
+            d for d in self.documents
+            if d['source'] == query['source'] and (after is None or d['_id'] > after)
+        ])
+
+
+def mention(index, source='newspapers'):
+    return {
+        '_id': ObjectId(), 'source': source, 'recordId': ObjectId(), 'name': f'paper {index}',
+        'date': datetime(2024, 1, 1), 'keyword': 'flu', 'address': 'Paris', 'page': '1',
+        'paragraph': str(index), 'location': {'type': 'Point', 'coordinates': [2.35, 48.85]},
+    }
+
+
+async def read_pages(collection, limit):
+    # Same steps as main.Page: one extra row, the last key of a page is the next cursor
+    pages, cursor = [], None
+    while True:
+        rows = [row async for row in iter_mentions(collection, 'newspapers', after=cursor, limit=limit + 1)]
+        pages.append([row['paragraph'] for _, row in rows[:limit]])
+        if len(rows) <= limit:
+            return pages
+        cursor = rows[limit - 1][0]
+
+
+def test_pages_cover_every_mention_once_in_order():
+    documents = [mention(i) for i in range(7)] + [mention(99, source='webpages')]
+    pages = asyncio.run(read_pages(FakeMentions(documents), limit=3))
+
+    assert pages == [['0', '1', '2'], ['3', '4', '5'], ['6']]
+
+
+def test_cursor_is_the_mention_id():
+    documents = [mention(i) for i in range(2)]
+
+    async def first_key():
+        async for key, _ in iter_mentions(FakeMentions(documents), 'newspapers', limit=1):
+            return key
+
+    key = asyncio.run(first_key())
+    assert _after({'source': 'newspapers'}, key) == {'source': 'newspapers', '_id': {'$gt': documents[0]['_id']}}
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(InvalidId):
+        _after({}, 'not-a-cursor')
+
+
+def test_no_cursor_leaves_query_unchanged():
+    assert _after({'source': 'webpages'}, None) == {'source': 'webpages'}
+
@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+
+pytest.importorskip('motor')
+from pymongo.errors import OperationFailure
+from scripts import live
+
+
+class FakeStream:
+    def __init__(self, changes, error):
+        self.changes = changes
+        self.error = error
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for change in self.changes:
+            self.resume_token = change['_id']
+            yield change
+        raise self.error
+
+
+class FakeCollection:
+    """Each watch() replays one scripted stream and records its resume token."""
+
+    name = 'mentions'
+
+    def __init__(self, streams):
+        self.streams = list(streams)
+        self.resumed_after = []
+
+    def watch(self, pipeline, resume_after=None, **kwargs):
+        self.resumed_after.append(resume_after)
+        if not self.streams:
+            raise asyncio.CancelledError
+        return FakeStream(*self.streams.pop(0))
+
+
+def follow(collection, monkeypatch):
+    monkeypatch.setattr(live, 'RETRY_SECONDS', 0)
+    handled = []
+    broker = live.MentionBroker()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(broker._follow(collection, [], lambda change: handled.append(change['_id'])))
+    return handled
+
+
+def test_interrupted_stream_resumes_after_the_last_change(monkeypatch):
+    collection = FakeCollection([
+        ([{'_id': 'a'}, {'_id': 'b'}], OperationFailure('primary stepped down', code=189)),
+        ([{'_id': 'c'}], OperationFailure('network', code=6)),
+    ])
+
+    assert follow(collection, monkeypatch) == ['a', 'b', 'c']
+    assert collection.resumed_after == [None, 'b', 'c']
+
+
+def test_lost_resume_token_restarts_the_stream(monkeypatch):
+    collection = FakeCollection([
+        ([{'_id': 'a'}], OperationFailure('history lost', code=286)),
+        ([], OperationFailure('history lost', code=286)),
+        ([{'_id': 'b'}], OperationFailure('network', code=6)),
+    ])
+
+    assert follow(collection, monkeypatch) == ['a', 'b']
+    assert collection.resumed_after == [None, None, None, 'b']
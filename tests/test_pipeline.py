@@ -0,0 +1,202 @@
+import threading
+import pytest
+
+pytest.importorskip('pymongo')
+pytest.importorskip('requests')
+pytest.importorskip('pydantic')
+pytest.importorskip('google.generativeai')
+from conftest import load_function_module
+
+pipeline = load_function_module('analyse-article', 'pipeline')
+
+TIMEOUT = 5
+
+
+class FakeLogger:
+    def info(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+
+class FakeMongo:
+    """Hands out the given batches and records what becomes of them."""
+
+    def __init__(self, batches, claim_error=None):
+        self.batches = list(batches)
+        self.claim_error = claim_error
+        self.written = []
+        self.released = []
+        self.lock = threading.Lock()
+
+    def claim_articles_for_analysis(self, limit, lease_seconds):
+        if self.claim_error and not self.batches:
+            raise self.claim_error
+        return self.batches.pop(0) if self.batches else []
+
+    def get_analyzer_backend_from_category(self, category_id, default=None):
+        return default
+
+    def get_keywords_from_category(self, category_id):
+        return ['flu']
+
+    def release_articles(self, articles):
+        with self.lock:
+            self.released.extend(a['_id'] for a in articles)
+
+    def update_articles_with_process_data(self, articles, leases=None):
+        with self.lock:
+            self.written.extend(articles)
+
+
+class Result:
+    def __init__(self, article_id):
+        self.article_id = article_id
+
+
+class FakeProcessor:
+    def __init__(self, on_batch=None, failing=()):
+        self.on_batch = on_batch or (lambda ids: None)
+        self.failing = set(failing)
+        self.last_batch_stats = None
+
+    def set_keywords(self, keywords):
+        pass
+
+    def process_articles(self, requests):
+        ids = [request.article_id for request in requests]
+        self.on_batch(ids)
+        return {
+            'results': [Result(i) for i in ids],
+            'failed_articles': [r for r in requests if r.article_id in self.failing],
+        }
+
+
+class FakeGeocoder:
+    def __init__(self, on_batch=None):
+        self.on_batch = on_batch or (lambda ids: None)
+
+    def batch_geocode(self, results):
+        ids = [result.article_id for result in results]
+        self.on_batch(ids)
+        return ids
+
+
+def batch(*ids):
+    return [{'_id': i, 'categoryId': 'c', 'content': 'text', 'leaseId': 'lease'} for i in ids]
+
+
+def make_pipeline(mongo, processor=None, geocoder=None):
+    return pipeline.AnalysisPipeline(
+        mongo, FakeLogger(), lambda backend: processor or FakeProcessor(),
+        geocoder or FakeGeocoder(), 'gemini',
+    )
+
+
+def run_with_timeout(analysis):
+    # run() must return, or raise, once every stage is done
+    outcome = {}
+
+    def target():
+        try:
+            outcome['written'] = analysis.run()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), 'run() did not join its stages'
+    return outcome
+
+
+def test_writes_every_batch():
+    mongo = FakeMongo([batch(1, 2), batch(3)])
+    outcome = run_with_timeout(make_pipeline(mongo))
+
+    assert outcome == {'written': 3}
+    assert sorted(mongo.written) == ['1', '2', '3']
+    assert mongo.released == []
+
+
+def test_analysis_overlaps_geocoding():
+    second_analysis = threading.Event()
+    overlapped = []
+
+    def analysed(ids):
+        if ids == ['2']:
+            second_analysis.set()
+
+    def geocoding(ids):
+        # The first batch is still being geocoded when the second is analysed
+        if ids == ['1']:
+            overlapped.append(second_analysis.wait(TIMEOUT))
+
+    mongo = FakeMongo([batch(1), batch(2)])
+    outcome = run_with_timeout(make_pipeline(mongo, FakeProcessor(analysed), FakeGeocoder(geocoding)))
+
+    assert overlapped == [True]
+    assert outcome == {'written': 2}
+
+
+def test_failing_stage_releases_its_batch_and_stops():
+    def geocoding(ids):
+        raise RuntimeError('geocoder down')
+
+    mongo = FakeMongo([batch(1, 2), batch(3), batch(4)])
+    outcome = run_with_timeout(make_pipeline(mongo, geocoder=FakeGeocoder(geocoding)))
+
+    assert str(outcome['error']) == 'geocoder down'
+    assert mongo.written == []
+    claimed = {1, 2, 3, 4} - {a['_id'] for b in mongo.batches for a in b}
+    assert set(mongo.released) == claimed
+
+
+def test_batches_in_flight_are_released_once_stopped():
+    analysis = None
+
+    def geocoding(ids):
+        if ids == ['2']:
+            analysis._stop.set()
+
+    mongo = FakeMongo([batch(1), batch(2), batch(3)])
+    analysis = make_pipeline(mongo, geocoder=FakeGeocoder(geocoding))
+    outcome = run_with_timeout(analysis)
+
+    assert '2' not in mongo.written
+    assert 2 in mongo.released
+    assert not set(mongo.released) & {int(i) for i in mongo.written}
+    assert 'error' not in outcome
+
+
+def test_run_joins_when_claiming_fails():
+    mongo = FakeMongo([batch(1)], claim_error=RuntimeError('mongo down'))
+    outcome = run_with_timeout(make_pipeline(mongo))
+
+    assert str(outcome['error']) == 'mongo down'
+    # The batch claimed before the failure is written or, once stopped, released
+    assert set(mongo.released) | {int(i) for i in mongo.written} == {1}
+
+
+def test_run_joins_when_analysis_fails():
+    def analysed(ids):
+        raise RuntimeError('model down')
+
+    mongo = FakeMongo([batch(1), batch(2)])
+    outcome = run_with_timeout(make_pipeline(mongo, FakeProcessor(analysed)))
+
+    assert str(outcome['error']) == 'model down'
+    assert mongo.released == [1]
+    assert mongo.written == []
+
+
+def test_failed_analysis_is_released_not_completed():
+    mongo = FakeMongo([batch(1, 2), batch(3)])
+    outcome = run_with_timeout(make_pipeline(mongo, FakeProcessor(failing={'2'})))
+
+    assert mongo.released == [2]
+    assert mongo.written == ['1']
+    # The released articles would be claimed straight back; a later run retries them
+    assert mongo.batches == [batch(3)]
+    assert outcome == {'written': 1}
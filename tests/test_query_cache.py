@@ -0,0 +1,105 @@
+import asyncio
+from scripts.query_cache import QueryCache, normalize_filter, version_key
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def counting_loader(results):
+    calls = []
+
+    async def loader():
+        calls.append(None)
+        await asyncio.sleep(0)
+        return results[len(calls) - 1]
+
+    return loader, calls
+
+
+def test_hit_while_versions_unchanged():
+    cache = QueryCache()
+    loader, calls = counting_loader(['first', 'second'])
+
+    async def scenario():
+        return [await cache.get_or_load('q', (1,), loader) for _ in range(2)]
+
+    assert run(scenario()) == ['first', 'first']
+    assert len(calls) == 1
+
+
+def test_version_bump_invalidates():
+    cache = QueryCache()
+    loader, calls = counting_loader(['old', 'new'])
+
+    async def scenario():
+        return await cache.get_or_load('q', (1,), loader), await cache.get_or_load('q', (2,), loader)
+
+    assert run(scenario()) == ('old', 'new')
+    assert len(calls) == 2
+
+
+def test_concurrent_requests_share_one_load():
+    cache = QueryCache()
+    loader, calls = counting_loader(['result'])
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load('q', (1,), loader) for _ in range(5)))
+
+    assert run(scenario()) == ['result'] * 5
+    assert len(calls) == 1
+
+
+def test_failed_load_is_not_cached():
+    cache = QueryCache()
+    attempts = []
+
+    async def loader():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise RuntimeError('database unavailable')
+        return 'result'
+
+    async def scenario():
+        try:
+            await cache.get_or_load('q', (1,), loader)
+        except RuntimeError:
+            pass
+        return await cache.get_or_load('q', (1,), loader)
+
+    assert run(scenario()) == 'result'
+    assert len(attempts) == 2
+
+
+def test_expired_entry_is_reloaded():
+    cache = QueryCache(ttl_seconds=0)
+    loader, calls = counting_loader(['first', 'second'])
+
+    async def scenario():
+        return [await cache.get_or_load('q', (1,), loader) for _ in range(2)]
+
+    assert run(scenario()) == ['first', 'second']
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+
+    async def load(key):
+        return await cache.get_or_load(key, (1,), lambda: asyncio.sleep(0, key))
+
+    async def scenario():
+        for key in ('a', 'b', 'a', 'c'):
+            await load(key)
+
+    run(scenario())
+    assert list(cache._entries) == ['a', 'c']
+
+
+def test_normalize_filter_ignores_keyword_order_and_duplicates():
+    assert normalize_filter({'keywords': ['flu', 'covid', 'flu']}) == normalize_filter({'keywords': ['covid', 'flu']})
+    assert normalize_filter({'keywords': []}) == normalize_filter({'keywords': None})
+
+
+def test_version_key_escapes_field_separators():
+    assert version_key('a.b$c%') == 'a%2Eb%24c%25'
+    assert '.' not in version_key('h5n1.x') and '$' not in version_key('$x')
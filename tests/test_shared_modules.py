@@ -0,0 +1,19 @@
+import os
+import shutil
+from scripts.check_shared_modules import ROOT, SHARED_MODULES, out_of_sync
+
+
+def test_copies_match_their_module():
+    assert out_of_sync() == []
+
+
+def test_edited_copy_is_reported(tmp_path):
+    for module, copies in SHARED_MODULES.items():
+        for path in [module] + copies:
+            os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(os.path.join(ROOT, path), tmp_path / path)
+    module, copies = next(iter(SHARED_MODULES.items()))
+    with open(tmp_path / copies[0], 'a') as file:
+        file.write('\n# local edit\n')
+
+    assert out_of_sync(root=str(tmp_path)) == [(module, copies[0])]